@@ -0,0 +1,451 @@
+# File name: ssit_bench_v1.py
+#
+# Stage-level benchmark and golden-output check for Phase II (Robust) v2.
+#
+# For every size the Phase II stages are timed one by one in a fresh child
+# process, with the engine's own functions and in the order run_in_memory
+# uses them:
+#
+#   spf_sieve, lane_depth_sweep (lane_depth_per_n with --per_n 1),
+#   hs_i_counts, curvature, quantiles, sketch_merge, classify, ido,
+#   csv_write, hashing, guard_summary, plot_ingest
+#
+# Each stage records wall seconds, throughput (n/sec) and the process peak
+# RSS after the stage (a high-water mark, so it never drops between stages).
+# Then the real CLIs run end to end (engine, then guard summary) with their
+# wall time and peak RSS. --pipeline 1 adds an engine run with --pipeline 1
+# (and --pipeline_workers, default one per CPU) next to the sequential one
+# and prints its speedup; its report must match the reference as well.
+#
+# Golden checks: when outputs/ holds a committed reference run for a size
+# (200k, 1.5M), every key=value of its report except run_utc (parameters,
+# quantile thresholds, counts, scan_csv_sha256) must match both the stage
+# pipeline and the end-to-end report; the guard summary must match the
+# committed one line for line. sketch_merge folds the FINSET depths through
+# many small KLL chunk sketches (ssit_quantile_sketch_v1) and fails when the
+# merged sketch outgrows k * (log2(n / k) + 2) values, when the traced peak
+# memory of merging every chunk is more than twice that of merging a quarter
+# of them, or when a merged quantile's rank is off by more than the bound.
+#
+# Regression checks: --save_baseline writes the results; a later run with
+# --baseline fails when a stage is slower than baseline * (1 + tolerance)
+# (plus --min_slack seconds, so sub-second stages do not flap) or a peak RSS
+# grows beyond baseline * (1 + tolerance).
+#
+#   python scripts/ssit_bench_v1.py --save_baseline bench_baseline.json
+#   python scripts/ssit_bench_v1.py --baseline bench_baseline.json --tolerance 0.25
+#
+# Exit status is 1 on any golden mismatch or regression.
+
+import argparse
+import bisect
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPTS_DIR)
+REFERENCES = {
+    200000: os.path.join(REPO_DIR, "outputs", "ssit_out_phase2_robust_v2_200k"),
+    1500000: os.path.join(REPO_DIR, "outputs", "ssit_out_phase2_robust_v2_1M5"),
+}
+REPORT_NAME = "ssit_phase2_robust_v2_report.txt"
+SCAN_NAME = "ssit_phase2_robust_v2_scan.csv"
+GUARD_NAME = "ssit_guard_summary_v1.txt"
+DEFAULT_SIZES = "200000,1500000"
+
+# sketch_merge: KLL level capacity and values per chunk sketch.
+SKETCH_CHECK_K = 256
+SKETCH_CHECK_BLOCK = 4096
+
+# Engine CLI defaults; the committed reference runs use them too.
+PARAMS = {
+    "near_eps": 0.02,
+    "lane_stable": -0.3,
+    "lane_infty": -0.7,
+    "depth_infprox_quantile": 0.33,
+    "shock_quantile": 0.95,
+}
+
+# Field candidates exactly as ssit_plot_v4.main passes them to _csv_source.
+PLOT_KEYS = (
+    ["lane", "a", "a_n", "a(n)", "posture_lane", "lane_a"],
+    ["D_inf", "d_inf", "depth", "depth_inf", "Dinf", "D_inf(n)"],
+    ["zone", "stability_zone"],
+    ["guard", "guard_flag", "is_guard"],
+    ["K", "curvature", "kappa", "K(n)"],
+    ["ido_dominators", "ido", "ido_dom", "dominators"],
+)
+
+def _rss_mb(who):
+    if resource is None:
+        return None
+    kb = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        kb /= 1024.0
+    return round(kb / 1024.0, 1)
+
+def read_report(path: str) -> dict:
+    """key=value lines of a report (run_utc dropped)."""
+    out = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if "=" in line and not line.startswith("`") and not line.startswith("run_utc="):
+                key, value = line.split("=", 1)
+                out[key] = value
+    return out
+
+def _read_lines(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.rstrip("\r\n") for line in f]
+
+# ---------------------------------------------------------------------------
+# Stage pipeline (runs in a child process per size)
+# ---------------------------------------------------------------------------
+
+def run_stages(n_max: int, work_dir: str, per_n: bool) -> dict:
+    sys.path.insert(0, SCRIPTS_DIR)
+    import ssit_phase2_robust_v2 as engine
+
+    near_eps = PARAMS["near_eps"]
+    stages = []
+
+    def timed(name, fn):
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        stages.append({
+            "stage": name,
+            "seconds": round(dt, 4),
+            "n_per_sec": round((n_max - 1) / dt) if dt > 0 else None,
+            "rss_hwm_mb": _rss_mb(resource.RUSAGE_SELF) if resource is not None else None,
+        })
+        return result
+
+    spf = timed("spf_sieve", lambda: engine.spf_sieve_compact(n_max))
+    if per_n:
+        def per_n_loop():
+            for n in range(2, n_max + 1):
+                ds, L = engine.compute_ds_upto_sqrt(n, spf)
+                engine.lane_from_ds(ds)
+                engine.D_inf_from_ds(ds, L)
+        timed("lane_depth_per_n", per_n_loop)
+    del spf
+
+    st = engine.ScanState(2, max(0, n_max - 1))
+    st.dmin, st.lane, st.depth = timed("lane_depth_sweep", lambda: engine.divisor_sweep(2, n_max + 1))
+
+    def hs_i_counts():
+        st.fill_from_dmin()
+        return st.counts(near_eps)
+    inf_count, fin_count, nearinf_count, prime_proxy_count = timed("hs_i_counts", hs_i_counts)
+
+    timed("curvature", st.fill_curvature)
+
+    def quantiles():
+        fin_idx, fin_lanes, fin_depths = st.finset()
+        q33, q66, depth_infprox = engine.exact_quantiles(fin_depths, [0.33, 0.66, PARAMS["depth_infprox_quantile"]])
+        (Kq,) = engine.exact_quantiles(st.finite_K(), [PARAMS["shock_quantile"]])
+        return fin_idx, fin_lanes, fin_depths, q33, q66, depth_infprox, Kq
+    fin_idx, fin_lanes, fin_depths, q33, q66, depth_infprox, Kq = timed("quantiles", quantiles)
+
+    def sketch_merge():
+        import ssit_quantile_sketch_v1 as sketch
+
+        def chunks(stop):
+            for lo in range(0, stop, SKETCH_CHECK_BLOCK):
+                sk = sketch.KLLSketch(SKETCH_CHECK_K)
+                sk.update(fin_depths[lo:min(lo + SKETCH_CHECK_BLOCK, stop)])
+                yield sk
+
+        def traced_merge(stop):
+            tracemalloc.start()
+            merged = sketch.KLLSketch.merged(chunks(stop), SKETCH_CHECK_K)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return merged, peak
+
+        problems = []
+        total = len(fin_depths)
+        _part, part_peak = traced_merge(total // 4)
+        merged, peak = traced_merge(total)
+        bound = SKETCH_CHECK_K * (math.log2(max(2, total / SKETCH_CHECK_K)) + 2)
+        if merged.size() > bound:
+            problems.append(f"sketch_merge: size {merged.size()} > {bound:.0f} after {-(-total // SKETCH_CHECK_BLOCK)} chunks")
+        if peak > 2 * part_peak:
+            problems.append(f"sketch_merge: peak {peak} B merging all chunks > 2 x {part_peak} B for a quarter of them")
+        ordered = sorted(fin_depths)
+        for q in (0.33, 0.66, 0.95):
+            k = engine.quantile_floor_index(total, q)
+            v = merged.kth(k)
+            lo, hi = bisect.bisect_left(ordered, v), bisect.bisect_right(ordered, v) - 1
+            if k < lo - merged.error or k > hi + merged.error:
+                problems.append(f"sketch_merge: q={q} value {v!r} has ranks {lo}..{hi}, k={k} error={merged.error}")
+        return problems
+    sketch_problems = timed("sketch_merge", sketch_merge)
+
+    timed("classify", lambda: st.classify(q33, q66, PARAMS["lane_stable"], PARAMS["lane_infty"], depth_infprox, Kq))
+    timed("ido", lambda: st.set_ido(fin_idx, engine.ido_dominator_counts(fin_lanes, fin_depths)))
+    del fin_idx, fin_lanes, fin_depths
+
+    scan_csv = os.path.join(work_dir, SCAN_NAME)
+
+    def csv_write():
+        out = engine.ScanWriter(scan_csv)
+        out.write_header(engine.header_line(near_eps))
+        for n_first, n_last, text, _rows in st.render(near_eps):
+            out.write_rows(n_first, n_last, text)
+        return out.close()
+    streamed_sha = timed("csv_write", csv_write)
+    del st
+
+    scan_sha = timed("hashing", lambda: engine.sha256_file(scan_csv))
+
+    import ssit_guard_summary_v1 as guard
+
+    def guard_summary():
+        workers = os.cpu_count() or 1
+        if workers > 1:
+            return guard.tally_csv_parallel(scan_csv, 50, workers)[0]
+        tally = guard.GuardTally(50)
+        for row in guard.iter_csv_rows(scan_csv):
+            tally.add(*row)
+        return tally
+    tally = timed("guard_summary", guard_summary)
+
+    import ssit_plot_v4 as plot
+
+    def plot_ingest():
+        _fields, records = plot._csv_source(scan_csv, *PLOT_KEYS)
+        rows = 0
+        for _ in records:
+            rows += 1
+        return rows
+    timed("plot_ingest", plot_ingest)
+
+    values = {
+        "n_max": str(n_max),
+        "near_eps": str(near_eps),
+        "lane_stable": str(PARAMS["lane_stable"]),
+        "lane_infty": str(PARAMS["lane_infty"]),
+        "depth_infprox_quantile": str(PARAMS["depth_infprox_quantile"]),
+        "depth_infprox_value": f"{depth_infprox:.12g}",
+        "shock_quantile": str(PARAMS["shock_quantile"]),
+        "shock_K_threshold": f"{Kq:.12g}",
+        "INFSET_count": str(inf_count),
+        "FINSET_count": str(fin_count),
+        "NearInf_FINSET_count": str(nearinf_count),
+        "prime_proxy_count": str(prime_proxy_count),
+        "scan_csv_sha256": scan_sha,
+        "guard_flag_count": str(tally.guard_count),
+        "shock_flag_count": str(tally.shock_count),
+    }
+    return {"stages": stages, "values": values, "streamed_sha_matches": streamed_sha == scan_sha, "sketch_problems": sketch_problems}
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def _run_child(cmd, log_path: str):
+    """Wall seconds and peak RSS (MB, from os.wait4 where available) of one command."""
+    t0 = time.perf_counter()
+    rss = None
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            _pid, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            kb = usage.ru_maxrss / (1024.0 if sys.platform == "darwin" else 1.0)
+            rss = round(kb / 1024.0, 1)
+        else:
+            proc.wait()
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        with open(log_path, "r", encoding="utf-8") as log:
+            sys.stderr.write(log.read())
+        raise SystemExit(f"command failed ({proc.returncode}): {' '.join(cmd)}")
+    return wall, rss
+
+def _check_engine_report(result, ref, run_dir: str, label: str) -> None:
+    got = read_report(os.path.join(run_dir, REPORT_NAME))
+    for key, value in ref.items():
+        if got.get(key) != value:
+            result["golden"].append(f"{label}: {key}={got.get(key)} (reference {value})")
+
+def bench_size(n_max: int, out_dir: str, per_n: bool, end_to_end: bool, pipeline_workers=None) -> dict:
+    work_dir = os.path.join(out_dir, f"n{n_max}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    child_json = os.path.join(work_dir, "stages.json")
+
+    cmd = [sys.executable, os.path.abspath(__file__), "--_stages", str(n_max), "--_work_dir", work_dir, "--_json", child_json]
+    if per_n:
+        cmd.append("--per_n=1")
+    _run_child(cmd, os.path.join(work_dir, "stages.log"))
+    with open(child_json, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    result["n_max"] = n_max
+    result["golden"] = []
+    result["end_to_end"] = []
+
+    ref_dir = REFERENCES.get(n_max)
+    ref = read_report(os.path.join(ref_dir, REPORT_NAME)) if ref_dir else None
+    if ref is not None:
+        expected = dict(ref)
+        ref_guard = os.path.join(ref_dir, GUARD_NAME)
+        if os.path.isfile(ref_guard):
+            counts = read_report(ref_guard)
+            expected.update({k: counts[k] for k in ("guard_flag_count", "shock_flag_count") if k in counts})
+        for key, value in result["values"].items():
+            if key in expected and expected[key] != value:
+                result["golden"].append(f"stages: {key}={value} (reference {expected[key]})")
+    if not result.pop("streamed_sha_matches"):
+        result["golden"].append("stages: streamed scan digest differs from sha256_file")
+    result["golden"] += result.pop("sketch_problems")
+    os.remove(os.path.join(work_dir, SCAN_NAME))
+
+    if end_to_end:
+        run_dir = os.path.join(work_dir, "engine")
+        cmd = [sys.executable, os.path.join(SCRIPTS_DIR, "ssit_phase2_robust_v2.py"), "--n_max", str(n_max), "--out_dir", run_dir]
+        for key, value in PARAMS.items():
+            cmd += [f"--{key}", str(value)]
+        wall, rss = _run_child(cmd, os.path.join(work_dir, "engine.log"))
+        result["end_to_end"].append({"stage": "engine_cli", "seconds": round(wall, 3), "n_per_sec": round((n_max - 1) / wall), "rss_peak_mb": rss})
+        if ref is not None:
+            _check_engine_report(result, ref, run_dir, "engine report")
+
+        if pipeline_workers is not None:
+            pipe_dir = os.path.join(work_dir, "engine_pipeline")
+            pipe_cmd = cmd[:cmd.index("--out_dir")] + ["--out_dir", pipe_dir] + cmd[cmd.index("--out_dir") + 2:]
+            pipe_cmd += ["--pipeline", "1", "--pipeline_workers", str(pipeline_workers)]
+            pipe_wall, rss = _run_child(pipe_cmd, os.path.join(work_dir, "engine_pipeline.log"))
+            result["end_to_end"].append({
+                "stage": "engine_cli_pipeline",
+                "seconds": round(pipe_wall, 3),
+                "n_per_sec": round((n_max - 1) / pipe_wall),
+                "rss_peak_mb": rss,
+                "speedup": round(wall / pipe_wall, 3),
+                "pipeline_workers": pipeline_workers,
+            })
+            if ref is not None:
+                _check_engine_report(result, ref, pipe_dir, "pipelined engine report")
+            if read_report(os.path.join(pipe_dir, REPORT_NAME)).get("scan_csv_sha256") != read_report(os.path.join(run_dir, REPORT_NAME)).get("scan_csv_sha256"):
+                result["golden"].append("pipelined engine: scan_csv_sha256 differs from the sequential run")
+            shutil.rmtree(pipe_dir, ignore_errors=True)
+
+        summary = os.path.join(work_dir, GUARD_NAME)
+        cmd = [sys.executable, os.path.join(SCRIPTS_DIR, "ssit_guard_summary_v1.py"),
+               "--scan_csv", os.path.join(run_dir, SCAN_NAME), "--out_report", summary]
+        wall, rss = _run_child(cmd, os.path.join(work_dir, "guard_summary.log"))
+        result["end_to_end"].append({"stage": "guard_summary_cli", "seconds": round(wall, 3), "n_per_sec": round((n_max - 1) / wall), "rss_peak_mb": rss})
+        ref_summary = os.path.join(ref_dir, GUARD_NAME) if ref_dir else ""
+        if ref_summary and os.path.isfile(ref_summary) and _read_lines(summary) != _read_lines(ref_summary):
+            result["golden"].append(f"guard summary differs from {os.path.relpath(ref_summary, REPO_DIR)}")
+        result["reference"] = os.path.relpath(ref_dir, REPO_DIR) if ref_dir else None
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return result
+
+def compare_baseline(results, baseline, tolerance: float, min_slack: float):
+    problems = []
+    by_size = {str(r["n_max"]): r for r in baseline.get("results", [])}
+    for r in results:
+        old = by_size.get(str(r["n_max"]))
+        if old is None:
+            continue
+        old_rows = {s["stage"]: s for s in old["stages"] + old.get("end_to_end", [])}
+        for s in r["stages"] + r["end_to_end"]:
+            o = old_rows.get(s["stage"])
+            if o is None:
+                continue
+            limit = o["seconds"] * (1.0 + tolerance) + min_slack
+            if s["seconds"] > limit:
+                problems.append(f"n_max={r['n_max']} {s['stage']}: {s['seconds']:.3f}s > {limit:.3f}s (baseline {o['seconds']:.3f}s)")
+            for key in ("rss_hwm_mb", "rss_peak_mb"):
+                if s.get(key) and o.get(key) and s[key] > o[key] * (1.0 + tolerance):
+                    problems.append(f"n_max={r['n_max']} {s['stage']}: {key}={s[key]} > baseline {o[key]} * {1.0 + tolerance:g}")
+    return problems
+
+def print_result(r) -> None:
+    print(f"n_max={r['n_max']}")
+    print(f"  {'stage':<20} {'seconds':>9} {'n/sec':>12} {'rss_mb':>8}")
+    for s in r["stages"] + r["end_to_end"]:
+        rss = s.get("rss_hwm_mb") or s.get("rss_peak_mb")
+        speedup = f"  x{s['speedup']:.2f} vs engine_cli" if "speedup" in s else ""
+        print(f"  {s['stage']:<20} {s['seconds']:>9.3f} {s['n_per_sec'] or 0:>12,} {rss if rss is not None else '-':>8}{speedup}")
+    if r.get("reference"):
+        print(f"  golden: {r['reference']} -> {'OK' if not r['golden'] else 'FAIL'}")
+    for line in r["golden"]:
+        print(f"  GOLDEN MISMATCH {line}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=str, default=DEFAULT_SIZES, help="comma-separated n_max values")
+    ap.add_argument("--out_dir", type=str, default="ssit_bench_out", help="scratch space for the scans, and the results JSON")
+    ap.add_argument("--per_n", type=int, default=0, help="1 = also time the per-n SPF lane/depth loop (slow)")
+    ap.add_argument("--end_to_end", type=int, default=1, help="1 = run the engine and guard summary CLIs and check their reports")
+    ap.add_argument("--pipeline", type=int, default=0, help="1 = also time the engine CLI with --pipeline 1 against the sequential run")
+    ap.add_argument("--pipeline_workers", type=int, default=-1, help="--pipeline_workers for that run (default: os.cpu_count(), 0 on one CPU)")
+    ap.add_argument("--baseline", type=str, default="", help="results JSON of an earlier run to check regressions against")
+    ap.add_argument("--save_baseline", type=str, default="", help="also write the results JSON here")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown / RSS growth")
+    ap.add_argument("--min_slack", type=float, default=0.05, help="absolute seconds added to every time limit")
+    ap.add_argument("--_stages", type=int, default=0, help=argparse.SUPPRESS)
+    ap.add_argument("--_work_dir", type=str, default="", help=argparse.SUPPRESS)
+    ap.add_argument("--_json", type=str, default="", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args._stages:
+        result = run_stages(int(args._stages), args._work_dir, bool(args.per_n))
+        with open(args._json, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    pipeline_workers = None
+    if int(args.pipeline):
+        cpus = os.cpu_count() or 1
+        pipeline_workers = int(args.pipeline_workers) if int(args.pipeline_workers) >= 0 else (cpus if cpus > 1 else 0)
+    results = []
+    for n_max in sizes:
+        r = bench_size(n_max, args.out_dir, bool(args.per_n), bool(args.end_to_end), pipeline_workers)
+        print_result(r)
+        results.append(r)
+
+    doc = {
+        "format": "ssit-bench-v1",
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    path = os.path.join(args.out_dir, "ssit_bench_v1.json")
+    for p in [path] + ([args.save_baseline] if args.save_baseline else []):
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=1)
+            f.write("\n")
+    print(f"results={path}")
+
+    failed = any(r["golden"] for r in results)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = compare_baseline(results, json.load(f), float(args.tolerance), float(args.min_slack))
+        for line in problems:
+            print(f"REGRESSION {line}")
+        failed = failed or bool(problems)
+    print("RESULT=" + ("FAIL" if failed else "OK"))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# File name: ssit_columns_v1.py
+#
+# Columnar companion to the Phase II scan CSV.
+#
+# One `.npy` file per CSV column plus a `manifest.json` schema. The values are
+# the CSV cells themselves (floats are the 12-significant-digit cells parsed
+# back to float64), so any consumer reading the columns reproduces exactly
+# what it would compute from the CSV. The CSV stays the audit artifact; the
+# columns are the fast path. Standard library only: `.npy` files are written
+# by hand, and read back through `mmap` (or `numpy.load(mmap_mode="r")` by
+# callers that have NumPy).
+#
+# Empty cells: float columns store NaN, integer columns store MISSING_U32.
+# Each manifest column records its sentinel under "missing" ("nan", the
+# integer, or null for columns that are never empty).
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+COLUMNS_DIRNAME = "ssit_phase2_robust_v2_columns"
+MANIFEST_NAME = "manifest.json"
+FORMAT = "ssit-columns-v1"
+
+SET_TYPES = ["FINSET", "INFSET"]
+SIS_BANDS = ["", "THIN", "MEDIUM", "THICK"]
+ZONES = ["INFSET", "INFINITY_PROXIMAL", "TRANSITIONAL", "STABLE_FINITE"]
+MISSING_U32 = 0xFFFFFFFF
+MISSING_FLOAT = "nan"
+
+def _uint32_typecode() -> str:
+    for tc in ("I", "L"):
+        if array(tc).itemsize == 4:
+            return tc
+    raise RuntimeError("no 4-byte unsigned array typecode on this platform")
+
+UINT32 = _uint32_typecode()
+
+# (file stem, array typecode, npy descr, kind, categories) in CSV column order.
+# kinds: int, u32_or_empty (empty cell -> MISSING_U32), float (empty -> NaN,
+# "INF" -> inf), flag (0/1), category (index into categories).
+SCHEMA = [
+    ("n", "q", "<i8", "int", None),
+    ("set_type", "B", "|u1", "category", SET_TYPES),
+    ("d_min", UINT32, "<u4", "u32_or_empty", None),
+    ("H_s", "d", "<f8", "float", None),
+    ("I", "d", "<f8", "float", None),
+    ("I_is_inf", "B", "|u1", "flag", None),
+    ("prime_proxy", "B", "|u1", "flag", None),
+    ("in_NearInf", "B", "|u1", "flag", None),
+    ("lane_a", "d", "<f8", "float", None),
+    ("D_inf", "d", "<f8", "float", None),
+    ("SIS", "B", "|u1", "category", SIS_BANDS),
+    ("d2I", "d", "<f8", "float", None),
+    ("K", "d", "<f8", "float", None),
+    ("zone", "B", "|u1", "category", ZONES),
+    ("shock_flag", "B", "|u1", "flag", None),
+    ("guard_flag", "B", "|u1", "flag", None),
+    ("ido_dominators", UINT32, "<u4", "u32_or_empty", None),
+]
+
+def missing_value(kind: str):
+    """Manifest "missing" entry: what an empty CSV cell is stored as."""
+    if kind == "u32_or_empty":
+        return MISSING_U32
+    if kind == "float":
+        return MISSING_FLOAT
+    return None
+
+def _npy_header(descr: str, n_rows: int) -> bytes:
+    d = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, n_rows)
+    pad = -(10 + len(d) + 1) % 64
+    d = d + " " * pad + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(d)) + d.encode("latin1")
+
+def _parse_float_cell(cell) -> float:
+    if cell == "":
+        return float("nan")
+    if cell == "INF":
+        return float("inf")
+    return float(cell)
+
+def encode_rows(rows):
+    """Encode scan rows (cell lists as written to the CSV) into typed arrays."""
+    block = {}
+    cat_index = {}
+    for i, (stem, tc, _descr, kind, cats) in enumerate(SCHEMA):
+        cells = [r[i] for r in rows]
+        if kind == "float":
+            block[stem] = array(tc, [_parse_float_cell(c) for c in cells])
+        elif kind == "category":
+            idx = cat_index.setdefault(stem, {c: k for k, c in enumerate(cats)})
+            block[stem] = array(tc, [idx[c] for c in cells])
+        elif kind == "u32_or_empty":
+            block[stem] = array(tc, [MISSING_U32 if c == "" else int(c) for c in cells])
+        else:
+            block[stem] = array(tc, [int(c) for c in cells])
+    return block
+
+class ColumnWriter:
+    """Streams encoded row blocks into per-column `.npy` files."""
+
+    def __init__(self, out_dir: str, n_rows: int, csv_header):
+        self.out_dir = out_dir
+        self.n_rows = n_rows
+        self.csv_header = list(csv_header)
+        self.written = 0
+        os.makedirs(out_dir, exist_ok=True)
+        self._files = {}
+        for stem, _tc, descr, _kind, _cats in SCHEMA:
+            f = open(os.path.join(out_dir, stem + ".npy"), "wb")
+            f.write(_npy_header(descr, n_rows))
+            self._files[stem] = f
+
+    def append(self, block: dict) -> None:
+        for stem, _tc, _descr, _kind, _cats in SCHEMA:
+            arr = block[stem]
+            if sys.byteorder != "little" and arr.itemsize > 1:
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            arr.tofile(self._files[stem])
+        self.written += len(block["n"])
+
+    def close(self, extra: dict) -> str:
+        for f in self._files.values():
+            f.close()
+        if self.written != self.n_rows:
+            raise RuntimeError(f"columnar output has {self.written} rows, expected {self.n_rows}")
+        manifest = {
+            "format": FORMAT,
+            "rows": self.n_rows,
+            "columns": [
+                {
+                    "name": self.csv_header[i],
+                    "file": stem + ".npy",
+                    "dtype": descr,
+                    "kind": kind,
+                    "categories": cats,
+                    "missing": missing_value(kind),
+                }
+                for i, (stem, _tc, descr, kind, cats) in enumerate(SCHEMA)
+            ],
+        }
+        manifest.update(extra)
+        path = os.path.join(self.out_dir, MANIFEST_NAME)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return path
+
+def read_manifest(columns_dir: str) -> dict:
+    with open(os.path.join(columns_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT:
+        raise SystemExit(f"{columns_dir}: not an {FORMAT} directory")
+    return manifest
+
+def find_column(manifest: dict, name: str):
+    """Column entry by CSV header name or by file stem."""
+    for c in manifest["columns"]:
+        if c["name"] == name or c["file"][:-4] == name:
+            return c
+    return None
+
+def _typecode_for(descr: str) -> str:
+    for _stem, tc, d, _kind, _cats in SCHEMA:
+        if d == descr:
+            return tc
+    raise SystemExit(f"unsupported column dtype {descr}")
+
+def load_column(columns_dir: str, manifest: dict, name: str):
+    """Memory-mapped column as a sequence of plain Python ints/floats.
+
+    Only the requested column file is opened; nothing else is read.
+    """
+    c = find_column(manifest, name)
+    if c is None:
+        raise SystemExit(f"column {name!r} not in {columns_dir}")
+    tc = _typecode_for(c["dtype"])
+    path = os.path.join(columns_dir, c["file"])
+    with open(path, "rb") as f:
+        head = f.read(10)
+        if head[:6] != b"\x93NUMPY":
+            raise SystemExit(f"{path}: not a .npy file")
+        offset = 10 + struct.unpack("<H", head[8:10])[0]
+        if sys.byteorder != "little" and array(tc).itemsize > 1:
+            f.seek(offset)
+            arr = array(tc)
+            arr.frombytes(f.read())
+            arr.byteswap()
+            return arr
+        if os.path.getsize(path) == offset:
+            return array(tc)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm)[offset:].cast(tc)
@@ -2,13 +2,29 @@
 
 import argparse
 import csv
+import gzip
 import hashlib
+import heapq
+import io
 import math
+import multiprocessing
 import os
 
+def open_scan(path: str):
+    """Binary stream of the plain scan CSV; `.gz` / `.zst` scans are decompressed on the fly."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit(f"{path}: reading .zst scans needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    return open(path, "rb")
+
 def sha256_file(path: str) -> str:
     h = hashlib.sha256()
-    with open(path, "rb") as f:
+    with open_scan(path) as f:
         for chunk in iter(lambda: f.read(1024 * 1024), b""):
             h.update(chunk)
     return h.hexdigest()
@@ -30,74 +46,216 @@ def to_int(s: str, default: int = 0) -> int:
         return default
     return int(t)
 
+FIELDS = ("n", "set_type", "zone", "guard_flag", "shock_flag", "lane_a", "D_inf", "ido_dominators", "K")
+
+def field_index(header):
+    pos = {name: i for i, name in enumerate(header)}
+    if "n" not in pos or "set_type" not in pos:
+        raise SystemExit("scan_csv has no n / set_type columns")
+    return tuple(pos.get(name) for name in FIELDS)
+
+def row_from_cells(cells, index):
+    i_n, i_set, i_zone, i_guard, i_shock, i_lane, i_depth, i_ido, i_K = index
+    ido = cells[i_ido] if i_ido is not None else ""
+    ido_v = None
+    if ido.strip() != "":
+        try:
+            ido_v = int(ido)
+        except Exception:
+            ido_v = None
+    return (
+        int(cells[i_n]),
+        cells[i_set],
+        cells[i_zone] if i_zone is not None else "",
+        to_int(cells[i_guard], 0) if i_guard is not None else 0,
+        to_int(cells[i_shock], 0) if i_shock is not None else 0,
+        to_float(cells[i_lane]) if i_lane is not None else None,
+        to_float(cells[i_depth]) if i_depth is not None else None,
+        ido_v,
+        to_float(cells[i_K]) if i_K is not None else None,
+    )
+
+def iter_csv_rows(scan_csv: str):
+    with io.TextIOWrapper(open_scan(scan_csv), encoding="utf-8", newline="") as f:
+        r = csv.reader(f)
+        index = field_index(next(r))
+        for cells in r:
+            yield row_from_cells(cells, index)
+
+def iter_column_rows(columns_dir: str):
+    # ssit_columns_v1 sits next to this script and is only needed for --scan_columns.
+    import ssit_columns_v1 as columnar
+
+    manifest = columnar.read_manifest(columns_dir)
+    col = lambda name: columnar.load_column(columns_dir, manifest, name)
+    set_types = columnar.find_column(manifest, "set_type")["categories"]
+    zones = columnar.find_column(manifest, "zone")["categories"]
+    ns = col("n")
+    set_codes = col("set_type")
+    zone_codes = col("zone")
+    guards = col("guard_flag")
+    shocks = col("shock_flag")
+    lanes = col("lane_a")
+    depths = col("D_inf")
+    idos = col("ido_dominators")
+    ido_missing = columnar.find_column(manifest, "ido_dominators")["missing"]
+    Ks = col("K")
+
+    def fin(x):
+        return None if (x != x or math.isinf(x)) else x
+
+    for i in range(len(ns)):
+        ido = idos[i]
+        yield (
+            ns[i],
+            set_types[set_codes[i]],
+            zones[zone_codes[i]],
+            guards[i],
+            shocks[i],
+            fin(lanes[i]),
+            fin(depths[i]),
+            None if ido == ido_missing else ido,
+            fin(Ks[i]),
+        )
+
+class GuardTally:
+    """Counters and bounded top-k rankings over scan rows.
+
+    Rankings are min-heaps of ``(value, n)`` holding at most ``top_k`` items,
+    so the kept set is exactly the head of a full descending sort (ties
+    broken by ``n``). Tallies of consecutive row ranges merge, in range
+    order, into the tally of the whole scan.
+    """
+
+    def __init__(self, top_k: int):
+        self.top_k = max(0, top_k)
+        self.zone_counts = {}
+        self.set_counts = {"INFSET": 0, "FINSET": 0}
+        self.guard_count = 0
+        self.shock_count = 0
+        self.top_ido = []
+        self.top_K = []
+        self.top_score = []
+        self.first_infprox = []
+
+    def _keep(self, heap, item) -> None:
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, item)
+        elif self.top_k and item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def add(self, n, set_type, zone, guard_flag, shock_flag, lane, depth, ido_v, K) -> None:
+        self.set_counts[set_type] = self.set_counts.get(set_type, 0) + 1
+        self.zone_counts[zone] = self.zone_counts.get(zone, 0) + 1
+        self.guard_count += 1 if guard_flag == 1 else 0
+        self.shock_count += 1 if shock_flag == 1 else 0
+
+        if set_type != "FINSET":
+            return
+
+        if ido_v is not None:
+            self._keep(self.top_ido, (ido_v, n))
+
+        if K is not None:
+            self._keep(self.top_K, (K, n))
+
+        if zone == "INFINITY_PROXIMAL" and len(self.first_infprox) < self.top_k:
+            self.first_infprox.append((n, lane, depth))
+
+        if lane is not None and depth is not None:
+            score = (-lane) * (1.0 - depth)
+            self._keep(self.top_score, (score, n))
+
+    def merge(self, other: "GuardTally") -> None:
+        """Fold in the tally of the row range that follows this one."""
+        for k, v in other.set_counts.items():
+            self.set_counts[k] = self.set_counts.get(k, 0) + v
+        for k, v in other.zone_counts.items():
+            self.zone_counts[k] = self.zone_counts.get(k, 0) + v
+        self.guard_count += other.guard_count
+        self.shock_count += other.shock_count
+        for mine, theirs in ((self.top_ido, other.top_ido), (self.top_K, other.top_K), (self.top_score, other.top_score)):
+            for item in theirs:
+                self._keep(mine, item)
+        self.first_infprox.extend(other.first_infprox[: self.top_k - len(self.first_infprox)])
+
+def tally_byte_range(task):
+    """Tally the rows that start inside ``[start, end)`` of a plain scan CSV."""
+    scan_csv, index, start, end, top_k = task
+    tally = GuardTally(top_k)
+    with open(scan_csv, "rb") as f:
+        f.seek(start - 1)
+        f.readline()
+        pos = f.tell()
+        for line in f:
+            if pos >= end:
+                break
+            pos += len(line)
+            tally.add(*row_from_cells(line.decode("utf-8").rstrip("\r\n").split(","), index))
+    return tally
+
+def tally_csv_parallel(scan_csv: str, top_k: int, workers: int):
+    """Tally a plain scan CSV on a process pool (byte-range chunks, merged in
+    file order); the flat SHA-256 is computed here meanwhile."""
+    with open(scan_csv, "rb") as f:
+        header = f.readline()
+    index = field_index(next(csv.reader([header.decode("utf-8")])))
+    body = len(header)
+    size = os.path.getsize(scan_csv)
+    parts = max(1, min(4 * workers, (size - body) // (1 << 20) + 1))
+    bounds = [body + (size - body) * i // parts for i in range(parts + 1)]
+    tasks = [(scan_csv, index, bounds[i], bounds[i + 1], top_k) for i in range(parts)]
+    tally = GuardTally(top_k)
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.imap(tally_byte_range, tasks)
+        scan_sha = sha256_file(scan_csv)
+        for part in results:
+            tally.merge(part)
+    return tally, scan_sha
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--scan_csv", type=str, required=True)
+    ap.add_argument("--scan_csv", type=str, default="")
+    ap.add_argument("--scan_columns", type=str, default="",
+                    help="columnar output dir from ssit_phase2_robust_v2.py --columnar 1 (read instead of the CSV)")
     ap.add_argument("--out_report", type=str, required=True)
     ap.add_argument("--top_k", type=int, default=50)
+    ap.add_argument("--workers", type=int, default=0,
+                    help="processes for a plain scan CSV (0 = all cores); compressed scans and columns are read in one pass")
     args = ap.parse_args()
 
+    if not args.scan_csv and not args.scan_columns:
+        ap.error("one of --scan_csv or --scan_columns is required")
+
     scan_csv = args.scan_csv
     out_report = args.out_report
     top_k = int(args.top_k)
 
-    zone_counts = {}
-    set_counts = {"INFSET": 0, "FINSET": 0}
-    guard_count = 0
-    shock_count = 0
-
-    top_ido = []
-    top_K = []
-    top_infprox = []
-    top_score = []
-
-    with open(scan_csv, "r", newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            n = int(row["n"])
-            set_type = row["set_type"]
-            zone = row.get("zone", "")
-            guard_flag = to_int(row.get("guard_flag", "0"), 0)
-            shock_flag = to_int(row.get("shock_flag", "0"), 0)
-
-            set_counts[set_type] = set_counts.get(set_type, 0) + 1
-            zone_counts[zone] = zone_counts.get(zone, 0) + 1
-            guard_count += 1 if guard_flag == 1 else 0
-            shock_count += 1 if shock_flag == 1 else 0
-
-            if set_type != "FINSET":
-                continue
-
-            lane = to_float(row.get("lane_a", ""))
-            depth = to_float(row.get("D_inf", ""))
-            ido = row.get("ido_dominators", "")
-            ido_v = None
-            if ido is not None and str(ido).strip() != "":
-                try:
-                    ido_v = int(ido)
-                except Exception:
-                    ido_v = None
-
-            K = to_float(row.get("K", ""))
-
-            if ido_v is not None:
-                top_ido.append((ido_v, n))
-
-            if K is not None:
-                top_K.append((K, n))
-
-            if zone == "INFINITY_PROXIMAL":
-                top_infprox.append((n, lane, depth))
-
-            if lane is not None and depth is not None:
-                score = (-lane) * (1.0 - depth)
-                top_score.append((score, n))
+    workers = int(args.workers) if int(args.workers) > 0 else (os.cpu_count() or 1)
+    plain = not (scan_csv.endswith(".gz") or scan_csv.endswith(".zst"))
 
-    top_ido.sort(reverse=True)
-    top_K.sort(reverse=True)
-    top_score.sort(reverse=True)
+    if args.scan_columns:
+        import ssit_columns_v1 as columnar
+        tally = GuardTally(top_k)
+        for row in iter_column_rows(args.scan_columns):
+            tally.add(*row)
+        scan_sha = columnar.read_manifest(args.scan_columns)["scan_csv_sha256"]
+    elif workers > 1 and plain:
+        tally, scan_sha = tally_csv_parallel(scan_csv, top_k, workers)
+    else:
+        tally = GuardTally(top_k)
+        for row in iter_csv_rows(scan_csv):
+            tally.add(*row)
+        scan_sha = sha256_file(scan_csv)
 
-    scan_sha = sha256_file(scan_csv)
+    set_counts = tally.set_counts
+    zone_counts = tally.zone_counts
+    guard_count = tally.guard_count
+    shock_count = tally.shock_count
+    top_ido = sorted(tally.top_ido, reverse=True)
+    top_K = sorted(tally.top_K, reverse=True)
+    top_score = sorted(tally.top_score, reverse=True)
+    top_infprox = tally.first_infprox
 
     os.makedirs(os.path.dirname(out_report) or ".", exist_ok=True)
     with open(out_report, "w", encoding="utf-8") as f:
@@ -0,0 +1,332 @@
+# File name: ssit_ido_index_v1.py
+#
+# Persistent dominance-count index over the FINSET (lane_a, D_inf) points of
+# a Phase II scan.
+#
+# The IDO count of a point (a, d) is the number of scanned FINSET objects o
+# with o.lane < a and o.depth <= d, the `ido_dominators` rule of
+# ssit_phase2_robust_v2.py. The index answers it for any (a, d), not only for
+# scanned points, e.g. for a new n profiled with ssit_infinity_ops_demo.py or
+# for what-if coordinates.
+#
+# Layout: a wavelet matrix. The points are sorted by lane, and each depth is
+# replaced by its rank among the distinct depths. The bits of these codes are
+# stored level by level (top bit first, each level stably partitioned by the
+# bit above it) with a cumulative popcount every 64 bits. A query bisects the
+# sorted lanes for the prefix with lane < a and the distinct depths for the
+# code bound of depth <= d, then counts the codes below that bound in the
+# prefix with one rank step per level: O(log N) per query, below the
+# O(log^2 N) of a merge-sort tree, in N * log2(distinct depths) bits plus the
+# rank directories. Batch queries walk all points down the levels at once.
+#
+# The file is a JSON header line followed by 8-byte aligned raw sections and
+# is opened through mmap, so a query only touches the pages it reads.
+#
+#   python scripts/ssit_phase2_robust_v2.py --n_max 1500000 --out_dir <out_dir> --ido_index 1
+#   python scripts/ssit_ido_index_v1.py --index <out_dir>/ssit_phase2_robust_v2_ido.index --point=-0.5,0.01
+#   python scripts/ssit_ido_index_v1.py --index <out_dir>/ssit_phase2_robust_v2_ido.index --points_file pairs.csv
+#   python scripts/ssit_ido_index_v1.py --index <out_dir>/ssit_phase2_robust_v2_ido.index --n 1000000000039 720720
+#
+# The engine builds the index from its full-precision lanes and depths.
+# --build_from_csv builds one from a scan CSV instead; its counts are then
+# over the 12-digit CSV values. Those (and query coordinates copied from the
+# CSV) can order differently from the full-precision values where lanes or
+# depths agree to 12 significant digits, so counts can differ from the
+# ido_dominators column there.
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional: pure-Python fallback
+    np = None
+
+FORMAT = "ssit-ido-index-v1"
+INDEX_NAME = "ssit_phase2_robust_v2_ido.index"
+ALIGN = 8
+
+def _uint32_typecode() -> str:
+    for tc in ("I", "L"):
+        if array(tc).itemsize == 4:
+            return tc
+    raise RuntimeError("no 4-byte unsigned array typecode on this platform")
+
+UINT32 = _uint32_typecode()
+
+def _popcount(words):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).astype(np.int64)
+    lut = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+    return lut[words.reshape(-1, 1).view(np.uint8)].sum(axis=1)
+
+def _level_np(bits):
+    """(uint64 words, uint32 cumulative ones before each word) of a 0/1 array;
+    one zero word is appended so rank(N) needs no bounds check."""
+    n = len(bits)
+    packed = np.packbits(bits.astype(np.uint8), bitorder="little")
+    words = np.zeros(n // 64 + 1, dtype=np.uint64)
+    words.view(np.uint8)[: len(packed)] = packed
+    ranks = np.zeros(len(words), dtype=np.uint32)
+    ranks[1:] = np.cumsum(_popcount(words[:-1]))
+    return words, ranks
+
+def _level_py(bits):
+    words = array("Q", bytes(8 * (len(bits) // 64 + 1)))
+    for i, b in enumerate(bits):
+        if b:
+            words[i >> 6] |= 1 << (i & 63)
+    ranks = array(UINT32, bytes(4 * len(words)))
+    total = 0
+    for w in range(len(words)):
+        ranks[w] = total
+        total += bin(words[w]).count("1")
+    return words, ranks
+
+def build_index(path: str, lanes, depths, source=None) -> dict:
+    """Write the index over parallel FINSET ``lanes`` / ``depths``; returns its header."""
+    if np is not None:
+        a = np.asarray(lanes, dtype=np.float64)
+        d = np.asarray(depths, dtype=np.float64)
+        order = np.lexsort((d, a))
+        lane_col = a[order]
+        distinct, codes = np.unique(d[order], return_inverse=True)
+        codes = codes.astype(np.int64)
+    else:
+        order = sorted(range(len(lanes)), key=lambda k: (lanes[k], depths[k]))
+        lane_col = array("d", (lanes[k] for k in order))
+        distinct = array("d", sorted(set(depths)))
+        rank = {v: i for i, v in enumerate(distinct)}
+        codes = [rank[depths[k]] for k in order]
+    n = len(lane_col)
+    nlevels = max(1, (len(distinct) - 1).bit_length())
+
+    sections = [("lanes", lane_col), ("depths", distinct)]
+    zeros = []
+    for level in range(nlevels - 1, -1, -1):
+        if np is not None:
+            bits = (codes >> level) & 1
+            words, ranks = _level_np(bits)
+            zeros.append(int(n - bits.sum()))
+            codes = np.concatenate((codes[bits == 0], codes[bits == 1]))
+        else:
+            bits = [(c >> level) & 1 for c in codes]
+            words, ranks = _level_py(bits)
+            zeros.append(n - sum(bits))
+            codes = [c for c, b in zip(codes, bits) if not b] + [c for c, b in zip(codes, bits) if b]
+        sections += [(f"words_{level}", words), (f"ranks_{level}", ranks)]
+
+    layout = {}
+    offset = 0
+    blobs = []
+    for name, col in sections:
+        data = col.tobytes()
+        layout[name] = [offset, len(data)]
+        pad = -len(data) % ALIGN
+        blobs.append(data + bytes(pad))
+        offset += len(data) + pad
+    header = {
+        "format": FORMAT,
+        "byteorder": sys.byteorder,
+        "points": n,
+        "distinct_depths": len(distinct),
+        "levels": nlevels,
+        "zeros": zeros,
+        "sections": layout,
+        "source": source or {},
+    }
+    text = json.dumps(header, sort_keys=True).encode("utf-8")
+    text += b" " * (-(len(text) + 1) % ALIGN) + b"\n"
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(text)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp, path)
+    return header
+
+class IdoIndex:
+    """Memory-mapped dominance-count index (see the file header)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        head = self._file.readline()
+        self.header = json.loads(head.decode("utf-8"))
+        if self.header.get("format") != FORMAT:
+            raise SystemExit(f"{path}: not an {FORMAT} index")
+        if self.header["byteorder"] != sys.byteorder:
+            raise SystemExit(f"{path}: written on a {self.header['byteorder']}-endian machine")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        base = len(head)
+        self.points = int(self.header["points"])
+        self.nlevels = int(self.header["levels"])
+        self.zeros = [int(z) for z in self.header["zeros"]]
+        views = {}
+        for name, (offset, length) in self.header["sections"].items():
+            views[name] = memoryview(self._mm)[base + offset: base + offset + length]
+        # Top level first, matching ``zeros``.
+        order = range(self.nlevels - 1, -1, -1)
+        # Scalar queries index memoryview casts (plain Python ints / floats);
+        # batch queries use NumPy views of the same pages.
+        self.lanes = views["lanes"].cast("d")
+        self.depths = views["depths"].cast("d")
+        self.words = [views[f"words_{lvl}"].cast("Q") for lvl in order]
+        self.ranks = [views[f"ranks_{lvl}"].cast(UINT32) for lvl in order]
+        self._np = None
+        if np is not None:
+            self._np = (
+                np.frombuffer(self.lanes, dtype=np.float64),
+                np.frombuffer(self.depths, dtype=np.float64),
+                [np.frombuffer(w, dtype=np.uint64) for w in self.words],
+                [np.frombuffer(r, dtype=np.uint32) for r in self.ranks],
+            )
+
+    def close(self) -> None:
+        self._np = None
+        for view in [self.lanes, self.depths] + self.words + self.ranks:
+            view.release()
+        self._mm.close()
+        self._file.close()
+
+    def _rank1(self, i: int, level: int) -> int:
+        w = self.words[level][i >> 6] & ((1 << (i & 63)) - 1)
+        return self.ranks[level][i >> 6] + bin(w).count("1")
+
+    def _count_below(self, p: int, c: int) -> int:
+        """Codes < c among the first p points (lane order)."""
+        if c >= 1 << self.nlevels:
+            return p
+        res = 0
+        s, e = 0, p
+        for i in range(self.nlevels):
+            bit = (c >> (self.nlevels - 1 - i)) & 1
+            r1s = self._rank1(s, i)
+            r1e = self._rank1(e, i)
+            if bit:
+                res += (e - r1e) - (s - r1s)
+                s = self.zeros[i] + r1s
+                e = self.zeros[i] + r1e
+            else:
+                s -= r1s
+                e -= r1e
+        return res
+
+    def count(self, lane: float, depth: float) -> int:
+        """FINSET objects o with o.lane < lane and o.depth <= depth."""
+        p = bisect.bisect_left(self.lanes, lane)
+        c = bisect.bisect_right(self.depths, depth)
+        return self._count_below(p, c)
+
+    def count_batch(self, lanes, depths):
+        """``count`` for parallel sequences of lanes / depths."""
+        if np is None:
+            return [self.count(a, d) for a, d in zip(lanes, depths)]
+        lane_col, depth_col, _words, _ranks = self._np
+        p = np.searchsorted(lane_col, np.asarray(lanes, dtype=np.float64), side="left").astype(np.int64)
+        c = np.searchsorted(depth_col, np.asarray(depths, dtype=np.float64), side="right").astype(np.int64)
+        res = np.zeros(len(p), dtype=np.int64)
+        s = np.zeros(len(p), dtype=np.int64)
+        e = p.copy()
+        for i in range(self.nlevels):
+            bit = ((c >> (self.nlevels - 1 - i)) & 1).astype(bool)
+            r1s = self._rank1_np(s, i)
+            r1e = self._rank1_np(e, i)
+            res += np.where(bit, (e - r1e) - (s - r1s), 0)
+            s = np.where(bit, self.zeros[i] + r1s, s - r1s)
+            e = np.where(bit, self.zeros[i] + r1e, e - r1e)
+        return np.where(c >= (1 << self.nlevels), p, res).tolist()
+
+    def _rank1_np(self, i, level: int):
+        _lanes, _depths, words, ranks = self._np
+        mask = (np.uint64(1) << (i & 63).astype(np.uint64)) - np.uint64(1)
+        return ranks[level][i >> 6].astype(np.int64) + _popcount(words[level][i >> 6] & mask)
+
+def _points_from_csv(scan_csv: str):
+    import csv
+    lanes = array("d")
+    depths = array("d")
+    with open(scan_csv, "r", encoding="utf-8", newline="") as f:
+        rows = csv.reader(f)
+        header = next(rows)
+        it, ia, idp = header.index("set_type"), header.index("lane_a"), header.index("D_inf")
+        for row in rows:
+            if row and row[it] == "FINSET":
+                lanes.append(float(row[ia]))
+                depths.append(float(row[idp]))
+    return lanes, depths
+
+def _read_points(path: str):
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line in f:
+            parts = line.replace(",", " ").split()
+            if len(parts) < 2:
+                continue
+            try:
+                yield float(parts[0]), float(parts[1])
+            except ValueError:
+                continue  # header line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def _print_counts(index: IdoIndex, batch) -> None:
+    counts = index.count_batch([a for a, _d in batch], [d for _a, d in batch])
+    for (a, d), c in zip(batch, counts):
+        print(f"{a!r},{d!r},{c}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", type=str, default="", help=f"index file (default: {INDEX_NAME} next to --build_from_csv)")
+    ap.add_argument("--build_from_csv", type=str, default="", help="build the index from a scan CSV (12-digit values)")
+    ap.add_argument("--point", type=str, action="append", default=[], help="LANE,DEPTH (repeatable; write --point=-0.5,0.01)")
+    ap.add_argument("--points_file", type=str, default="", help="file of 'lane,depth' lines, or - for stdin")
+    ap.add_argument("--n", type=int, nargs="*", default=[], help="profile these n (ssit_infinity_ops_demo.omega_profile) and query them")
+    ap.add_argument("--block", type=int, default=65536, help="points per batch query")
+    args = ap.parse_args()
+
+    path = args.index
+    if args.build_from_csv:
+        path = path or os.path.join(os.path.dirname(os.path.abspath(args.build_from_csv)), INDEX_NAME)
+        lanes, depths = _points_from_csv(args.build_from_csv)
+        header = build_index(path, lanes, depths, {"scan_csv": os.path.basename(args.build_from_csv), "values": "csv"})
+        print(f"index={path} points={header['points']} levels={header['levels']}", file=sys.stderr)
+    if not path:
+        raise SystemExit("--index or --build_from_csv is required")
+    index = IdoIndex(path)
+
+    if args.point or args.points_file:
+        print("lane_a,D_inf,ido_dominators")
+        batch = []
+        for text in args.point:
+            a, _, d = text.partition(",")
+            batch.append((float(a), float(d)))
+        source = _read_points(args.points_file) if args.points_file else ()
+        for pt in source:
+            batch.append(pt)
+            if len(batch) >= args.block:
+                _print_counts(index, batch)
+                batch = []
+        _print_counts(index, batch)
+
+    if args.n:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import ssit_infinity_ops_demo as demo
+        print("n,set_type,lane_a,D_inf,ido_dominators")
+        for n in args.n:
+            prof = demo.omega_profile(n)
+            if prof["set_type"] != "FINSET":
+                print(f"{n},{prof['set_type']},,,")
+                continue
+            a, d = prof["lane_a"], prof["D_inf"]
+            print(f"{n},FINSET,{a:.12g},{d:.12g},{index.count(a, d)}")
+    index.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,27 @@
 import argparse
 import math
+import sys
+from array import array
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import List, Tuple
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+
+import ssit_phase2_robust_v2 as engine
+
+try:
+    import numpy as np
+except ImportError:  # optional; OmegaArray falls back to array('d') columns
+    np = None
+
+DEFAULT_SPF_LIMIT = 10000000
+DEFAULT_MEMO_SIZE = 65536
+DEFAULT_BLOCK = 65536
+LANE_EPS = 1e-12
+FACTOR_CACHE_SIZE = 4096
+# Miller-Rabin with these bases is exact for n < 3.3e24.
+MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+TRIAL_PRIMES = tuple(p for p in range(2, 1000) if all(p % q for q in range(2, int(math.isqrt(p)) + 1)))
 
 
 def clamp_lane(a: float, eps: float = 1e-12) -> float:
@@ -82,7 +102,10 @@ def divisors_within_sqrt(n: int) -> List[int]:
 
 
 def R_full(n: int) -> float:
-    ds = divisors_within_sqrt(n)
+    return R_from_divisors(divisors_within_sqrt(n))
+
+
+def R_from_divisors(ds: List[int]) -> float:
     m = len(ds)
     if m < 2:
         return 0.0
@@ -92,12 +115,284 @@ def R_full(n: int) -> float:
     return s / float(m - 1)
 
 
+def is_prime(n: int) -> bool:
+    """Deterministic Miller-Rabin (exact below 3.3e24)."""
+    if n < 2:
+        return False
+    for p in MR_BASES:
+        if n % p == 0:
+            return n == p
+    d = n - 1
+    r = 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for a in MR_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(r - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _pollard_brent(n: int) -> int:
+    """A non-trivial factor of an odd composite n (Brent's variant of
+    Pollard's rho). The polynomial constants are tried in a fixed order, so
+    runs are reproducible."""
+    for c in range(1, n):
+        y, m, g, r, q = 2, 128, 1, 1, 1
+        x = ys = y
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = math.gcd(q, n)
+                k += m
+            r *= 2
+        if g == n:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = math.gcd(abs(x - ys), n)
+        if g != n:
+            return g
+    raise ValueError(f"no factor found for {n}")
+
+
+@lru_cache(maxsize=FACTOR_CACHE_SIZE)
+def factorize_large(n: int) -> Tuple[Tuple[int, int], ...]:
+    """Prime factorization ((p, e), ...) in increasing p, for any n >= 1:
+    trial division by the primes below 1000, then Miller-Rabin and
+    Pollard-Rho on what is left. Results are cached (LRU)."""
+    counts: Dict[int, int] = {}
+    for p in TRIAL_PRIMES:
+        if p * p > n:
+            break
+        while n % p == 0:
+            counts[p] = counts.get(p, 0) + 1
+            n //= p
+    stack = [n] if n > 1 else []
+    while stack:
+        m = stack.pop()
+        if is_prime(m):
+            counts[m] = counts.get(m, 0) + 1
+            continue
+        r = math.isqrt(m)
+        if r * r == m:
+            stack += [r, r]
+            continue
+        f = _pollard_brent(m)
+        stack += [f, m // f]
+    return tuple(sorted(counts.items()))
+
+
+def divisors_from_factorization(n: int) -> List[int]:
+    """Same list as divisors_within_sqrt(n), generated from the factorization."""
+    if n < 2:
+        return []
+    return engine.ds_from_factors(n, list(factorize_large(n)))[0]
+
+
+def omega_profile(n: int) -> Dict[str, object]:
+    """Phase II quantities of a single n of any size (up to ~1e24): the
+    scan's d_min, H_s, I, set type, lane and D_inf, plus the factorization.
+    SIS and zone need run-wide quantiles and are not included."""
+    fs = factorize_large(n) if n >= 1 else ()
+    ds, L = engine.ds_from_factors(n, list(fs)) if n >= 2 else ([], math.isqrt(max(n, 0)))
+    dmin = ds[0] if ds else None
+    Hs, I, is_inf, dmin, prime_proxy = engine.Hs_and_I_from_dmin(n, dmin)
+    return {
+        "n": n,
+        "factorization": "*".join(f"{p}^{e}" if e > 1 else str(p) for p, e in fs) or "1",
+        "set_type": "INFSET" if is_inf else "FINSET",
+        "d_min": dmin,
+        "H_s": Hs,
+        "I": I,
+        "prime_proxy": prime_proxy,
+        "lane_a": clamp_lane(2.0 * R_from_divisors(ds) - 1.0),
+        "D_inf": engine.D_inf_from_ds(ds, L),
+        "divisors_le_sqrt": len(ds),
+    }
+
+
 def Omega_v13(n: int) -> SymbolicInfinity:
     r = R_full(n)
     lane = clamp_lane(2.0 * r - 1.0)
     return SymbolicInfinity(+1, lane)
 
 
+class OmegaBatch:
+    """Omega_v13 for many n at once.
+
+    Divisors come from one shared smallest-prime-factor table (the Phase II
+    engine's compact sieve) instead of trial division per operand, and lanes
+    of repeated n are served from a bounded LRU memo. The divisor lists, and
+    so the lanes, are the same as R_full's; n above spf_limit are factorized
+    with factorize_large.
+    """
+
+    def __init__(self, spf_limit: int, memo_size: int = DEFAULT_MEMO_SIZE) -> None:
+        self.spf_limit = max(1, int(spf_limit))
+        self.spf = engine.spf_sieve_compact(self.spf_limit)
+        self.memo_size = max(0, int(memo_size))
+        self._memo: "OrderedDict[int, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_values(cls, ns: Iterable[int], spf_limit: int = DEFAULT_SPF_LIMIT,
+                   memo_size: int = DEFAULT_MEMO_SIZE) -> "OmegaBatch":
+        """Sized to the largest n, capped at spf_limit."""
+        return cls(min(max(ns, default=1), spf_limit), memo_size)
+
+    def reserve(self, n_max: int, cap: int = DEFAULT_SPF_LIMIT) -> None:
+        """Grow the SPF table (at least doubling, at most to cap) to cover n_max."""
+        if n_max <= self.spf_limit or self.spf_limit >= cap:
+            return
+        self.spf_limit = min(cap, max(n_max, 2 * self.spf_limit))
+        self.spf = engine.spf_sieve_compact(self.spf_limit)
+
+    def divisors(self, n: int) -> List[int]:
+        if n > self.spf_limit:
+            return divisors_from_factorization(n)
+        if n < 2:
+            return []
+        return engine.ds_from_factors(n, engine.factorize(n, self.spf))[0]
+
+    def lane(self, n: int) -> float:
+        memo = self._memo
+        a = memo.get(n)
+        if a is not None:
+            memo.move_to_end(n)
+            self.hits += 1
+            return a
+        self.misses += 1
+        a = clamp_lane(2.0 * R_from_divisors(self.divisors(n)) - 1.0)
+        if self.memo_size:
+            memo[n] = a
+            if len(memo) > self.memo_size:
+                memo.popitem(last=False)
+        return a
+
+    def lanes(self, ns: Iterable[int]) -> List[float]:
+        return [self.lane(n) for n in ns]
+
+    def omega(self, n: int) -> SymbolicInfinity:
+        return SymbolicInfinity(+1, self.lane(n))
+
+    def omegas(self, ns: Iterable[int]) -> List[SymbolicInfinity]:
+        return [self.omega(n) for n in ns]
+
+
+def _clamp_lanes(a):
+    if np is not None:
+        return np.where(a <= -1.0, -1.0 + LANE_EPS, np.where(a >= 1.0, 1.0 - LANE_EPS, a))
+    return array("d", [clamp_lane(x) for x in a])
+
+
+def _lane_separations(a1, a2):
+    if np is not None:
+        return _clamp_lanes(np.abs(a1 - a2))
+    return array("d", [clamp_lane(abs(x - y)) for x, y in zip(a1, a2)])
+
+
+def _lane_means(a1, a2):
+    if np is not None:
+        return _clamp_lanes(0.5 * (a1 + a2))
+    return array("d", [clamp_lane(0.5 * (x + y)) for x, y in zip(a1, a2)])
+
+
+def _lane_column(lanes):
+    if np is not None:
+        return np.asarray(lanes, dtype=np.float64)
+    return array("d", lanes)
+
+
+class ClassArray:
+    """Lane column of finite-class or zero-class results (OmegaArray / and -)."""
+
+    KINDS = {"finite": FiniteClass, "zero": ZeroClass}
+
+    def __init__(self, kind: str, lane) -> None:
+        if kind not in self.KINDS:
+            raise ValueError("kind must be 'finite' or 'zero'")
+        self.kind = kind
+        self.lane = lane
+
+    def __len__(self) -> int:
+        return len(self.lane)
+
+    def __getitem__(self, i: int):
+        return self.KINDS[self.kind](float(self.lane[i]))
+
+
+class OmegaArray:
+    """SymbolicInfinity values as sign and lane columns.
+
+    `/`, `-` and `+` work elementwise with the scalar semantics
+    (lane_separation, lane_mean, clamp_lane) and give bit-identical lanes,
+    without one object per value. Columns are NumPy arrays when NumPy is
+    installed, otherwise `array` columns with per-element loops.
+    """
+
+    def __init__(self, sign, lane) -> None:
+        if len(sign) != len(lane):
+            raise ValueError("sign and lane columns differ in length")
+        if np is not None:
+            sign = np.asarray(sign, dtype=np.int8)
+            if not np.all(np.abs(sign) == 1):
+                raise ValueError("sign must be -1 or +1")
+        else:
+            sign = array("b", sign)
+            if any(v not in (-1, +1) for v in sign):
+                raise ValueError("sign must be -1 or +1")
+        self.sign = sign
+        self.lane = _clamp_lanes(_lane_column(lane))
+
+    @classmethod
+    def from_lanes(cls, lanes, sign: int = +1) -> "OmegaArray":
+        lanes = _lane_column(lanes)
+        if np is not None:
+            return cls(np.full(len(lanes), sign, dtype=np.int8), lanes)
+        return cls(array("b", [sign]) * len(lanes), lanes)
+
+    def __len__(self) -> int:
+        return len(self.lane)
+
+    def __getitem__(self, i: int) -> SymbolicInfinity:
+        return SymbolicInfinity(int(self.sign[i]), float(self.lane[i]))
+
+    def _guard(self, other: object) -> "OmegaArray":
+        if not isinstance(other, OmegaArray):
+            raise TypeError("operation requires OmegaArray")
+        if len(other) != len(self):
+            raise ValueError("OmegaArray operands differ in length")
+        return other
+
+    def __truediv__(self, other: object) -> ClassArray:
+        o = self._guard(other)
+        return ClassArray("finite", _lane_separations(self.lane, o.lane))
+
+    def __add__(self, other: object) -> "OmegaArray":
+        o = self._guard(other)
+        return OmegaArray(self.sign, _lane_means(self.lane, o.lane))
+
+    def __sub__(self, other: object) -> ClassArray:
+        o = self._guard(other)
+        return ClassArray("zero", _lane_separations(self.lane, o.lane))
+
+
 def parse_pairs(pairs_s: str) -> List[Tuple[int, int]]:
     out: List[Tuple[int, int]] = []
     if not pairs_s.strip():
@@ -117,6 +412,45 @@ def parse_pairs(pairs_s: str) -> List[Tuple[int, int]]:
     return out
 
 
+def iter_pair_blocks(f: TextIO, block: int = DEFAULT_BLOCK) -> Iterator[List[Tuple[int, int]]]:
+    """Pairs from a stream ('a:b' separated by commas or whitespace), in blocks."""
+    out: List[Tuple[int, int]] = []
+    for line in f:
+        out.extend(parse_pairs(",".join(line.split())))
+        if len(out) >= block:
+            yield out
+            out = []
+    if out:
+        yield out
+
+
+def write_text(out: TextIO, xs: List[int], ys: List[int], ox: OmegaArray, oy: OmegaArray) -> None:
+    q = ox / oy
+    z = ox - oy
+    s = ox + oy
+    for i in range(len(xs)):
+        out.write(f"n1={xs[i]} Omega1={ox[i]}\n")
+        out.write(f"n2={ys[i]} Omega2={oy[i]}\n")
+        out.write(f"Omega1 / Omega2 = {q[i]}\n")
+        out.write(f"Omega1 - Omega2 = {z[i]}\n")
+        out.write(f"Omega1 + Omega2 = {s[i]}\n")
+        out.write("-" * 60 + "\n")
+
+
+def write_csv(out: TextIO, xs: List[int], ys: List[int], ox: OmegaArray, oy: OmegaArray) -> None:
+    q = (ox / oy).lane
+    z = (ox - oy).lane
+    s = (ox + oy).lane
+    a1 = ox.lane
+    a2 = oy.lane
+    if np is not None:
+        q, z, s, a1, a2 = q.tolist(), z.tolist(), s.tolist(), a1.tolist(), a2.tolist()
+    out.write("".join(
+        f"{xs[i]},{ys[i]},{a1[i]:.12g},{a2[i]:.12g},{q[i]:.12g},{z[i]:.12g},{s[i]:.12g}\n"
+        for i in range(len(xs))
+    ))
+
+
 def main() -> None:
     ap = argparse.ArgumentParser(prog="ssit_infinity_ops_demo.py")
     ap.add_argument(
@@ -125,26 +459,70 @@ def main() -> None:
         default="2310:30030,72:84,720:840,2310:97,30030:97,97:100,100:121",
         help="comma-separated pairs 'a:b,c:d,...'",
     )
+    ap.add_argument("--pairs_file", type=str, default="",
+                    help="stream pairs from a file ('-' = stdin) instead of --pairs; separated by commas or newlines")
+    ap.add_argument("--format", choices=["text", "csv"], default="text",
+                    help="csv: one line per pair n1,n2,a1,a2,div_lane,sub_lane,add_lane (no banner)")
+    ap.add_argument("--block", type=int, default=DEFAULT_BLOCK, help="pairs evaluated per OmegaArray block")
+    ap.add_argument("--engine", choices=["spf", "trial"], default="spf",
+                    help="spf: batch evaluation over a shared SPF table with an LRU memo; trial: trial division per operand")
+    ap.add_argument("--spf_limit", type=int, default=DEFAULT_SPF_LIMIT, help="largest n served from the SPF table")
+    ap.add_argument("--memo_size", type=int, default=DEFAULT_MEMO_SIZE, help="lanes kept in the LRU memo (0 = off)")
+    ap.add_argument("--n", type=str, default="",
+                    help="comma-separated n (any size up to ~1e24) to profile instead of running pairs: factorization, typing, lane, depth")
     args = ap.parse_args()
-    pairs = parse_pairs(args.pairs)
-
-    print("=== SSIT Infinity Ops Demo (v1.3 posture lane) ===")
-    print("Omega(n) := <+INF, lane=a(n)> where a(n)=clamp(2*R_full(n)-1)")
-    print("PDF-consistent ops:")
-    print("  Omega1 / Omega2 -> finite-class( abs(a1 - a2) )")
-    print("  Omega1 - Omega2 -> zero-class( abs(a1 - a2) )")
-    print("  Omega1 + Omega2 -> <+INF, lane=clamp((a1 + a2)/2)>")
-    print()
-
-    for x, y in pairs:
-        ox = Omega_v13(x)
-        oy = Omega_v13(y)
-        print(f"n1={x} Omega1={ox}")
-        print(f"n2={y} Omega2={oy}")
-        print(f"Omega1 / Omega2 = {ox / oy}")
-        print(f"Omega1 - Omega2 = {ox - oy}")
-        print(f"Omega1 + Omega2 = {ox + oy}")
-        print("-" * 60)
+
+    if args.n.strip():
+        for part in args.n.split(","):
+            if not part.strip():
+                continue
+            prof = omega_profile(int(part.strip()))
+            for key, value in prof.items():
+                print(f"{key}={engine.safe_float_str(value)}")
+            print(f"Omega={SymbolicInfinity(+1, prof['lane_a'])}")
+            print("-" * 60)
+        return
+
+    src = None
+    if args.pairs_file == "-":
+        blocks = iter_pair_blocks(sys.stdin, max(1, args.block))
+    elif args.pairs_file:
+        src = open(args.pairs_file, "r", encoding="utf-8")
+        blocks = iter_pair_blocks(src, max(1, args.block))
+    else:
+        blocks = iter([parse_pairs(args.pairs)])
+
+    batch = OmegaBatch(1, args.memo_size) if args.engine == "spf" else None
+    out = sys.stdout
+    if args.format == "text":
+        print("=== SSIT Infinity Ops Demo (v1.3 posture lane) ===")
+        print("Omega(n) := <+INF, lane=a(n)> where a(n)=clamp(2*R_full(n)-1)")
+        print("PDF-consistent ops:")
+        print("  Omega1 / Omega2 -> finite-class( abs(a1 - a2) )")
+        print("  Omega1 - Omega2 -> zero-class( abs(a1 - a2) )")
+        print("  Omega1 + Omega2 -> <+INF, lane=clamp((a1 + a2)/2)>")
+        print()
+    else:
+        out.write("n1,n2,a1,a2,div_lane,sub_lane,add_lane\n")
+
+    try:
+        for pairs in blocks:
+            xs = [x for x, _ in pairs]
+            ys = [y for _, y in pairs]
+            if batch is not None:
+                batch.reserve(max(max(xs), max(ys)), args.spf_limit)
+                ox = OmegaArray.from_lanes(batch.lanes(xs))
+                oy = OmegaArray.from_lanes(batch.lanes(ys))
+            else:
+                ox = OmegaArray.from_lanes([Omega_v13(x).lane for x in xs])
+                oy = OmegaArray.from_lanes([Omega_v13(y).lane for y in ys])
+            if args.format == "text":
+                write_text(out, xs, ys, ox, oy)
+            else:
+                write_csv(out, xs, ys, ox, oy)
+    finally:
+        if src is not None:
+            src.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,269 @@
+# File name: ssit_merkle_v1.py
+#
+# Chunked Merkle receipts for the Phase II scan CSV.
+#
+# The CSV is cut into leaves: one for the header line, then one per
+# LEAF_ROWS rows on a fixed n grid (n = 2 .. 2 + LEAF_ROWS - 1, ...). Each
+# leaf records its n range, byte offset / length in the uncompressed CSV and
+# the SHA-256 of its bytes. The root is a binary SHA-256 tree over the leaf
+# digests (leaf nodes prefixed 0x00, inner nodes 0x01, an odd node is carried
+# up unchanged), and is written to the run report next to the flat
+# `scan_csv_sha256`, which stays the primary receipt.
+#
+# Verify a whole scan on several cores, or only an n range:
+#
+#   python scripts/ssit_merkle_v1.py --scan_csv <out_dir>/ssit_phase2_robust_v2_scan.csv --workers 8
+#   python scripts/ssit_merkle_v1.py --scan_csv <out_dir>/ssit_phase2_robust_v2_scan.csv --n_range 500000:600000
+#
+# Plain CSVs are read with seeks, so a range check only touches its leaves.
+# Compressed scans (.gz / .zst) cannot seek and are checked in one pass.
+
+import argparse
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+
+FORMAT = "ssit-merkle-v1"
+LEAF_ROWS = 65536
+N_START = 2
+REPORT_NAME = "ssit_phase2_robust_v2_report.txt"
+ROOT_KEY = "scan_csv_merkle_root"
+
+def manifest_path(scan_csv: str) -> str:
+    base = scan_csv
+    for suffix in (".gz", ".zst"):
+        if base.endswith(suffix):
+            base = base[: -len(suffix)]
+    if base.endswith(".csv"):
+        base = base[:-4]
+    return base + ".merkle.json"
+
+def _leaf_node(digest: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + digest).digest()
+
+def _inner_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def merkle_root(leaf_digests) -> str:
+    """Root over hex leaf digests, in leaf order."""
+    level = [_leaf_node(bytes.fromhex(d)) for d in leaf_digests]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        nxt = [_inner_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        level = nxt
+    return level[0].hex()
+
+class LeafHasher:
+    """Cuts the header and row-block writes of a scan CSV into leaves.
+
+    Row blocks must not straddle a leaf boundary; the scan writer renders
+    its blocks on the same n grid.
+    """
+
+    def __init__(self, rows_per_leaf: int = LEAF_ROWS):
+        self.rows_per_leaf = rows_per_leaf
+        self.leaves = []
+        self.offset = 0
+        self._cur = None
+
+    def _close_leaf(self) -> None:
+        if self._cur is not None:
+            leaf, h = self._cur
+            leaf["sha256"] = h.hexdigest()
+            self.leaves.append(leaf)
+            self._cur = None
+
+    def header(self, data: bytes) -> None:
+        self._close_leaf()
+        self.leaves.append({
+            "n_first": None,
+            "n_last": None,
+            "offset": self.offset,
+            "length": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        })
+        self.offset += len(data)
+
+    def rows(self, data: bytes, n_first: int, n_last: int) -> None:
+        idx = (n_first - N_START) // self.rows_per_leaf
+        if (n_last - N_START) // self.rows_per_leaf != idx:
+            raise ValueError(f"row block n={n_first}..{n_last} crosses a Merkle leaf boundary")
+        if self._cur is None or self._cur[0]["index"] != idx:
+            self._close_leaf()
+            self._cur = ({"index": idx, "n_first": n_first, "n_last": n_last, "offset": self.offset, "length": 0}, hashlib.sha256())
+        leaf, h = self._cur
+        h.update(data)
+        leaf["n_last"] = n_last
+        leaf["length"] += len(data)
+        self.offset += len(data)
+
+    def finish(self):
+        self._close_leaf()
+        for leaf in self.leaves:
+            leaf.pop("index", None)
+        return self.leaves
+
+def write_manifest(path: str, leaves, rows_per_leaf: int, extra: dict) -> str:
+    root = merkle_root([leaf["sha256"] for leaf in leaves])
+    manifest = {
+        "format": FORMAT,
+        "hash": "sha256",
+        "rows_per_leaf": rows_per_leaf,
+        "n_start": N_START,
+        "root": root,
+        "leaves": leaves,
+    }
+    manifest.update(extra)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.write("\n")
+    return root
+
+def read_manifest(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT:
+        raise SystemExit(f"{path}: not an {FORMAT} manifest")
+    return manifest
+
+def report_root(report_path: str):
+    """`scan_csv_merkle_root` recorded in a run report, or None."""
+    if not os.path.isfile(report_path):
+        return None
+    with open(report_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(ROOT_KEY + "="):
+                return line.strip().split("=", 1)[1]
+    return None
+
+def _check_leaf(task):
+    path, i, offset, length, expected = task
+    with open(path, "rb") as f:
+        f.seek(offset)
+        h = hashlib.sha256()
+        left = length
+        while left > 0:
+            data = f.read(min(left, 1 << 20))
+            if not data:
+                break
+            h.update(data)
+            left -= len(data)
+    return i, left == 0 and h.hexdigest() == expected
+
+def _open_stream(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit(f"{path}: reading .zst scans needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    return None
+
+def _read_exact(stream, length: int) -> bytes:
+    parts = []
+    while length > 0:
+        data = stream.read(min(length, 1 << 20))
+        if not data:
+            break
+        parts.append(data)
+        length -= len(data)
+    return b"".join(parts)
+
+def _in_range(leaf, n_range) -> bool:
+    if n_range is None:
+        return True
+    if leaf["n_first"] is None:
+        return False
+    return leaf["n_first"] <= n_range[1] and leaf["n_last"] >= n_range[0]
+
+def verify(scan_csv: str, manifest: dict, workers: int = 1, n_range=None):
+    """Leaf indices that were checked, and the subset that failed."""
+    leaves = manifest["leaves"]
+    todo = [i for i, leaf in enumerate(leaves) if _in_range(leaf, n_range)]
+    stream = _open_stream(scan_csv)
+    bad = []
+    if stream is None:
+        if n_range is None and os.path.getsize(scan_csv) != sum(leaf["length"] for leaf in leaves):
+            bad.append(-1)
+        tasks = [(scan_csv, i, leaves[i]["offset"], leaves[i]["length"], leaves[i]["sha256"]) for i in todo]
+        if workers > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(workers) as pool:
+                results = pool.map(_check_leaf, tasks, chunksize=max(1, len(tasks) // (4 * workers)))
+        else:
+            results = [_check_leaf(t) for t in tasks]
+        bad += [i for i, ok in results if not ok]
+        return todo, bad
+
+    wanted = set(todo)
+    last = max(todo, default=-1) if n_range is not None else len(leaves) - 1
+    with stream:
+        for i, leaf in enumerate(leaves):
+            if i > last:
+                break
+            data = _read_exact(stream, leaf["length"])
+            if i in wanted and (len(data) != leaf["length"] or hashlib.sha256(data).hexdigest() != leaf["sha256"]):
+                bad.append(i)
+        if n_range is None and stream.read(1):
+            bad.append(-1)
+    return todo, bad
+
+def _parse_range(text: str):
+    lo, sep, hi = text.partition(":")
+    if not sep:
+        raise SystemExit("--n_range must look like LO:HI")
+    return int(lo), int(hi)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scan_csv", type=str, required=True)
+    ap.add_argument("--manifest", type=str, default="", help="default: <scan>.merkle.json next to the CSV")
+    ap.add_argument("--report", type=str, default="", help="run report holding scan_csv_merkle_root (default: next to the CSV)")
+    ap.add_argument("--n_range", type=str, default="", help="LO:HI (inclusive); check only the leaves covering this n range")
+    ap.add_argument("--workers", type=int, default=1)
+    args = ap.parse_args()
+
+    manifest = read_manifest(args.manifest or manifest_path(args.scan_csv))
+    n_range = _parse_range(args.n_range) if args.n_range else None
+
+    root = merkle_root([leaf["sha256"] for leaf in manifest["leaves"]])
+    report = args.report or os.path.join(os.path.dirname(args.scan_csv), REPORT_NAME)
+    anchored = report_root(report)
+    print(f"scan_csv={args.scan_csv}")
+    print(f"leaves={len(manifest['leaves'])}")
+    print(f"merkle_root={root}")
+    ok = root == manifest["root"]
+    if not ok:
+        print(f"manifest root mismatch: manifest says {manifest['root']}")
+    if anchored is None:
+        print("report_root=(not found; manifest is not anchored to a run report)")
+    else:
+        print(f"report_root={anchored} {'OK' if anchored == root else 'MISMATCH'}")
+        ok = ok and anchored == root
+
+    checked, bad = verify(args.scan_csv, manifest, max(1, int(args.workers)), n_range)
+    leaves = manifest["leaves"]
+    for i in bad:
+        if i < 0:
+            print("FAIL file length differs from the manifest")
+        else:
+            leaf = leaves[i]
+            where = "header" if leaf["n_first"] is None else f"n={leaf['n_first']}..{leaf['n_last']}"
+            print(f"FAIL leaf {i} {where}")
+    if n_range is not None:
+        print(f"n_range={n_range[0]}:{n_range[1]}")
+    print(f"leaves_checked={len(checked)}")
+    print(f"leaves_failed={len(bad)}")
+    ok = ok and not bad
+    print("RESULT=" + ("OK" if ok else "FAIL"))
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,40 @@
 import argparse
-import csv
+import cProfile
+import gzip
 import hashlib
+import heapq
+import itertools
+import json
 import math
+import mmap
+import multiprocessing
 import os
+import pstats
+import queue
+import shutil
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
 
+import ssit_ido_index_v1 as ido_index
+import ssit_merkle_v1 as merkle
+import ssit_quantile_sketch_v1 as sketch
+
+try:
+    import numpy as np
+except ImportError:  # optional accelerator; every path below has a standard-library fallback
+    np = None
+
+try:
+    import resource
+except ImportError:  # Windows: metrics carry no peak RSS / child CPU
+    resource = None
+
 def sha256_file(path: str) -> str:
     h = hashlib.sha256()
     with open(path, "rb") as f:
@@ -27,18 +56,92 @@ def safe_float_str(x) -> str:
         return "INF"
     return f"{x:.12g}" if isinstance(x, float) else str(x)
 
-def quantile_floor(sorted_vals, q: float) -> float:
-    m = len(sorted_vals)
-    if m == 0:
-        return 0.0
-    if m == 1:
-        return float(sorted_vals[0])
+def quantile_floor_index(m: int, q: float) -> int:
+    if m <= 1:
+        return 0
     idx = int(math.floor(q * (m - 1)))
     if idx < 0:
         idx = 0
     if idx > (m - 1):
         idx = m - 1
-    return float(sorted_vals[idx])
+    return idx
+
+def quantile_floor(sorted_vals, q: float) -> float:
+    m = len(sorted_vals)
+    if m == 0:
+        return 0.0
+    return float(sorted_vals[quantile_floor_index(m, q)])
+
+def exact_quantiles(values, qs):
+    """``quantile_floor(sorted(values), q)`` for each q, without sorting.
+
+    ``values`` is an ``array('d')``. NumPy selects all requested order
+    statistics with one ``partition`` over a typed copy. Without NumPy the
+    typed array is sorted once, since in pure Python that C-level sort still
+    beats the histogram selection ``select_kth`` uses for spilled data.
+    """
+    m = len(values)
+    if m == 0:
+        return [0.0 for _q in qs]
+    ks = [quantile_floor_index(m, q) for q in qs]
+    if np is not None:
+        part = np.partition(np.frombuffer(values, dtype=np.float64), sorted(set(ks)))
+        return [float(part[k]) for k in ks]
+    ordered = sorted(values)
+    return [ordered[k] for k in ks]
+
+def select_kth(blocks, total: int, k: int, collect_limit: int = 1 << 18) -> float:
+    """Exact k-th smallest (0-based) of ``total`` non-negative doubles.
+
+    ``blocks()`` must return a fresh iterable of ``array('d')`` blocks on each
+    call. Non-negative IEEE-754 doubles order like their 64-bit patterns, so
+    the rank is narrowed 16 bits at a time with a bucket histogram until the
+    candidates fit in ``collect_limit``; only those are sorted.
+    """
+    shift = 64
+    prefix = 0
+    matching = total
+    while matching > collect_limit and shift > 0:
+        nxt = shift - 16
+        hist = [0] * 65536 if np is None else np.zeros(65536, dtype=np.int64)
+        for vals in blocks():
+            _bucket_counts(vals, shift, prefix, nxt, hist)
+        for b, c in enumerate(hist):
+            if k < c:
+                break
+            k -= int(c)
+        prefix = (prefix << 16) | b
+        shift = nxt
+        matching = int(c)
+    cand = []
+    for vals in blocks():
+        cand.extend(_matching_keys(vals, shift, prefix))
+    cand.sort()
+    return array("d", array("Q", [cand[k]]).tobytes())[0]
+
+def _double_bits(vals):
+    keys = array("Q")
+    keys.frombytes(vals.tobytes())
+    return keys
+
+def _bucket_counts(vals, shift: int, prefix: int, nxt: int, hist) -> None:
+    if np is not None:
+        keys = np.frombuffer(vals, dtype=np.uint64)
+        if shift < 64:
+            keys = keys[(keys >> np.uint64(shift)) == np.uint64(prefix)]
+        hist += np.bincount(((keys >> np.uint64(nxt)) & np.uint64(0xFFFF)).astype(np.intp), minlength=65536)
+        return
+    for key in _double_bits(vals):
+        if (key >> shift) == prefix:
+            hist[(key >> nxt) & 0xFFFF] += 1
+
+def _matching_keys(vals, shift: int, prefix: int):
+    if np is not None:
+        keys = np.frombuffer(vals, dtype=np.uint64)
+        if shift < 64:
+            keys = keys[(keys >> np.uint64(shift)) == np.uint64(prefix)]
+        return keys.tolist()
+    return [key for key in _double_bits(vals) if (key >> shift) == prefix]
 
 def sis_band(depth: float, q33: float, q66: float) -> str:
     if depth <= q33:
@@ -62,6 +165,56 @@ def spf_sieve(n_max: int):
                     spf[j] = i
     return spf
 
+def _uint32_typecode() -> str:
+    for tc in ("I", "L"):
+        if array(tc).itemsize == 4:
+            return tc
+    raise RuntimeError("no 4-byte unsigned array typecode on this platform")
+
+UINT32 = _uint32_typecode()
+
+def spf_sieve_compact(n_max: int):
+    """Smallest-prime-factor table stored as a flat uint32 ``array``.
+
+    Holds the same values as ``spf_sieve`` (``spf[0] = 0``, ``spf[1] = 1``,
+    ``spf[p] = p`` for primes) in 4 bytes per entry. Indexing returns plain
+    ints, so it is a drop-in for ``factorize`` and ``first_divisor_min_fast``.
+    NumPy fills the table when available; otherwise strided slice
+    assignment keeps the fill out of the interpreter loop.
+    """
+    if n_max < 0:
+        return array(UINT32)
+    if np is not None:
+        buf = np.zeros(n_max + 1, dtype=np.uint32)
+        lim = int(math.isqrt(n_max))
+        for i in range(2, lim + 1):
+            if buf[i] == 0:
+                seg = buf[i * i::i]
+                seg[seg == 0] = i
+        rest = np.flatnonzero(buf == 0)
+        buf[rest] = rest.astype(np.uint32)
+        spf = array(UINT32)
+        spf.frombytes(buf.tobytes())
+        return spf
+    spf = array(UINT32, range(n_max + 1))
+    lim = int(math.isqrt(n_max))
+    flags = bytearray([1]) * (lim + 1)
+    small_primes = []
+    for i in range(2, lim + 1):
+        if flags[i]:
+            small_primes.append(i)
+            flags[i * i::i] = bytes(len(range(i * i, lim + 1, i)))
+    # Largest prime first, so each entry ends up holding its smallest prime.
+    for p in reversed(small_primes):
+        start = p * p
+        spf[start::p] = array(UINT32, [p]) * len(range(start, n_max + 1, p))
+    return spf
+
+def spf_table_bytes(spf) -> int:
+    if isinstance(spf, array):
+        return spf.itemsize * len(spf) + sys.getsizeof(array(spf.typecode))
+    return sys.getsizeof(spf) + sum(sys.getsizeof(v) for v in spf if v > 256)
+
 def factorize(n: int, spf):
     fs = []
     while n > 1:
@@ -85,8 +238,10 @@ def gen_divisors_from_factors(factors):
     return divs
 
 def compute_ds_upto_sqrt(n: int, spf):
+    return ds_from_factors(n, factorize(n, spf))
+
+def ds_from_factors(n: int, fs):
     L = int(math.isqrt(n))
-    fs = factorize(n, spf)
     divs = gen_divisors_from_factors(fs)
     ds = []
     for d in divs:
@@ -103,7 +258,9 @@ def first_divisor_min_fast(n: int, spf):
     return spf[n]
 
 def Hs_and_I_fast(n: int, spf):
-    dmin = first_divisor_min_fast(n, spf)
+    return Hs_and_I_from_dmin(n, first_divisor_min_fast(n, spf))
+
+def Hs_and_I_from_dmin(n: int, dmin):
     sqrt_n = math.sqrt(n)
     if dmin is None:
         Hs = 1.0
@@ -152,6 +309,113 @@ def D_inf_from_ds(ds, L):
         return 1.0
     return s
 
+def lane_from_ratio_sum(s: float, m: int) -> float:
+    R = s / float(m - 1) if m >= 2 else 0.0
+    return clamp_lane(2.0 * R - 1.0)
+
+def D_inf_from_log_sum(s: float, L: int) -> float:
+    if L < 2:
+        return 0.0
+    if (L - 1) > 0:
+        s = s / float(L - 1)
+    if s < 0.0:
+        return 0.0
+    if s > 1.0:
+        return 1.0
+    return s
+
+def divisor_sweep(lo: int, hi: int):
+    """``d_min``, lane and ``D_inf`` for every n in ``[lo, hi)`` without factoring.
+
+    Loops over ``d = 2..isqrt(hi - 1)`` and strikes the multiples ``n >= d*d``,
+    so each n sees its divisors ``<= sqrt(n)`` in ascending order. The running
+    ratio sum ``1 - d_prev/d`` and log-weight sum ``log(d+1)/log(L+1)`` are
+    therefore accumulated in exactly the order ``r_full_from_ds`` and
+    ``D_inf_from_ds`` use, and the columns are bit-identical. ``d_min`` is the
+    first divisor struck (0 for primes).
+    """
+    W = hi - lo
+    if W <= 0:
+        return array(UINT32), array("d"), array("d")
+    dmax = int(math.isqrt(hi - 1))
+    log_d = [math.log(d + 1.0) for d in range(dmax + 1)]
+    log_L = [math.log(L + 1.0) for L in range(dmax + 1)]
+    lane = array("d")
+    depth = array("d")
+
+    if np is not None:
+        Ls = _isqrt_range_np(lo, hi)
+        first = np.zeros(W, dtype=np.uint32)
+        prev = np.zeros(W, dtype=np.uint32)
+        cnt = np.zeros(W, dtype=np.uint32)
+        rsum = np.zeros(W, dtype=np.float64)
+        lsum = np.zeros(W, dtype=np.float64)
+        denom = np.array(log_L, dtype=np.float64)
+        for d in range(2, dmax + 1):
+            start = max(d * d, ((lo + d - 1) // d) * d)
+            if start >= hi:
+                continue
+            sl = slice(start - lo, W, d)
+            p = prev[sl]
+            rs = rsum[sl]
+            rs += np.where(p > 0, 1.0 - p / d, 0.0)
+            f = first[sl]
+            f[f == 0] = d
+            prev[sl] = d
+            cnt[sl] += 1
+            lsum[sl] += log_d[d] / denom[Ls[sl]]
+        m = cnt.astype(np.float64)
+        R = np.where(cnt >= 2, rsum / np.maximum(m - 1.0, 1.0), 0.0)
+        a = 2.0 * R - 1.0
+        a = np.where(a <= -1.0, -1.0 + 1e-12, np.where(a >= 1.0, 1.0 - 1e-12, a))
+        s = np.where(Ls >= 2, lsum / np.maximum(Ls - 1, 1).astype(np.float64), 0.0)
+        s = np.clip(s, 0.0, 1.0)
+        dmin = array(UINT32)
+        dmin.frombytes(first.tobytes())
+        lane.frombytes(a.tobytes())
+        depth.frombytes(s.tobytes())
+        return dmin, lane, depth
+
+    first = array(UINT32, bytes(4 * W))
+    prev = array(UINT32, bytes(4 * W))
+    cnt = array(UINT32, bytes(4 * W))
+    rsum = array("d", bytes(8 * W))
+    lsum = array("d", bytes(8 * W))
+    Ls = array(UINT32, bytes(4 * W))
+    den = array("d", bytes(8 * W))
+    L = int(math.isqrt(lo))
+    for j in range(W):
+        n = lo + j
+        while (L + 1) * (L + 1) <= n:
+            L += 1
+        Ls[j] = L
+        den[j] = log_L[L]
+    for d in range(2, dmax + 1):
+        start = max(d * d, ((lo + d - 1) // d) * d)
+        ld = log_d[d]
+        for j in range(start - lo, W, d):
+            p = prev[j]
+            if p:
+                rsum[j] += 1.0 - p / d
+            else:
+                first[j] = d
+            prev[j] = d
+            cnt[j] += 1
+            lsum[j] += ld / den[j]
+    for j in range(W):
+        lane.append(lane_from_ratio_sum(rsum[j], cnt[j]))
+        depth.append(D_inf_from_log_sum(lsum[j], Ls[j]))
+    return first, lane, depth
+
+def _isqrt_range_np(lo: int, hi: int):
+    """Exact ``isqrt(n)`` for ``n`` in ``[lo, hi)``: the float estimate is
+    corrected by one step either way, which is enough for n < 2**52."""
+    n = np.arange(lo, hi, dtype=np.int64)
+    L = np.floor(np.sqrt(n.astype(np.float64))).astype(np.int64)
+    L -= (L * L > n)
+    L += ((L + 1) * (L + 1) <= n)
+    return L
+
 @dataclass(frozen=True)
 class OmegaTyped:
     kind: str
@@ -191,203 +455,1766 @@ class Fenwick:
             i -= i & -i
         return s
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--n_max", type=int, default=1500000)
-    ap.add_argument("--out_dir", type=str, default="ssit_out_phase2_robust_v2")
-    ap.add_argument("--near_eps", type=float, default=0.02)
-    ap.add_argument("--lane_stable", type=float, default=-0.3)
-    ap.add_argument("--lane_infty", type=float, default=-0.7)
-    ap.add_argument("--depth_infprox_quantile", type=float, default=0.33)
-    ap.add_argument("--shock_quantile", type=float, default=0.95)
-    args = ap.parse_args()
+def ido_dominator_counts(lanes, depths):
+    """IDO count per point: points with strictly smaller lane and depth <= its own.
 
-    n_max = int(args.n_max)
-    near_eps = float(args.near_eps)
+    lanes/depths are parallel sequences; the result is aligned with them.
+    """
+    if np is not None:
+        return _ido_counts_np(np.asarray(lanes, dtype=np.float64), np.asarray(depths, dtype=np.float64))
 
-    os.makedirs(args.out_dir, exist_ok=True)
-    csv_path = os.path.join(args.out_dir, "ssit_phase2_robust_v2_scan.csv")
-    report_path = os.path.join(args.out_dir, "ssit_phase2_robust_v2_report.txt")
+    m = len(lanes)
 
-    spf = spf_sieve(n_max)
+    depth_coords = sorted(set(depths))
+    depth_rank = {d: i + 1 for i, d in enumerate(depth_coords)}
+    order = sorted(range(m), key=lambda k: (lanes[k], depths[k]))
+    fw = Fenwick(len(depth_coords))
+    out = [0] * m
+    i = 0
+    while i < m:
+        j = i
+        a = lanes[order[i]]
+        while j < m and lanes[order[j]] == a:
+            j += 1
+        for k in range(i, j):
+            out[order[k]] = fw.sum(depth_rank[depths[order[k]]])
+        for k in range(i, j):
+            fw.add(depth_rank[depths[order[k]]], 1)
+        i = j
+    return out
 
-    I_vals = [None] * (n_max + 2)
-    Hs_vals = [None] * (n_max + 2)
-    dmin_vals = [None] * (n_max + 2)
-    isinf_vals = [0] * (n_max + 2)
-    primeproxy_vals = [0] * (n_max + 2)
-    lane_vals = [0.0] * (n_max + 2)
-    depth_vals = [0.0] * (n_max + 2)
-    SIS_vals = [""] * (n_max + 2)
+def _ido_counts_np(a, d):
+    # Order points by (lane asc, depth rank desc). A point's count is then the
+    # number of earlier points with depth rank <= its own, minus the earlier
+    # points of its own (lane, rank) tie run; same-lane points of lower rank
+    # come later and are never counted. The "earlier and <=" count is a prefix
+    # rank query, answered for all points at once on a wavelet matrix over the
+    # rank sequence: one stable bit partition + cumsum per bit of the rank.
+    m = len(a)
+    if m == 0:
+        return np.zeros(0, dtype=np.int64)
+    it = np.int32 if m < (1 << 31) else np.int64
+    _u, la = np.unique(a, return_inverse=True)
+    _u, r = np.unique(d, return_inverse=True)
+    del _u
+    r = r.reshape(-1).astype(it)
+    top = int(r.max())
+    order = np.argsort(la.reshape(-1).astype(np.int64) * (top + 1) + (top - r), kind="stable")
+    sl = la.reshape(-1)[order]
+    del la
+    sr = r[order]
+    del r
+    run_start = np.ones(m, dtype=bool)
+    run_start[1:] = (sl[1:] != sl[:-1]) | (sr[1:] != sr[:-1])
+    del sl
+    pos = np.arange(m, dtype=it)
+    start = np.maximum.accumulate(np.where(run_start, pos, 0))
+    del run_start
 
-    inf_count = 0
-    fin_count = 0
-    nearinf_count = 0
-    prime_proxy_count = 0
+    s = np.zeros(m, dtype=it)
+    e = pos.copy()
+    cnt = np.zeros(m, dtype=it)
+    zp = np.zeros(m + 1, dtype=it)
+    cur = sr
+    for b in reversed(range(max(top.bit_length(), 1))):
+        low = ((cur >> b) & 1) == 0
+        np.cumsum(low, out=zp[1:])
+        zeros = zp[m]
+        one = ((sr >> b) & 1) == 1
+        zs = zp[s]
+        ze = zp[e]
+        cnt += np.where(one, ze - zs, 0)
+        s = np.where(one, zeros + s - zs, zs)
+        e = np.where(one, zeros + e - ze, ze)
+        cur = np.concatenate((cur[low], cur[~low]))
+    cnt += e - s
 
-    depths_fin = []
+    out = np.empty(m, dtype=np.int64)
+    out[order] = cnt - (pos - start)
+    return out
 
-    for n in range(2, n_max + 1):
-        Hs, I, is_inf, dmin, prime_proxy = Hs_and_I_fast(n, spf)
-        ds, L = compute_ds_upto_sqrt(n, spf)
-        lane = lane_from_ds(ds)
-        depth = D_inf_from_ds(ds, L)
+COLUMN_BLOCK = 65536
 
-        I_vals[n] = I
-        Hs_vals[n] = Hs
-        dmin_vals[n] = dmin
-        isinf_vals[n] = 1 if is_inf else 0
-        primeproxy_vals[n] = prime_proxy
-        lane_vals[n] = lane
-        depth_vals[n] = depth
+def _encode_rows(rows):
+    # ssit_columns_v1 sits next to this script and is only needed for --columnar 1.
+    from ssit_columns_v1 import encode_rows
+    return encode_rows(rows)
 
-        if prime_proxy:
-            prime_proxy_count += 1
+def scan_header(near_eps: float):
+    return [
+        "n",
+        "set_type",
+        "d_min",
+        "H_s",
+        "I",
+        "I_is_inf",
+        "prime_proxy",
+        f"in_NearInf_eps_{near_eps}",
+        "lane_a",
+        "D_inf",
+        "SIS",
+        "d2I",
+        "K",
+        "zone",
+        "shock_flag",
+        "guard_flag",
+        "ido_dominators"
+    ]
 
-        if is_inf:
-            inf_count += 1
+def scan_row(n, is_inf, dmin, Hs, I, prime_proxy, near_eps, lane, depth, SIS, d2I, K, zone, shock, guard, ido):
+    return [
+        n,
+        "INFSET" if is_inf else "FINSET",
+        "" if dmin is None else dmin,
+        safe_float_str(Hs),
+        safe_float_str(I),
+        1 if is_inf else 0,
+        prime_proxy,
+        1 if (not is_inf and (1.0 - near_eps) <= Hs < 1.0) else 0,
+        safe_float_str(lane),
+        safe_float_str(depth),
+        SIS,
+        safe_float_str(d2I),
+        safe_float_str(K),
+        zone,
+        shock,
+        guard,
+        "" if is_inf else ido
+    ]
+
+SIS_BANDS = ("", "THIN", "MEDIUM", "THICK")
+ZONES = ("INFSET", "INFINITY_PROXIMAL", "TRANSITIONAL", "STABLE_FINITE")
+FLAG_INF = 1
+FLAG_PRIME = 2
+FLAG_SHOCK = 4
+FLAG_GUARD = 8
+
+class ScanState:
+    """Per-n observables for ``n`` in ``[lo, lo + size)`` as typed columns.
+
+    Floats are ``array('d')`` with ``inf`` for INF and NaN for a missing
+    d2I/K, ``dmin`` is uint32 with 0 for "no divisor", the set-type / prime /
+    shock / guard bits share one flag byte per n, and SIS / zone are uint8
+    codes into ``SIS_BANDS`` / ``ZONES``. Strings only appear in ``rows``.
+    """
+
+    def __init__(self, lo: int, size: int):
+        self.lo = lo
+        self.size = size
+        self.dmin = array(UINT32, bytes(4 * size))
+        self.Hs = array("d", bytes(8 * size))
+        self.I = array("d", bytes(8 * size))
+        self.lane = array("d", bytes(8 * size))
+        self.depth = array("d", bytes(8 * size))
+        self.d2I = array("d", [float("nan")]) * size
+        self.K = array("d", [float("nan")]) * size
+        self.flags = bytearray(size)
+        self.sis = bytearray(size)
+        self.zone = bytearray(size)
+        self.ido = array(UINT32, bytes(4 * size))
+
+    @classmethod
+    def from_spill(cls, lo: int, cols: dict):
+        """State over one streaming chunk's spilled columns (adopted, not copied)."""
+        st = cls(lo, 0)
+        st.size = len(cols["dmin"])
+        for name in ("dmin", "Hs", "I", "lane", "depth", "d2I", "K"):
+            setattr(st, name, cols[name])
+        if np is not None:
+            flags = np.frombuffer(cols["isinf"], dtype=np.uint8) * FLAG_INF | np.frombuffer(cols["prime_proxy"], dtype=np.uint8) * FLAG_PRIME
+            st.flags = bytearray(flags.astype(np.uint8).tobytes())
         else:
-            fin_count += 1
-            depths_fin.append(depth)
-            if (1.0 - near_eps) <= Hs < 1.0:
-                nearinf_count += 1
-
-    depths_fin_sorted = sorted(depths_fin)
-    q33 = quantile_floor(depths_fin_sorted, 0.33)
-    q66 = quantile_floor(depths_fin_sorted, 0.66)
-
-    for n in range(2, n_max + 1):
-        if isinf_vals[n]:
-            SIS_vals[n] = ""
+            st.flags = bytearray(
+                (FLAG_INF if i else 0) | (FLAG_PRIME if p else 0) for i, p in zip(cols["isinf"], cols["prime_proxy"])
+            )
+        st.sis = bytearray(st.size)
+        st.zone = bytearray(st.size)
+        st.ido = array(UINT32, bytes(4 * st.size))
+        return st
+
+    def window(self, b: int, e: int):
+        """Copy of the state for offsets ``[b, e)``."""
+        st = ScanState(self.lo + b, 0)
+        st.size = e - b
+        for name in ("dmin", "Hs", "I", "lane", "depth", "d2I", "K", "flags", "sis", "zone", "ido"):
+            setattr(st, name, getattr(self, name)[b:e])
+        return st
+
+    def extend(self, tail) -> None:
+        """Append the state of the n right after this one (``tail.lo == lo + size``).
+        d2I / K at the old last n stay missing until ``fill_curvature`` reruns there."""
+        for name in ("dmin", "Hs", "I", "lane", "depth", "d2I", "K", "flags", "sis", "zone", "ido"):
+            getattr(self, name).extend(getattr(tail, name))
+        self.size += tail.size
+
+    def nbytes(self) -> int:
+        cols = (self.dmin, self.Hs, self.I, self.lane, self.depth, self.d2I, self.K, self.ido)
+        return sum(len(c) * c.itemsize for c in cols) + 3 * self.size
+
+    def fill_from_dmin(self) -> None:
+        """H_s, I and the INF / prime bits from ``dmin``, as ``Hs_and_I_from_dmin``."""
+        if np is not None and self.size:
+            dmin = np.frombuffer(self.dmin, dtype=np.uint32)
+            Hs = np.frombuffer(self.Hs, dtype=np.float64)
+            prime = dmin == 0
+            Hs[:] = dmin / np.sqrt(np.arange(self.lo, self.lo + self.size, dtype=np.float64))
+            inf = prime | (Hs >= 1.0)
+            Hs[inf] = 1.0
+            with np.errstate(divide="ignore"):
+                np.frombuffer(self.I, dtype=np.float64)[:] = np.where(inf, np.inf, 1.0 / (1.0 - Hs))
+            np.frombuffer(self.flags, dtype=np.uint8)[:] = inf * FLAG_INF | prime * FLAG_PRIME
+            return
+        for j in range(self.size):
+            Hs, I, is_inf, _dmin, prime_proxy = Hs_and_I_from_dmin(self.lo + j, self.dmin[j] or None)
+            self.Hs[j] = Hs
+            self.I[j] = I
+            self.flags[j] = (FLAG_INF if is_inf else 0) | (FLAG_PRIME if prime_proxy else 0)
+
+    def fill_curvature(self, start: int = 1) -> None:
+        """d2I / K over interior n (offsets ``>= start``) whose three I values
+        are all finite."""
+        start = max(1, start)
+        if self.size - start < 2:
+            return
+        if np is not None:
+            I = np.frombuffer(self.I, dtype=np.float64)
+            with np.errstate(invalid="ignore"):
+                d2 = I[start + 1:] - 2.0 * I[start:-1] + I[start - 1:-2]
+            ok = np.isfinite(I[start + 1:]) & np.isfinite(I[start:-1]) & np.isfinite(I[start - 1:-2])
+            d2I = np.frombuffer(self.d2I, dtype=np.float64)[start:-1]
+            d2I[:] = np.where(ok, d2, np.nan)
+            np.abs(d2I, out=np.frombuffer(self.K, dtype=np.float64)[start:-1])
+            return
+        I = self.I
+        for j in range(start, self.size - 1):
+            Im1 = I[j - 1]
+            I0 = I[j]
+            Ip1 = I[j + 1]
+            if math.isinf(Im1) or math.isinf(I0) or math.isinf(Ip1):
+                continue
+            d2 = Ip1 - 2.0 * I0 + Im1
+            self.d2I[j] = d2
+            self.K[j] = abs(d2)
+
+    def counts(self, near_eps: float):
+        """(inf, fin, near-inf, prime-proxy) counts."""
+        if np is not None:
+            flags = np.frombuffer(self.flags, dtype=np.uint8)
+            Hs = np.frombuffer(self.Hs, dtype=np.float64)
+            inf = (flags & FLAG_INF) != 0
+            near = ~inf & ((1.0 - near_eps) <= Hs) & (Hs < 1.0)
+            n_inf = int(inf.sum())
+            return n_inf, self.size - n_inf, int(near.sum()), int(((flags & FLAG_PRIME) != 0).sum())
+        n_inf = n_near = n_prime = 0
+        for j in range(self.size):
+            f = self.flags[j]
+            if f & FLAG_PRIME:
+                n_prime += 1
+            if f & FLAG_INF:
+                n_inf += 1
+            elif (1.0 - near_eps) <= self.Hs[j] < 1.0:
+                n_near += 1
+        return n_inf, self.size - n_inf, n_near, n_prime
+
+    def finset(self):
+        """Offsets, lanes and depths of the FINSET n, in n order."""
+        if np is not None:
+            idx = np.flatnonzero((np.frombuffer(self.flags, dtype=np.uint8) & FLAG_INF) == 0)
+            return idx, np.frombuffer(self.lane, dtype=np.float64)[idx], np.frombuffer(self.depth, dtype=np.float64)[idx]
+        idx = array(UINT32)
+        lanes = array("d")
+        depths = array("d")
+        for j in range(self.size):
+            if not self.flags[j] & FLAG_INF:
+                idx.append(j)
+                lanes.append(self.lane[j])
+                depths.append(self.depth[j])
+        return idx, lanes, depths
+
+    def finite_K(self):
+        if np is not None:
+            K = np.frombuffer(self.K, dtype=np.float64)
+            return K[~np.isnan(K)]
+        return array("d", [K for K in self.K if K == K])
+
+    def classify(self, q33: float, q66: float, lane_stable: float, lane_infty: float, depth_infprox: float, Kq: float) -> None:
+        """SIS / zone codes and the shock / guard bits (``sis_band`` / ``zone_label`` rules)."""
+        if np is not None:
+            flags = np.frombuffer(self.flags, dtype=np.uint8)
+            lane = np.frombuffer(self.lane, dtype=np.float64)
+            depth = np.frombuffer(self.depth, dtype=np.float64)
+            inf = (flags & FLAG_INF) != 0
+            sis = np.where(depth <= q33, 1, np.where(depth <= q66, 2, 3))
+            sis[inf] = 0
+            zone = np.where((lane <= lane_infty) & (depth <= depth_infprox), 1, np.where(lane <= lane_stable, 2, 3))
+            zone[inf] = 0
+            shock = np.frombuffer(self.K, dtype=np.float64) >= Kq
+            guard = (zone == 1) | shock
+            np.frombuffer(self.sis, dtype=np.uint8)[:] = sis
+            np.frombuffer(self.zone, dtype=np.uint8)[:] = zone
+            flags[:] = (flags & (FLAG_INF | FLAG_PRIME)) | shock * FLAG_SHOCK | guard * FLAG_GUARD
+            return
+        sis_code = {b: i for i, b in enumerate(SIS_BANDS)}
+        zone_code = {z: i for i, z in enumerate(ZONES)}
+        for j in range(self.size):
+            f = self.flags[j] & (FLAG_INF | FLAG_PRIME)
+            is_inf = f & FLAG_INF
+            zone = zone_label("INFSET" if is_inf else "FINSET", self.lane[j], self.depth[j], lane_stable, lane_infty, depth_infprox)
+            self.sis[j] = 0 if is_inf else sis_code[sis_band(self.depth[j], q33, q66)]
+            self.zone[j] = zone_code[zone]
+            if self.K[j] >= Kq:
+                f |= FLAG_SHOCK | FLAG_GUARD
+            elif zone == "INFINITY_PROXIMAL":
+                f |= FLAG_GUARD
+            self.flags[j] = f
+
+    def set_ido(self, idx, counts) -> None:
+        if np is not None:
+            np.frombuffer(self.ido, dtype=np.uint32)[idx] = counts
+            return
+        for j, c in zip(idx, counts):
+            self.ido[j] = c
+
+    def flag_tallies(self):
+        """(count per ZONES code, shock count, guard count) of the current classification."""
+        if np is not None:
+            flags = np.frombuffer(self.flags, dtype=np.uint8)
+            zones = np.bincount(np.frombuffer(self.zone, dtype=np.uint8), minlength=len(ZONES))
+            return zones.tolist(), int(((flags & FLAG_SHOCK) != 0).sum()), int(((flags & FLAG_GUARD) != 0).sum())
+        zones = [0] * len(ZONES)
+        for c in self.zone:
+            zones[c] += 1
+        return zones, sum(1 for f in self.flags if f & FLAG_SHOCK), sum(1 for f in self.flags if f & FLAG_GUARD)
+
+    def sweep_flags(self, near_eps: float) -> bytes:
+        """One byte per n: zone code (bits 0-1, ZONES order), shock_flag
+        (bit 2), guard_flag (bit 3), in_NearInf (bit 4)."""
+        lo_near = 1.0 - near_eps
+        if np is not None:
+            flags = np.frombuffer(self.flags, dtype=np.uint8)
+            Hs = np.frombuffer(self.Hs, dtype=np.float64)
+            near = ((flags & FLAG_INF) == 0) & (lo_near <= Hs) & (Hs < 1.0)
+            out = np.frombuffer(self.zone, dtype=np.uint8) | (flags & (FLAG_SHOCK | FLAG_GUARD)) | (near.astype(np.uint8) << 4)
+            return out.tobytes()
+        out = bytearray(self.size)
+        for j in range(self.size):
+            f = self.flags[j]
+            near = not f & FLAG_INF and lo_near <= self.Hs[j] < 1.0
+            out[j] = self.zone[j] | (f & (FLAG_SHOCK | FLAG_GUARD)) | (16 if near else 0)
+        return bytes(out)
+
+    def cells(self, near_eps: float, b: int, e: int):
+        """Columns of CSV cells (strings) for offsets ``[b, e)``, formatted as
+        ``scan_row`` + ``safe_float_str`` would, one column at a time."""
+        flags = self.flags[b:e]
+        Hs = self.Hs[b:e].tolist()
+        lo_near = 1.0 - near_eps
+        return [
+            [str(n) for n in range(self.lo + b, self.lo + e)],
+            ["INFSET" if f & FLAG_INF else "FINSET" for f in flags],
+            [str(d) if d else "" for d in self.dmin[b:e].tolist()],
+            _float_cells(Hs),
+            _float_cells(self.I[b:e].tolist()),
+            ["1" if f & FLAG_INF else "0" for f in flags],
+            ["1" if f & FLAG_PRIME else "0" for f in flags],
+            ["1" if (not f & FLAG_INF and lo_near <= h < 1.0) else "0" for f, h in zip(flags, Hs)],
+            _float_cells(self.lane[b:e].tolist()),
+            _float_cells(self.depth[b:e].tolist()),
+            [SIS_BANDS[c] for c in self.sis[b:e]],
+            _float_cells(self.d2I[b:e].tolist()),
+            _float_cells(self.K[b:e].tolist()),
+            [ZONES[c] for c in self.zone[b:e]],
+            ["1" if f & FLAG_SHOCK else "0" for f in flags],
+            ["1" if f & FLAG_GUARD else "0" for f in flags],
+            ["" if f & FLAG_INF else str(c) for f, c in zip(flags, self.ido[b:e].tolist())],
+        ]
+
+    def render(self, near_eps: float, with_rows: bool = False, block: int = COLUMN_BLOCK):
+        """Scan CSV text in blocks of rows, CRLF terminated exactly as
+        ``csv.writer`` writes them (no cell ever needs quoting). Blocks are
+        cut on the global n grid of ``block`` rows, so none straddles a
+        Merkle leaf. Yields ``(n_first, n_last, text, rows)``; rows are the
+        cell tuples when ``with_rows``."""
+        for b, e in self.blocks(block):
+            yield self.render_block(near_eps, b, e, with_rows)
+
+    def blocks(self, block: int = COLUMN_BLOCK):
+        """Offset ranges ``[b, e)`` of the row blocks ``render`` yields."""
+        b = 0
+        while b < self.size:
+            e = min(self.size, b + block - (self.lo - 2 + b) % block)
+            yield b, e
+            b = e
+
+    def render_block(self, near_eps: float, b: int, e: int, with_rows: bool = False):
+        rows = list(zip(*self.cells(near_eps, b, e)))
+        text = "\r\n".join(map(",".join, rows)) + "\r\n"
+        return self.lo + b, self.lo + e - 1, text, (rows if with_rows else None)
+
+_INF = float("inf")
+
+def _float_cells(vals):
+    # safe_float_str for a column: NaN is a missing cell, +/-inf is "INF".
+    return ["" if x != x else ("INF" if x in (_INF, -_INF) else f"{x:.12g}") for x in vals]
+
+def header_line(near_eps: float) -> str:
+    return ",".join(scan_header(near_eps)) + "\r\n"
+
+class ScanWriter:
+    """Scan CSV sink that hashes the uncompressed bytes as they are written,
+    so the report digest needs no second read of the file. Rows are also cut
+    into Merkle leaves (``ssit_merkle_v1``) for the chunk manifest.
+
+    ``compress`` streams the file through gzip (``mtime=0``, so reruns are
+    byte-stable) or zstd (needs the ``zstandard`` package); the digest is
+    always over the plain CSV and matches an uncompressed run. The header
+    and every Merkle leaf go into their own gzip member / zstd frame, so
+    ``ssit_scan_index_v1`` can seek into a compressed scan.
+    """
+
+    SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(self, path: str, compress: str = "none"):
+        self.path = path + self.SUFFIXES[compress]
+        self.bytes = 0
+        self._sha = hashlib.sha256()
+        self.leaves = merkle.LeafHasher(COLUMN_BLOCK)
+        self.compress = compress
+        self._frame = None
+        self._raw = open(self.path, "wb")
+        if compress == "gzip":
+            self._f = self._gzip_member()
+        elif compress == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                self._raw.close()
+                os.remove(self.path)
+                raise SystemExit("--compress zstd needs the zstandard package (pip install zstandard)")
+            self._zstd_flush = zstandard.FLUSH_FRAME
+            self._f = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
         else:
-            SIS_vals[n] = sis_band(depth_vals[n], q33, q66)
+            self._f = self._raw
+
+    def _gzip_member(self):
+        return gzip.GzipFile(filename="", mode="wb", fileobj=self._raw, compresslevel=6, mtime=0)
+
+    def _new_frame(self, frame) -> None:
+        """End the current gzip member / zstd frame when the leaf changes."""
+        if frame == self._frame:
+            return
+        if self._frame is not None:
+            if self.compress == "gzip":
+                self._f.close()
+                self._f = self._gzip_member()
+            elif self.compress == "zstd":
+                self._f.flush(self._zstd_flush)
+        self._frame = frame
+
+    def _write(self, data: bytes) -> None:
+        self._sha.update(data)
+        self._f.write(data)
+        self.bytes += len(data)
+
+    def write_header(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.leaves.header(data)
+        self._new_frame(-1)
+        self._write(data)
+
+    def write_rows(self, n_first: int, n_last: int, text: str) -> None:
+        data = text.encode("utf-8")
+        self.leaves.rows(data, n_first, n_last)
+        self._new_frame((n_first - merkle.N_START) // self.leaves.rows_per_leaf)
+        self._write(data)
+
+    def close(self) -> str:
+        if self._f is not self._raw:
+            self._f.close()
+        self._raw.close()
+        return self._sha.hexdigest()
+
+# ---------------------------------------------------------------------------
+# Pipelined output (--pipeline 1)
+#
+# The sequential path formats a row block, then encodes, hashes, compresses
+# and writes it, then formats the next. With --pipeline 1 the write side runs
+# on a thread behind a bounded queue of row blocks (hashlib, zlib and file
+# writes release the GIL), so it overlaps the formatting of the next block.
+# --pipeline_workers N also formats the in-memory engine's blocks on N forked
+# processes, at most --pipeline_depth blocks ahead. Blocks are written in n
+# order either way, so the CSV and every digest are unchanged.
+# ---------------------------------------------------------------------------
+
+DEFAULT_PIPELINE_DEPTH = 4
+
+class PipelinedWriter:
+    """ScanWriter front whose write_header / write_rows only queue the block;
+    a writer thread applies them in order. Errors surface on the next call
+    or at close().
+
+    The thread starts with the first queued block, so worker pools forked
+    before the first write (render_pipelined, _ordered_map) never copy a
+    process that has it running."""
+
+    def __init__(self, out: ScanWriter, depth: int = DEFAULT_PIPELINE_DEPTH):
+        self.out = out
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._error = None
+        self._thread = None
+
+    def __getattr__(self, name):
+        # path, bytes, leaves: read after close(), when the thread is done.
+        return getattr(self.out, name)
+
+    def _drain(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                fn, args = item
+                try:
+                    fn(*args)
+                except BaseException as exc:
+                    self._error = exc
+
+    def _put(self, fn, args) -> None:
+        if self._error is not None:
+            raise self._error
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._drain, name="ssit-scan-writer", daemon=True)
+            self._thread.start()
+        self._queue.put((fn, args))
+
+    def write_header(self, text: str) -> None:
+        self._put(self.out.write_header, (text,))
+
+    def write_rows(self, n_first: int, n_last: int, text: str) -> None:
+        self._put(self.out.write_rows, (n_first, n_last, text))
+
+    def close(self) -> str:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+        sha = self.out.close()
+        if self._error is not None:
+            raise self._error
+        return sha
+
+_RENDER_STATE = None
+
+def _render_task(task):
+    b, e, near_eps, with_rows = task
+    return _RENDER_STATE.render_block(near_eps, b, e, with_rows)
+
+def render_pipelined(st, near_eps: float, with_rows: bool, workers: int, depth: int = DEFAULT_PIPELINE_DEPTH):
+    """``st.render`` with the blocks formatted on ``workers`` forked processes
+    (which inherit ``st``), at most ``depth`` blocks in flight, yielded in order.
+    Formats in this process when ``workers <= 1`` or fork is unavailable.
+
+    The pool is forked by this call, not on first iteration: call it before
+    anything is written to a PipelinedWriter, whose thread must not exist
+    at fork time."""
+    global _RENDER_STATE
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return st.render(near_eps, with_rows)
+    _RENDER_STATE = st
+    try:
+        pool = multiprocessing.get_context("fork").Pool(workers)
+    except BaseException:
+        _RENDER_STATE = None
+        raise
+    return _render_in_pool(pool, st, near_eps, with_rows, depth)
+
+def _render_in_pool(pool, st, near_eps: float, with_rows: bool, depth: int):
+    global _RENDER_STATE
+    try:
+        with pool:
+            pending = deque()
+            for b, e in st.blocks():
+                pending.append(pool.apply_async(_render_task, ((b, e, near_eps, with_rows),)))
+                if len(pending) >= max(1, depth):
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+    finally:
+        _RENDER_STATE = None
+
+# ---------------------------------------------------------------------------
+# Instrumentation
+#
+# Every run times its phases (wall, CPU, peak RSS) and counts hot-path work.
+# The totals go to the report's Engine section; --metrics_json 1 writes the
+# full breakdown to a JSON file and --profile 1 dumps cProfile stats. None
+# of it reaches the scan CSV, so the digest is unaffected.
+# ---------------------------------------------------------------------------
+
+METRICS_NAME = "ssit_phase2_robust_v2_metrics.json"
+PROFILE_NAME = "ssit_phase2_robust_v2_profile"
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        kb /= 1024.0
+    return round(kb / 1024.0, 1)
+
+def _children_cpu() -> float:
+    if resource is None:
+        return 0.0
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+class RunMetrics:
+    """Per-phase wall / CPU time and peak RSS plus named counters.
+
+    A phase entered more than once accumulates; peak RSS is the process
+    high-water mark when the phase last ended. Child CPU covers pool workers.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self._t0 = time.perf_counter()
+        self._c0 = time.process_time()
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        c0 = time.process_time()
+        k0 = _children_cpu()
+        try:
+            yield
+        finally:
+            p = self.phases.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "child_cpu_seconds": 0.0})
+            p["calls"] += 1
+            p["wall_seconds"] += time.perf_counter() - t0
+            p["cpu_seconds"] += time.process_time() - c0
+            p["child_cpu_seconds"] += _children_cpu() - k0
+            p["peak_rss_mb"] = _peak_rss_mb()
+
+    def count(self, key: str, value: int = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def wall_seconds(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def to_dict(self, rows: int) -> dict:
+        wall = self.wall_seconds()
+        phases = []
+        for name, p in self.phases.items():
+            phases.append({
+                "phase": name,
+                "calls": p["calls"],
+                "wall_seconds": round(p["wall_seconds"], 4),
+                "cpu_seconds": round(p["cpu_seconds"], 4),
+                "child_cpu_seconds": round(p["child_cpu_seconds"], 4),
+                "rows_per_sec": round(rows / p["wall_seconds"]) if p["wall_seconds"] > 0 else None,
+                "peak_rss_mb": p.get("peak_rss_mb"),
+            })
+        return {
+            "rows": rows,
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(time.process_time() - self._c0, 4),
+            "rows_per_sec": round(rows / wall) if wall > 0 else None,
+            "peak_rss_mb": _peak_rss_mb(),
+            "phases": phases,
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+def divisor_count_histogram(n_max: int, n_lo: int = 2) -> dict:
+    """{k: how many n in [n_lo, n_max] have k divisors in 2..isqrt(n)}, i.e.
+    the divisor-list lengths R_full / D_inf work on. One extra strided pass,
+    only run for --metrics_json."""
+    if n_max < n_lo:
+        return {}
+    lim = int(math.isqrt(n_max))
+    W = n_max + 1 - n_lo
+    if np is not None:
+        cnt = np.zeros(W, dtype=np.int32)
+        for d in range(2, lim + 1):
+            start = max(d * d, ((n_lo + d - 1) // d) * d)
+            if start <= n_max:
+                cnt[start - n_lo::d] += 1
+        hist = np.bincount(cnt)
+        return {k: int(v) for k, v in enumerate(hist.tolist()) if v}
+    cnt = array(UINT32, bytes(4 * W))
+    for d in range(2, lim + 1):
+        for j in range(max(d * d, ((n_lo + d - 1) // d) * d) - n_lo, W, d):
+            cnt[j] += 1
+    hist = {}
+    for v in cnt:
+        hist[v] = hist.get(v, 0) + 1
+    return dict(sorted(hist.items()))
+
+def write_metrics(path: str, args, metrics: RunMetrics, stats: dict, csv_sha: str) -> None:
+    rows = max(0, int(args.n_max) + 1 - int(args.n_lo))
+    doc = {
+        "format": "ssit-metrics-v1",
+        "run_utc": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ"),
+        "n_max": int(args.n_max),
+        "engine": {key: value for key, value in stats["engine"]},
+        "scan_csv_sha256": csv_sha,
+    }
+    if int(args.n_lo) > 2:
+        doc["n_lo"] = int(args.n_lo)
+    with metrics.phase("metrics_histogram"):
+        hist = divisor_count_histogram(int(args.n_max), int(args.n_lo))
+    doc.update(metrics.to_dict(rows))
+    doc["divisor_list_length_histogram"] = {str(k): v for k, v in hist.items()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=1)
+        f.write("\n")
+
+# ---------------------------------------------------------------------------
+# Observable cache
+#
+# d_min, H_s, I, the INF / prime bits, lane, D_inf and d2I / K of an n do not
+# depend on n_max (d2I / K only through the last n, which has no n+1). With
+# --cache_dir the in-memory engine keeps these columns as typed arrays in a
+# directory named by the digest of CACHE_KEY. A run at or below the cached
+# horizon reads a prefix of each column; a larger run computes only the
+# missing tail and then stores the longer columns. IDO, which depends on
+# n_max (the FINSET it counts over) but on no threshold, and the
+# threshold-dependent quantiles and zones always run for the requested n_max,
+# as does the CSV.
+# ---------------------------------------------------------------------------
+
+CACHE_FORMAT = "ssit-observable-cache-v1"
+CACHE_MANIFEST = "cache.json"
+CACHE_COLUMNS = (
+    ("dmin", UINT32),
+    ("Hs", "d"),
+    ("I", "d"),
+    ("flags", "B"),
+    ("lane", "d"),
+    ("depth", "d"),
+    ("d2I", "d"),
+    ("K", "d"),
+)
+# Bump when any cached column changes definition.
+CACHE_KEY = {
+    "format": CACHE_FORMAT,
+    "engine": "ssit_phase2_robust_v2",
+    "columns": [[name, typecode] for name, typecode in CACHE_COLUMNS],
+    "flags": {"INF": FLAG_INF, "PRIME": FLAG_PRIME},
+    "definitions": [
+        "H_s(n) = d_min(n) / sqrt(n); INFSET iff d_min(n) = 0 or H_s(n) >= 1",
+        "I(n) = 1 / (1 - H_s(n)); INF on INFSET",
+        "lane a(n) = clamp(2*R_full(n) - 1, 1e-12)",
+        "D_inf(n) = mean of log(d+1)/log(L+1) over d = 2..L = floor(sqrt(n)), clipped to [0,1]",
+        "d2I(n) = I(n+1) - 2*I(n) + I(n-1) over finite triples; K(n) = abs(d2I(n))",
+    ],
+}
+
+class ObservableCache:
+    """Threshold-independent ScanState columns for n = 2 .. n_max."""
 
-    d2I_vals = [None] * (n_max + 2)
-    K_vals = [None] * (n_max + 2)
-    Ks = []
+    def __init__(self, root: str):
+        digest = hashlib.sha256(json.dumps(CACHE_KEY, sort_keys=True).encode("utf-8")).hexdigest()
+        self.dir = os.path.join(root, digest[:16])
+        self.meta = _read_json(os.path.join(self.dir, CACHE_MANIFEST))
+        if self.meta is not None and not self._valid(self.meta):
+            self.meta = None
 
-    for n in range(3, n_max):
-        Im1 = I_vals[n - 1]
-        I0 = I_vals[n]
-        Ip1 = I_vals[n + 1]
-        if Im1 is None or I0 is None or Ip1 is None:
+    def _valid(self, meta) -> bool:
+        if meta.get("key") != CACHE_KEY:
+            return False
+        rows = int(meta["n_max"]) - 1
+        for name, typecode in CACHE_COLUMNS:
+            path = os.path.join(self.dir, name + ".bin")
+            if not os.path.isfile(path) or os.path.getsize(path) != rows * array(typecode).itemsize:
+                return False
+        return True
+
+    @property
+    def n_max(self) -> int:
+        """Cached horizon (1 when empty)."""
+        return int(self.meta["n_max"]) if self.meta is not None else 1
+
+    def load(self, n_max: int):
+        """ScanState over n = 2 .. min(n_max, horizon), or None when nothing is cached."""
+        size = min(n_max, self.n_max) - 1
+        if size <= 0:
+            return None
+        st = ScanState(2, 0)
+        st.size = size
+        for name, typecode in CACHE_COLUMNS:
+            col = array(typecode)
+            with open(os.path.join(self.dir, name + ".bin"), "rb") as f:
+                col.fromfile(f, size)
+            setattr(st, name, bytearray(col.tobytes()) if typecode == "B" else col)
+        if size < self.n_max - 1:
+            # The last requested n now has no n+1.
+            st.d2I[size - 1] = st.K[size - 1] = float("nan")
+        st.sis = bytearray(size)
+        st.zone = bytearray(size)
+        st.ido = array(UINT32, bytes(4 * size))
+        return st
+
+    def store(self, st) -> None:
+        """Replace the cache with ``st`` (n = 2 ..), before classify sets the
+        threshold bits in ``flags``."""
+        os.makedirs(self.dir, exist_ok=True)
+        manifest = os.path.join(self.dir, CACHE_MANIFEST)
+        if os.path.exists(manifest):
+            os.remove(manifest)
+        for name, _typecode in CACHE_COLUMNS:
+            path = os.path.join(self.dir, name + ".bin")
+            with open(path + ".tmp", "wb") as f:
+                f.write(getattr(st, name))
+            os.replace(path + ".tmp", path)
+        self.meta = {"key": CACHE_KEY, "n_max": st.lo + st.size - 1}
+        _write_json(manifest, self.meta)
+
+def write_ido_index(args, lanes, depths, metrics):
+    """Persist the FINSET (lane, depth) points as an ``ssit_ido_index_v1``
+    dominance-count index in out_dir; returns its engine report lines."""
+    path = os.path.join(args.out_dir, ido_index.INDEX_NAME)
+    with metrics.phase("ido_index"):
+        header = ido_index.build_index(path, lanes, depths, {
+            "n_lo": int(args.n_lo),
+            "n_max": int(args.n_max),
+            "values": "engine",
+        })
+    return [
+        ("ido_index", ido_index.INDEX_NAME),
+        ("ido_index_points", header["points"]),
+        ("ido_index_levels", header["levels"]),
+        ("ido_index_bytes", os.path.getsize(path)),
+    ]
+
+# ---------------------------------------------------------------------------
+# Windowed range scan (--n_lo / --n_hi)
+#
+# A window [n_lo, n_hi] far from 0 is factored with a segmented sieve over
+# the base primes up to sqrt(n_hi + 1), so no SPF table (O(n_hi) memory)
+# is built and the per-n cost does not grow with the offset. The sieve
+# engine's divisor_sweep loops over every d up to sqrt(n_hi), so it is only
+# used when the window is at least that wide. The window is computed with
+# one n of halo on each side, so every row carries the same d_min ... K as a
+# full scan reaching past n_hi. Quantiles, SIS, zones, shock / guard and IDO
+# are then local to the window.
+# ---------------------------------------------------------------------------
+
+RANGE_N_LIMIT = 1 << 52
+
+def segmented_divisor_columns(lo: int, hi: int, primes, block: int = COLUMN_BLOCK):
+    """``divisor_sweep(lo, hi)`` via ``segmented_factorizations`` in blocks of n."""
+    dmin = array(UINT32)
+    lane = array("d")
+    depth = array("d")
+    for b in range(lo, hi, block):
+        e = min(hi, b + block)
+        for n, fs in zip(range(b, e), segmented_factorizations(b, e, primes)):
+            ds, L = ds_from_factors(n, fs)
+            dmin.append(0 if (len(fs) == 1 and fs[0] == (n, 1)) else fs[0][0])
+            lane.append(lane_from_ds(ds))
+            depth.append(D_inf_from_ds(ds, L))
+    return dmin, lane, depth
+
+def scan_base_window(args, metrics):
+    """``scan_base`` for n in ``[args.n_lo, args.n_max]`` with n_lo > 2."""
+    n_lo = int(args.n_lo)
+    n_hi = int(args.n_max)
+    w_lo, w_hi = n_lo - 1, n_hi + 2
+    root = int(math.isqrt(w_hi - 1))
+
+    t0 = time.perf_counter()
+    with metrics.phase("sieve"):
+        if args.divisor_engine == "sieve" and w_hi - w_lo >= root:
+            dmin, lane, depth = divisor_sweep(w_lo, w_hi)
+            metrics.count("divisor_sweep_rows", w_hi - w_lo)
+            engine = [("divisor_engine", "sieve_numpy" if np is not None else "sieve_stdlib")]
+        else:
+            primes = primes_upto(root)
+            dmin, lane, depth = segmented_divisor_columns(w_lo, w_hi, primes)
+            metrics.count("factorize_calls", w_hi - w_lo)
+            engine = [("divisor_engine", "per_n"), ("spf_sieve", "segmented"), ("base_primes", len(primes))]
+    engine.append(("divisor_setup_seconds", f"{time.perf_counter() - t0:.3f}"))
+
+    with metrics.phase("observables"):
+        st = ScanState(w_lo, w_hi - w_lo)
+        st.dmin, st.lane, st.depth = dmin, lane, depth
+        del dmin, lane, depth
+        st.fill_from_dmin()
+    with metrics.phase("curvature"):
+        st.fill_curvature()
+        st = st.window(1, st.size - 1)
+    with metrics.phase("finset"):
+        fin_idx, fin_lanes, fin_depths = st.finset()
+    with metrics.phase("ido"):
+        st.set_ido(fin_idx, ido_dominator_counts(fin_lanes, fin_depths))
+        metrics.count("ido_objects", len(fin_idx))
+    if int(args.ido_index):
+        engine += write_ido_index(args, fin_lanes, fin_depths, metrics)
+    del fin_idx, fin_lanes
+    engine.append(("state_bytes", st.nbytes()))
+    return st, fin_depths, engine
+
+def scan_base(args, metrics):
+    """Threshold-independent part of the in-memory scan: divisors, H_s / I,
+    lane, depth, curvature and IDO. Returns the ScanState, the FINSET depths
+    and the engine report lines.
+
+    With ``--cache_dir`` the cached prefix is read instead and only n beyond
+    the cached horizon are computed."""
+    if int(args.n_lo) > 2:
+        return scan_base_window(args, metrics)
+    n_max = int(args.n_max)
+    cache = ObservableCache(args.cache_dir) if args.cache_dir else None
+    cached = None
+    if cache is not None:
+        with metrics.phase("cache_load"):
+            cached = cache.load(n_max)
+    lo = 2 + (cached.size if cached is not None else 0)
+
+    t0 = time.perf_counter()
+    with metrics.phase("sieve"):
+        if args.divisor_engine == "sieve":
+            spf = None
+            sweep_dmin, sweep_lane, sweep_depth = divisor_sweep(lo, n_max + 1)
+            metrics.count("divisor_sweep_rows", max(0, n_max + 1 - lo))
+            engine = [("divisor_engine", "sieve_numpy" if np is not None else "sieve_stdlib")]
+        else:
+            if lo > n_max:
+                spf = []
+                sieve_kind = "cached"
+            elif args.sieve == "compact":
+                spf = spf_sieve_compact(n_max)
+                sieve_kind = "compact_uint32_numpy" if np is not None else "compact_uint32_stdlib"
+            else:
+                spf = spf_sieve(n_max)
+                sieve_kind = "list"
+            engine = [
+                ("divisor_engine", "per_n"),
+                ("spf_sieve", sieve_kind),
+                ("spf_table_bytes", spf_table_bytes(spf)),
+            ]
+    engine.append(("divisor_setup_seconds", f"{time.perf_counter() - t0:.3f}"))
+
+    with metrics.phase("observables"):
+        st = ScanState(lo, max(0, n_max + 1 - lo))
+        if spf is None:
+            st.dmin, st.lane, st.depth = sweep_dmin, sweep_lane, sweep_depth
+            del sweep_dmin, sweep_lane, sweep_depth
+        else:
+            for n in range(lo, n_max + 1):
+                ds, L = compute_ds_upto_sqrt(n, spf)
+                st.dmin[n - lo] = first_divisor_min_fast(n, spf) or 0
+                st.lane[n - lo] = lane_from_ds(ds)
+                st.depth[n - lo] = D_inf_from_ds(ds, L)
+            metrics.count("factorize_calls", max(0, n_max + 1 - lo))
+        st.fill_from_dmin()
+        if cached is not None:
+            cached.extend(st)
+            st = cached
+
+    with metrics.phase("curvature"):
+        st.fill_curvature(lo - 3)
+    if cache is not None:
+        engine += [("observable_cache", cache.dir), ("observable_cache_rows", lo - 2)]
+        if n_max > cache.n_max:
+            with metrics.phase("cache_store"):
+                cache.store(st)
+    with metrics.phase("finset"):
+        fin_idx, fin_lanes, fin_depths = st.finset()
+    with metrics.phase("ido"):
+        st.set_ido(fin_idx, ido_dominator_counts(fin_lanes, fin_depths))
+        metrics.count("ido_objects", len(fin_idx))
+    if int(args.ido_index):
+        engine += write_ido_index(args, fin_lanes, fin_depths, metrics)
+    del fin_idx, fin_lanes
+    engine.append(("state_bytes", st.nbytes()))
+    return st, fin_depths, engine
+
+def run_in_memory(args, out: ScanWriter, columns=None, metrics=None) -> dict:
+    near_eps = float(args.near_eps)
+    metrics = metrics or RunMetrics()
+
+    st, fin_depths, engine = scan_base(args, metrics)
+    inf_count, fin_count, nearinf_count, prime_proxy_count = st.counts(near_eps)
+
+    mode = args.quantile_mode
+    with metrics.phase("quantiles"):
+        depth_qs = [0.33, 0.66, float(args.depth_infprox_quantile)]
+        if mode == "exact":
+            q33, q66, depth_infprox = exact_quantiles(fin_depths, depth_qs)
+            (Kq,) = exact_quantiles(st.finite_K(), [float(args.shock_quantile)])
+        else:
+            K_fin = st.finite_K()
+            depth_blocks = _block_source(fin_depths)
+            K_blocks = _block_source(K_fin)
+            depth_sk = sketch.KLLSketch(int(args.sketch_k))
+            K_sk = sketch.KLLSketch(int(args.sketch_k))
+            for block in depth_blocks():
+                depth_sk.update(block)
+            for block in K_blocks():
+                K_sk.update(block)
+            (q33, q66, depth_infprox), c1 = sketch_quantiles(depth_sk, depth_blocks, depth_qs, mode == "refine")
+            (Kq,), c2 = sketch_quantiles(K_sk, K_blocks, [float(args.shock_quantile)], mode == "refine")
+            engine += sketch_engine_lines(mode, depth_sk, K_sk, c1 + c2)
+            del K_fin
+    del fin_depths
+
+    with metrics.phase("zones"):
+        st.classify(q33, q66, float(args.lane_stable), float(args.lane_infty), depth_infprox, Kq)
+
+    with metrics.phase("write"):
+        blocks = render_pipelined(st, near_eps, columns is not None, int(args.pipeline_workers), int(args.pipeline_depth))
+        out.write_header(header_line(near_eps))
+        for n_first, n_last, text, rows in blocks:
+            out.write_rows(n_first, n_last, text)
+            if rows is not None:
+                columns.append(_encode_rows(rows))
+
+    return {
+        "depth_infprox": depth_infprox,
+        "Kq": Kq,
+        "inf_count": inf_count,
+        "fin_count": fin_count,
+        "nearinf_count": nearinf_count,
+        "prime_proxy_count": prime_proxy_count,
+        "engine": [("scan_mode", "in_memory")] + engine,
+    }
+
+# ---------------------------------------------------------------------------
+# Threshold sweep
+#
+# Every governance threshold acts on columns that do not depend on it: the
+# quantiles pick from the FINSET depths and finite Ks, and zones / shock /
+# guard / in_NearInf are elementwise tests on H_s, lane, depth and K. So
+# the sweep computes the scan base once, sorts the depths and Ks once, and
+# per config only reads off its quantiles and reclassifies. Each config
+# gets its own report plus a one-byte-per-n flags file (ScanState.sweep_flags);
+# --sweep_csv 1 also writes its full scan CSV, byte-identical to a
+# standalone run with the same flags.
+# ---------------------------------------------------------------------------
+
+SWEEP_DIRNAME = "ssit_sweep"
+SWEEP_SUMMARY = "ssit_sweep_summary.csv"
+SWEEP_FLAGS = "ssit_sweep_flags.u8"
+SWEEP_PARAMS = ("near_eps", "lane_stable", "lane_infty", "depth_infprox_quantile", "shock_quantile")
+
+def sweep_grid(args):
+    """Configs (dicts over SWEEP_PARAMS) from the --sweep_* lists, or None
+    when no list is given. Unlisted parameters keep their single value."""
+    if not any(getattr(args, "sweep_" + name) for name in SWEEP_PARAMS):
+        return None
+    axes = []
+    for name in SWEEP_PARAMS:
+        text = getattr(args, "sweep_" + name)
+        values = [float(v) for v in text.split(",") if v.strip()] if text else [float(getattr(args, name))]
+        axes.append(values)
+    return [dict(zip(SWEEP_PARAMS, combo)) for combo in itertools.product(*axes)]
+
+def sweep_argv(argv):
+    """``argv`` with ``--sweep_<name> <list>`` joined into ``--sweep_<name>=<list>``,
+    so argparse reads a list such as ``-0.3,-0.5`` as the value, not as a flag."""
+    options = {"--sweep_" + name for name in SWEEP_PARAMS}
+    out = []
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a in options and i + 1 < len(argv) and not argv[i + 1].startswith("--"):
+            out.append(f"{a}={argv[i + 1]}")
+            i += 2
             continue
-        if math.isinf(Im1) or math.isinf(I0) or math.isinf(Ip1):
+        out.append(a)
+        i += 1
+    return out
+
+def _sorted_values(values):
+    if np is not None:
+        return np.sort(np.asarray(values, dtype=np.float64))
+    return sorted(values)
+
+def run_sweep(args, grid, metrics=None) -> str:
+    """Evaluate every config of ``grid`` over one scan base; returns the summary path."""
+    metrics = metrics or RunMetrics()
+    sweep_dir = os.path.join(args.out_dir, SWEEP_DIRNAME)
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    # sweep_base spans the shared work; the per-config phases follow it.
+    with metrics.phase("sweep_base"):
+        st, fin_depths, engine = scan_base(args, metrics)
+        with metrics.phase("quantiles"):
+            depths = _sorted_values(fin_depths)
+            Ks = _sorted_values(st.finite_K())
+            q33 = quantile_floor(depths, 0.33)
+            q66 = quantile_floor(depths, 0.66)
+    del fin_depths
+
+    summary = []
+    for i, cfg in enumerate(grid):
+        t0 = time.perf_counter()
+        name = f"cfg_{i:03d}"
+        cfg_dir = os.path.join(sweep_dir, name)
+        os.makedirs(cfg_dir, exist_ok=True)
+        cfg_args = argparse.Namespace(**vars(args))
+        for key, value in cfg.items():
+            setattr(cfg_args, key, value)
+        near_eps = cfg["near_eps"]
+        depth_infprox = quantile_floor(depths, cfg["depth_infprox_quantile"])
+        Kq = quantile_floor(Ks, cfg["shock_quantile"])
+
+        with metrics.phase("sweep_classify"):
+            st.classify(q33, q66, cfg["lane_stable"], cfg["lane_infty"], depth_infprox, Kq)
+            inf_count, fin_count, nearinf_count, prime_proxy_count = st.counts(near_eps)
+            zones, shock_count, guard_count = st.flag_tallies()
+            with open(os.path.join(cfg_dir, SWEEP_FLAGS), "wb") as f:
+                f.write(st.sweep_flags(near_eps))
+
+        csv_sha = merkle_root = None
+        cfg_engine = [("scan_mode", "sweep"), ("sweep_config", name)] + engine
+        if int(args.sweep_csv):
+            with metrics.phase("sweep_write"):
+                csv_path = os.path.join(cfg_dir, "ssit_phase2_robust_v2_scan.csv")
+                out = ScanWriter(csv_path, args.compress)
+                out.write_header(header_line(near_eps))
+                for n_first, n_last, text, _rows in st.render(near_eps):
+                    out.write_rows(n_first, n_last, text)
+                csv_sha = out.close()
+                merkle_path = merkle.manifest_path(csv_path)
+                merkle_root = merkle.write_manifest(merkle_path, out.leaves.finish(), COLUMN_BLOCK, {
+                    "scan_csv": os.path.basename(out.path),
+                    "scan_csv_sha256": csv_sha,
+                    "bytes": out.bytes,
+                    "n_max": int(args.n_max),
+                })
+            cfg_engine.append(("merkle_manifest", os.path.basename(merkle_path)))
+        cfg_engine += [
+            ("sweep_flags", SWEEP_FLAGS),
+            ("shock_flag_count", shock_count),
+            ("guard_flag_count", guard_count),
+        ]
+        stats = {
+            "depth_infprox": depth_infprox,
+            "Kq": Kq,
+            "inf_count": inf_count,
+            "fin_count": fin_count,
+            "nearinf_count": nearinf_count,
+            "prime_proxy_count": prime_proxy_count,
+            "engine": cfg_engine,
+        }
+        write_report(os.path.join(cfg_dir, "ssit_phase2_robust_v2_report.txt"), cfg_args, stats, csv_sha, merkle_root)
+        summary.append([name] + [f"{cfg[k]}" for k in SWEEP_PARAMS] + [
+            f"{depth_infprox:.12g}", f"{Kq:.12g}", inf_count, fin_count, nearinf_count,
+        ] + zones[1:] + [shock_count, guard_count, csv_sha or "", f"{time.perf_counter() - t0:.3f}"])
+
+    summary_path = os.path.join(sweep_dir, SWEEP_SUMMARY)
+    header = ["config"] + list(SWEEP_PARAMS) + [
+        "depth_infprox_value", "shock_K_threshold", "INFSET_count", "FINSET_count", "NearInf_FINSET_count",
+    ] + list(ZONES[1:]) + ["shock_flag_count", "guard_flag_count", "scan_csv_sha256", "config_seconds"]
+    with open(summary_path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(header) + "\r\n")
+        for row in summary:
+            f.write(",".join(str(c) for c in row) + "\r\n")
+    if int(args.metrics_json):
+        stats = {"engine": [("scan_mode", "sweep"), ("sweep_configs", len(grid))] + engine}
+        write_metrics(os.path.join(sweep_dir, METRICS_NAME), args, metrics, stats, None)
+    return summary_path
+
+# ---------------------------------------------------------------------------
+# Streaming (chunked) engine
+#
+# Pass 1 walks n in fixed windows. Each window gets its divisors from
+# divisor_sweep (or, for --divisor_engine per_n, a segmented sieve over the
+# base primes up to sqrt(n_max)), so no O(n_max) SPF table is built. Per-n
+# columns are spilled to one directory per chunk; each window recomputes one
+# n of halo on either side, so the d2I/K stencil needs no carried state.
+# Quantiles are then selected exactly from the spilled FINSET depths and
+# finite Ks, IDO is swept over merged per-chunk sorted runs, and pass 2
+# re-reads each chunk to resolve SIS / zone / shock / guard and write
+# the CSV in n order. Resident memory follows chunk_size, not n_max.
+#
+# Every finished chunk directory is a checkpoint: its done.json records the
+# window it covers and its counts. --resume 1 keeps the valid chunks of an
+# interrupted run; --extend_from links the chunks of an earlier run that do
+# not depend on its horizon. Only the missing windows are recomputed, and the
+# quantile / IDO / pass 2 stages always run over the full range.
+# ---------------------------------------------------------------------------
+
+SPILL_COLUMNS = (
+    ("dmin", UINT32),
+    ("Hs", "d"),
+    ("I", "d"),
+    ("isinf", "B"),
+    ("prime_proxy", "B"),
+    ("lane", "d"),
+    ("depth", "d"),
+    ("d2I", "d"),
+    ("K", "d"),
+)
+
+SPILL_BLOCK = 8192
+MERGE_FANIN = 64
+DEFAULT_CHUNK = 262144
+CHECKPOINT_NAME = "checkpoint.json"
+CHUNK_DONE = "done.json"
+
+def primes_upto(m: int):
+    if m < 2:
+        return []
+    flags = bytearray([1]) * (m + 1)
+    flags[0] = 0
+    flags[1] = 0
+    for i in range(2, int(math.isqrt(m)) + 1):
+        if flags[i]:
+            flags[i * i::i] = bytes(len(range(i * i, m + 1, i)))
+    return [i for i in range(2, m + 1) if flags[i]]
+
+def segmented_factorizations(lo: int, hi: int, primes):
+    """Factor every n in ``[lo, hi)`` by striking out the base primes.
+
+    ``primes`` must cover ``sqrt(hi - 1)``. Factor lists come out in the same
+    ascending ``(p, e)`` order that ``factorize`` produces from an SPF table.
+    """
+    rem = list(range(lo, hi))
+    facs = [[] for _ in rem]
+    for p in primes:
+        if p * p > hi - 1:
+            break
+        for j in range(((lo + p - 1) // p) * p - lo, hi - lo, p):
+            r = rem[j]
+            e = 0
+            while r % p == 0:
+                r //= p
+                e += 1
+            rem[j] = r
+            facs[j].append((p, e))
+    for j, r in enumerate(rem):
+        if r > 1:
+            facs[j].append((r, 1))
+    return facs
+
+def scan_window(lo: int, hi: int, n_max: int, primes, divisor_engine: str = "sieve"):
+    """Spill columns for ``n`` in ``[lo, hi)``.
+
+    The window is widened by one n on each side (clipped to ``[2, n_max]``)
+    so the d2I/K stencil closes at both edges without any state from the
+    neighbouring windows; windows can therefore be computed in any order.
+    """
+    cols = {name: array(tc) for name, tc in SPILL_COLUMNS}
+    w_lo = max(2, lo - 1)
+    w_hi = min(hi + 1, n_max + 1)
+    if divisor_engine == "sieve":
+        sweep_dmin, sweep_lane, sweep_depth = divisor_sweep(w_lo, w_hi)
+        facs = None
+    else:
+        facs = segmented_factorizations(w_lo, w_hi, primes)
+    I_win = {}
+    for j, n in enumerate(range(w_lo, w_hi)):
+        if facs is None:
+            dmin = sweep_dmin[j] or None
+        else:
+            fs = facs[j]
+            dmin = None if (len(fs) == 1 and fs[0] == (n, 1)) else fs[0][0]
+        Hs, I, is_inf, dmin, prime_proxy = Hs_and_I_from_dmin(n, dmin)
+        I_win[n] = I
+        if n < lo or n >= hi:
+            continue
+        cols["dmin"].append(0 if dmin is None else dmin)
+        cols["Hs"].append(Hs)
+        cols["I"].append(I)
+        cols["isinf"].append(1 if is_inf else 0)
+        cols["prime_proxy"].append(prime_proxy)
+        if facs is None:
+            cols["lane"].append(sweep_lane[j])
+            cols["depth"].append(sweep_depth[j])
+        else:
+            ds, L = ds_from_factors(n, fs)
+            cols["lane"].append(lane_from_ds(ds))
+            cols["depth"].append(D_inf_from_ds(ds, L))
+
+    nan = float("nan")
+    for n in range(lo, hi):
+        Im1 = I_win.get(n - 1)
+        I0 = I_win[n]
+        Ip1 = I_win.get(n + 1)
+        if Im1 is None or Ip1 is None or math.isinf(Im1) or math.isinf(I0) or math.isinf(Ip1):
+            cols["d2I"].append(nan)
+            cols["K"].append(nan)
             continue
         d2 = Ip1 - 2.0 * I0 + Im1
-        d2I_vals[n] = d2
-        K = abs(d2)
-        K_vals[n] = K
-        Ks.append(K)
+        cols["d2I"].append(d2)
+        cols["K"].append(abs(d2))
+    return cols
 
-    Ks_sorted = sorted(Ks)
-    Kq = quantile_floor(Ks_sorted, float(args.shock_quantile))
+def _chunk_dir(spill_dir: str, idx: int) -> str:
+    return os.path.join(spill_dir, f"chunk_{idx:06d}")
 
-    depth_infprox = quantile_floor(depths_fin_sorted, float(args.depth_infprox_quantile))
-    lane_stable = float(args.lane_stable)
-    lane_infty = float(args.lane_infty)
+def _write_array(path: str, arr) -> None:
+    with open(path, "wb") as f:
+        arr.tofile(f)
+
+def _read_array(path: str, typecode: str):
+    arr = array(typecode)
+    with open(path, "rb") as f:
+        arr.frombytes(f.read())
+    return arr
+
+def _iter_array(path: str, typecode: str, block: int = SPILL_BLOCK):
+    itemsize = array(typecode).itemsize
+    with open(path, "rb") as f:
+        while True:
+            raw = f.read(block * itemsize)
+            if not raw:
+                return
+            arr = array(typecode)
+            arr.frombytes(raw)
+            yield from arr
+
+def _iter_run(path_key: str, path_n: str):
+    return zip(_iter_array(path_key, "d"), _iter_array(path_n, UINT32))
+
+def reduce_runs(runs, work_dir: str, fanin: int = MERGE_FANIN):
+    """Merge sorted ``(key, n)`` runs level by level until at most ``fanin``
+    remain, so the final ``heapq.merge`` keeps a bounded number of files open."""
+    level = 0
+    while len(runs) > fanin:
+        merged = []
+        for g in range(0, len(runs), fanin):
+            base = os.path.join(work_dir, f"merge_{level:02d}_{g // fanin:06d}")
+            keys = array("d")
+            ns = array(UINT32)
+            with open(base + "_key.bin", "wb") as fk, open(base + "_n.bin", "wb") as fn:
+                for key, n in heapq.merge(*(_iter_run(k, nn) for k, nn in runs[g:g + fanin])):
+                    keys.append(key)
+                    ns.append(n)
+                    if len(keys) >= SPILL_BLOCK:
+                        keys.tofile(fk)
+                        ns.tofile(fn)
+                        keys = array("d")
+                        ns = array(UINT32)
+                keys.tofile(fk)
+                ns.tofile(fn)
+            merged.append((base + "_key.bin", base + "_n.bin"))
+        runs = merged
+        level += 1
+    return runs
+
+def spilled_quantile_floor(paths, m: int, q: float) -> float:
+    if m == 0:
+        return 0.0
+    return select_kth(lambda: (_read_array(p, "d") for p in paths), m, quantile_floor_index(m, q))
+
+def sketch_quantiles(sk, blocks, qs, refine: bool):
+    """``quantile_floor`` values for ``qs`` from the sketch of the values in
+    ``blocks()``: the sketch estimates (rank within ``sk.error``), or with
+    ``refine`` the exact values via ``sketch.refine_kth``, falling back to
+    ``select_kth`` for a bracket too wide to collect. Also returns the number
+    of values the refinement collected."""
+    m = sk.n
+    if m == 0:
+        return [0.0 for _q in qs], 0
+    ks = [quantile_floor_index(m, q) for q in qs]
+    if not refine:
+        return [sk.kth(k) for k in ks], 0
+    vals, collected = sketch.refine_kth(blocks(), ks, sk)
+    return [select_kth(blocks, m, k) if v is None else v for v, k in zip(vals, ks)], collected
+
+def _spilled_source(paths):
+    return lambda: (_read_array(p, "d") for p in paths)
+
+def _block_source(vals, block: int = COLUMN_BLOCK):
+    """``blocks()`` factory over an in-memory column, for the sketch / select helpers."""
+    return lambda: (vals[b:b + block] for b in range(0, len(vals), block))
 
-    zone_vals = [""] * (n_max + 2)
-    shock_vals = [0] * (n_max + 2)
-    guard_vals = [0] * (n_max + 2)
-
-    for n in range(2, n_max + 1):
-        kind = "INFSET" if isinf_vals[n] else "FINSET"
-        zone = zone_label(kind, lane_vals[n], depth_vals[n], lane_stable, lane_infty, depth_infprox)
-        zone_vals[n] = zone
-        K = K_vals[n]
-        shock = 1 if (K is not None and K >= Kq) else 0
-        shock_vals[n] = shock
-        guard_vals[n] = 1 if (zone == "INFINITY_PROXIMAL" or shock == 1) else 0
-
-    fin_items = []
-    for n in range(2, n_max + 1):
-        if isinf_vals[n]:
+def _chunk_sketch(cdir: str, name: str, values_path: str, k: int):
+    """Sketch spilled by ``spill_chunk``, or one built from the spilled values
+    (chunks reused from a run without sketches, or with another k)."""
+    path = os.path.join(cdir, f"sketch_{name}.kll")
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            sk = sketch.KLLSketch.from_bytes(f.read())
+        if sk.k == k:
+            return sk
+    sk = sketch.KLLSketch(k)
+    sk.update(_read_array(values_path, "d"))
+    return sk
+
+def sketch_engine_lines(mode: str, depth_sk, K_sk, collected: int):
+    """Report lines recording the sketch size and its guaranteed rank error."""
+    lines = [("quantile_mode", mode), ("quantile_sketch_k", depth_sk.k)]
+    for name, sk in (("depth", depth_sk), ("K", K_sk)):
+        lines += [
+            (f"{name}_sketch_items", sk.size()),
+            (f"{name}_sketch_rank_error_bound", sk.error),
+            (f"{name}_sketch_rank_epsilon", f"{sk.epsilon:.3g}"),
+        ]
+    if mode == "refine":
+        lines.append(("quantile_refine_candidates", collected))
+    return lines
+
+def _chunk_key(lo: int, hi: int, n_max: int, near_eps: float) -> dict:
+    # A window's spill depends on n_max only through its clipped upper halo.
+    return {"lo": lo, "hi": hi, "w_hi": min(hi + 1, n_max + 1), "near_eps": near_eps}
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path: str, obj) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, sort_keys=True)
+    os.replace(tmp, path)
+
+def _done_counts(cdir: str, key: dict):
+    """Counts of a finished chunk, or None when it is missing or was spilled
+    for a different window."""
+    done = _read_json(os.path.join(cdir, CHUNK_DONE))
+    if done is None or done.get("key") != key:
+        return None
+    return tuple(done["counts"])
+
+def _link_chunk(src: str, dst: str) -> None:
+    os.makedirs(dst)
+    names = sorted(os.listdir(src), key=lambda x: x == CHUNK_DONE)
+    for name in names:
+        try:
+            os.link(os.path.join(src, name), os.path.join(dst, name))
+        except OSError:
+            shutil.copyfile(os.path.join(src, name), os.path.join(dst, name))
+
+def checkpoint_dir(path: str):
+    """Spill directory holding a checkpoint: ``path`` itself, or
+    ``<path>/ssit_spill`` when given the out_dir of an earlier run."""
+    for d in (path, os.path.join(path, "ssit_spill")):
+        if os.path.isfile(os.path.join(d, CHECKPOINT_NAME)):
+            return d
+    return None
+
+def checkpoint_chunk_size(path: str) -> int:
+    d = checkpoint_dir(path)
+    meta = _read_json(os.path.join(d, CHECKPOINT_NAME)) if d else None
+    return int(meta["chunk_size"]) if meta else 0
+
+def spill_chunk(task):
+    """Pass 1 for one chunk: compute, spill, and return its counts."""
+    lo, hi, n_max, near_eps, primes, divisor_engine, cdir, sketch_k = task
+    cols = scan_window(lo, hi, n_max, primes, divisor_engine)
+    if os.path.isdir(cdir):
+        shutil.rmtree(cdir)
+    os.makedirs(cdir)
+    for name, _tc in SPILL_COLUMNS:
+        _write_array(os.path.join(cdir, name + ".bin"), cols[name])
+
+    inf_count = 0
+    nearinf_count = 0
+    prime_proxy_count = 0
+    fin = []
+    Ks = array("d")
+    for j in range(hi - lo):
+        if cols["prime_proxy"][j]:
+            prime_proxy_count += 1
+        K = cols["K"][j]
+        if K == K:
+            Ks.append(K)
+        if cols["isinf"][j]:
+            inf_count += 1
             continue
-        fin_items.append((lane_vals[n], depth_vals[n], n))
+        Hs = cols["Hs"][j]
+        if (1.0 - near_eps) <= Hs < 1.0:
+            nearinf_count += 1
+        fin.append((cols["lane"][j], cols["depth"][j], lo + j))
 
-    depth_coords = sorted({d for (_a, d, _n) in fin_items})
-    depth_rank = {d: i + 1 for i, d in enumerate(depth_coords)}
+    _write_array(os.path.join(cdir, "K_fin.bin"), Ks)
+    by_depth = sorted((d, n) for (_a, d, n) in fin)
+    depth_keys = array("d", [d for d, _n in by_depth])
+    _write_array(os.path.join(cdir, "run_depth_key.bin"), depth_keys)
+    _write_array(os.path.join(cdir, "run_depth_n.bin"), array(UINT32, [n for _d, n in by_depth]))
+    by_lane = sorted((a, n) for (a, _d, n) in fin)
+    _write_array(os.path.join(cdir, "run_lane_key.bin"), array("d", [a for a, _n in by_lane]))
+    _write_array(os.path.join(cdir, "run_lane_n.bin"), array(UINT32, [n for _a, n in by_lane]))
+    if sketch_k:
+        for name, vals in (("depth", depth_keys), ("K", Ks)):
+            sk = sketch.KLLSketch(sketch_k)
+            sk.update(vals)
+            with open(os.path.join(cdir, f"sketch_{name}.kll"), "wb") as f:
+                f.write(sk.to_bytes())
+    counts = (inf_count, len(fin), nearinf_count, prime_proxy_count)
+    _write_json(os.path.join(cdir, CHUNK_DONE), {"key": _chunk_key(lo, hi, n_max, near_eps), "counts": counts})
+    return counts
 
-    fin_items_sorted = sorted(fin_items, key=lambda x: (x[0], x[1], x[2]))
+def format_chunk(task):
+    """Pass 2 for one chunk: resolve SIS / zone / shock / guard and render
+    its CSV rows (CRLF terminated, exactly as ``csv.writer`` writes them).
+    Returns the ``(n_first, n_last, text)`` row blocks and, when columnar
+    output is on, the encoded columns."""
+    lo, hi, cdir, ido_path, near_eps, q33, q66, Kq, lane_stable, lane_infty, depth_infprox, columnar = task
+    cols = {name: _read_array(os.path.join(cdir, name + ".bin"), tc) for name, tc in SPILL_COLUMNS}
+    st = ScanState.from_spill(lo, cols)
+    st.classify(q33, q66, lane_stable, lane_infty, depth_infprox, Kq)
+    with open(ido_path, "rb") as f:
+        f.seek(4 * lo)
+        st.ido = array(UINT32)
+        st.ido.frombytes(f.read(4 * (hi - lo)))
+    parts = []
+    rows = [] if columnar else None
+    for n_first, n_last, text, block in st.render(near_eps, columnar):
+        parts.append((n_first, n_last, text))
+        if rows is not None:
+            rows.extend(block)
+    return parts, (_encode_rows(rows) if rows is not None else None)
 
-    fw = Fenwick(len(depth_coords))
-    ido_dominators = [0] * (n_max + 2)
+def _ordered_map(fn, tasks, workers: int):
+    """``map`` in task order, on a process pool when ``workers > 1``. The
+    pool is started by this call (see render_pipelined)."""
+    if workers <= 1:
+        return map(fn, tasks)
+    pool = multiprocessing.Pool(workers)
+    return _imap_in_pool(pool, fn, tasks)
 
-    i = 0
-    m = len(fin_items_sorted)
-    while i < m:
-        j = i
-        while j < m and fin_items_sorted[j][0] == fin_items_sorted[i][0]:
-            j += 1
-        for k in range(i, j):
-            _a, d, n = fin_items_sorted[k]
-            r = depth_rank[d]
-            ido_dominators[n] = fw.sum(r)
-        for k in range(i, j):
-            _a, d, _n = fin_items_sorted[k]
-            fw.add(depth_rank[d], 1)
-        i = j
+def _imap_in_pool(pool, fn, tasks):
+    with pool:
+        yield from pool.imap(fn, tasks)
 
-    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ")
+class MappedUint32:
+    """Fixed-length uint32 vector backed by a memory-mapped spill file."""
+
+    def __init__(self, path: str, length: int):
+        with open(path, "wb") as f:
+            f.truncate(4 * max(length, 1))
+        self._f = open(path, "r+b")
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        self.view = memoryview(self._mm).cast(UINT32)
+
+    def close(self) -> None:
+        self.view.release()
+        self._mm.close()
+        self._f.close()
+
+class MappedFenwick(Fenwick):
+    def __init__(self, n: int, path: str):
+        self.n = n
+        self._store = MappedUint32(path, n + 1)
+        self.bit = self._store.view
+
+    def close(self) -> None:
+        self._store.close()
+
+def run_streaming(args, out: ScanWriter, columns=None, metrics=None) -> dict:
+    metrics = metrics or RunMetrics()
+    n_max = int(args.n_max)
+    near_eps = float(args.near_eps)
+    chunk = int(args.chunk_size)
+    workers = max(1, int(args.workers))
+    spill_dir = args.spill_dir or os.path.join(args.out_dir, "ssit_spill")
+    resume = int(args.resume)
+    extend_from = None
+    if args.extend_from:
+        extend_from = checkpoint_dir(args.extend_from)
+        if extend_from is None:
+            raise SystemExit(f"--extend_from {args.extend_from}: no {CHECKPOINT_NAME} found (run it with --keep_spill 1)")
+        if os.path.realpath(extend_from) == os.path.realpath(spill_dir):
+            resume = 1
+            extend_from = None
+    if os.path.isdir(spill_dir) and not resume:
+        shutil.rmtree(spill_dir)
+    os.makedirs(spill_dir, exist_ok=True)
+
+    divisor_engine = args.divisor_engine
+    primes = primes_upto(int(math.isqrt(n_max + 1))) if divisor_engine == "per_n" else []
+    mode = args.quantile_mode
+    sketch_k = int(args.sketch_k) if mode != "exact" else 0
+
+    inf_count = 0
+    fin_count = 0
+    nearinf_count = 0
+    prime_proxy_count = 0
+
+    # Pass 1: observables per window, spilled per chunk. Windows carry no
+    # state between them, so shards can run on any worker; results are
+    # consumed in chunk order.
+    chunks = []
+    tasks = []
+    done = []
+    for idx, lo in enumerate(range(2, n_max + 1, chunk)):
+        hi = min(lo + chunk, n_max + 1)
+        cdir = _chunk_dir(spill_dir, idx)
+        chunks.append((lo, hi, cdir))
+        key = _chunk_key(lo, hi, n_max, near_eps)
+        counts = _done_counts(cdir, key) if resume else None
+        if counts is None and extend_from is not None:
+            src = _chunk_dir(extend_from, idx)
+            counts = _done_counts(src, key)
+            if counts is not None:
+                if os.path.isdir(cdir):
+                    shutil.rmtree(cdir)
+                _link_chunk(src, cdir)
+        if counts is None:
+            tasks.append((lo, hi, n_max, near_eps, primes, divisor_engine, cdir, sketch_k))
+        else:
+            done.append(counts)
+    reused = len(done)
+    if resume:
+        # Anything not belonging to a kept chunk (partial chunks, chunks of
+        # another plan, merge and IDO scratch files) is stale.
+        keep = {os.path.basename(c) for _lo, _hi, c in chunks}
+        for name in os.listdir(spill_dir):
+            path = os.path.join(spill_dir, name)
+            if name in keep:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    _write_json(os.path.join(spill_dir, CHECKPOINT_NAME), {"chunk_size": chunk, "near_eps": near_eps})
+    with metrics.phase("pass1_observables"):
+        for c_inf, c_fin, c_near, c_pp in done + list(_ordered_map(spill_chunk, tasks, workers)):
+            inf_count += c_inf
+            fin_count += c_fin
+            nearinf_count += c_near
+            prime_proxy_count += c_pp
+    # Rows computed this run, halo included (reused chunks cost nothing).
+    window_rows = sum(min(t[1] + 1, n_max + 1) - max(2, t[0] - 1) for t in tasks)
+    metrics.count("factorized_rows" if divisor_engine == "per_n" else "divisor_sweep_rows", window_rows)
+    metrics.count("chunks_computed", len(tasks))
+
+    # Order statistics over the spilled FINSET depths / finite Ks: exact
+    # selection, or from the merged per-chunk sketches (--quantile_mode).
+    sketch_lines = []
+    with metrics.phase("quantiles"):
+        depth_paths = [os.path.join(c, "run_depth_key.bin") for _lo, _hi, c in chunks]
+        K_paths = [os.path.join(c, "K_fin.bin") for _lo, _hi, c in chunks]
+        K_count = sum(os.path.getsize(p) // 8 for p in K_paths)
+        if mode == "exact":
+            q33 = spilled_quantile_floor(depth_paths, fin_count, 0.33)
+            q66 = spilled_quantile_floor(depth_paths, fin_count, 0.66)
+            Kq = spilled_quantile_floor(K_paths, K_count, float(args.shock_quantile))
+            depth_infprox = spilled_quantile_floor(depth_paths, fin_count, float(args.depth_infprox_quantile))
+        else:
+            depth_sk = sketch.KLLSketch.merged((_chunk_sketch(c, "depth", p, sketch_k) for (_lo, _hi, c), p in zip(chunks, depth_paths)), sketch_k)
+            K_sk = sketch.KLLSketch.merged((_chunk_sketch(c, "K", p, sketch_k) for (_lo, _hi, c), p in zip(chunks, K_paths)), sketch_k)
+            depth_blocks = _spilled_source(depth_paths)
+            K_blocks = _spilled_source(K_paths)
+            depth_qs = [0.33, 0.66, float(args.depth_infprox_quantile)]
+            (q33, q66, depth_infprox), c1 = sketch_quantiles(depth_sk, depth_blocks, depth_qs, mode == "refine")
+            (Kq,), c2 = sketch_quantiles(K_sk, K_blocks, [float(args.shock_quantile)], mode == "refine")
+            sketch_lines = sketch_engine_lines(mode, depth_sk, K_sk, c1 + c2)
+    lane_stable = float(args.lane_stable)
+    lane_infty = float(args.lane_infty)
+
+    # IDO: pos(n) is the rank of n in (depth, n) order and upper(n) the last
+    # rank sharing its depth, so a Fenwick prefix over upper(n) counts every
+    # object with depth <= depth(n) already inserted by the lane sweep.
+    with metrics.phase("ido"):
+        pos = MappedUint32(os.path.join(spill_dir, "ido_pos.u32"), n_max + 1)
+        upper = MappedUint32(os.path.join(spill_dir, "ido_upper.u32"), n_max + 1)
+        ido = MappedUint32(os.path.join(spill_dir, "ido.u32"), n_max + 1)
+        rank = 0
+        group = []
+        group_depth = None
+        depth_runs = reduce_runs([(p, p.replace("_key", "_n")) for p in depth_paths], spill_dir)
+        for d, n in heapq.merge(*(_iter_run(k, nn) for k, nn in depth_runs)):
+            if d != group_depth:
+                for g in group:
+                    upper.view[g] = rank
+                group = []
+                group_depth = d
+            rank += 1
+            pos.view[n] = rank
+            group.append(n)
+        for g in group:
+            upper.view[g] = rank
+        del group
+
+        lane_runs = reduce_runs(
+            [(os.path.join(c, "run_lane_key.bin"), os.path.join(c, "run_lane_n.bin")) for _lo, _hi, c in chunks],
+            spill_dir,
+        )
+        fw = MappedFenwick(fin_count, os.path.join(spill_dir, "ido_fenwick.u32"))
+        adder = heapq.merge(*(_iter_run(k, nn) for k, nn in lane_runs))
+        pending = next(adder, None)
+        for a, n in heapq.merge(*(_iter_run(k, nn) for k, nn in lane_runs)):
+            while pending is not None and pending[0] < a:
+                fw.add(pos.view[pending[1]], 1)
+                pending = next(adder, None)
+            ido.view[n] = fw.sum(upper.view[n])
+        fw.close()
+        pos.close()
+        upper.close()
+        ido.close()
+        metrics.count("ido_objects", fin_count)
 
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow([
-            "n",
-            "set_type",
-            "d_min",
-            "H_s",
-            "I",
-            "I_is_inf",
-            "prime_proxy",
-            f"in_NearInf_eps_{near_eps}",
-            "lane_a",
-            "D_inf",
-            "SIS",
-            "d2I",
-            "K",
-            "zone",
-            "shock_flag",
-            "guard_flag",
-            "ido_dominators"
-        ])
-
-        for n in range(2, n_max + 1):
-            is_inf = bool(isinf_vals[n])
-            set_type = "INFSET" if is_inf else "FINSET"
-            w.writerow([
-                n,
-                set_type,
-                "" if dmin_vals[n] is None else dmin_vals[n],
-                safe_float_str(Hs_vals[n]),
-                safe_float_str(I_vals[n]),
-                1 if is_inf else 0,
-                primeproxy_vals[n],
-                1 if (not is_inf and (1.0 - near_eps) <= Hs_vals[n] < 1.0) else 0,
-                safe_float_str(lane_vals[n]),
-                safe_float_str(depth_vals[n]),
-                SIS_vals[n],
-                safe_float_str(d2I_vals[n]),
-                safe_float_str(K_vals[n]),
-                zone_vals[n],
-                shock_vals[n],
-                guard_vals[n],
-                "" if is_inf else ido_dominators[n]
-            ])
+    index_lines = []
+    if int(args.ido_index):
+        # The index keeps the FINSET lane / depth pairs in memory while it is
+        # built (16 bytes per object), unlike the passes above.
+        lanes = array("d")
+        depths = array("d")
+        for _lo, _hi, cdir in chunks:
+            isinf = _read_array(os.path.join(cdir, "isinf.bin"), "B")
+            lane_col = _read_array(os.path.join(cdir, "lane.bin"), "d")
+            depth_col = _read_array(os.path.join(cdir, "depth.bin"), "d")
+            if np is not None:
+                fin = np.frombuffer(isinf, dtype=np.uint8) == 0
+                lanes.frombytes(np.frombuffer(lane_col, dtype=np.float64)[fin].tobytes())
+                depths.frombytes(np.frombuffer(depth_col, dtype=np.float64)[fin].tobytes())
+            else:
+                lanes.extend(a for a, f in zip(lane_col, isinf) if not f)
+                depths.extend(d for d, f in zip(depth_col, isinf) if not f)
+        index_lines = write_ido_index(args, lanes, depths, metrics)
+        del lanes, depths
 
+    # Pass 2: quantile-dependent columns, written in n order.
+    ido_path = os.path.join(spill_dir, "ido.u32")
+    tasks = [
+        (lo, hi, cdir, ido_path, near_eps, q33, q66, Kq, lane_stable, lane_infty, depth_infprox, columns is not None)
+        for lo, hi, cdir in chunks
+    ]
+    with metrics.phase("pass2_zones_write"):
+        formatted = _ordered_map(format_chunk, tasks, workers)
+        out.write_header(header_line(near_eps))
+        for parts, block in formatted:
+            for n_first, n_last, text in parts:
+                out.write_rows(n_first, n_last, text)
+            if block is not None:
+                columns.append(block)
+
+    if not int(args.keep_spill):
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return {
+        "depth_infprox": depth_infprox,
+        "Kq": Kq,
+        "inf_count": inf_count,
+        "fin_count": fin_count,
+        "nearinf_count": nearinf_count,
+        "prime_proxy_count": prime_proxy_count,
+        "engine": [
+            ("scan_mode", "streaming"),
+            ("chunk_size", chunk),
+            ("chunks", len(chunks)),
+            ("chunks_reused", reused),
+            ("workers", workers),
+            ("divisor_engine", divisor_engine if divisor_engine == "per_n" else ("sieve_numpy" if np is not None else "sieve_stdlib")),
+        ] + ([("spf_sieve", "segmented"), ("base_primes", len(primes))] if divisor_engine == "per_n" else []) + sketch_lines + index_lines,
+    }
+
+def write_report(report_path: str, args, stats: dict, csv_sha: str, merkle_root: str) -> None:
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ")
     with open(report_path, "w", encoding="utf-8") as f:
         f.write("SSIT Phase II (Robust) v2 — Zones + Shock + Guard + IDO Dominators\n")
         f.write("==================================================================\n\n")
         f.write(f"run_utc={now}\n")
-        f.write(f"n_max={n_max}\n")
-        f.write(f"near_eps={near_eps}\n")
-        f.write(f"lane_stable={lane_stable}\n")
-        f.write(f"lane_infty={lane_infty}\n")
+        f.write(f"n_max={int(args.n_max)}\n")
+        if int(args.n_lo) > 2:
+            f.write(f"n_lo={int(args.n_lo)}\n")
+        f.write(f"near_eps={float(args.near_eps)}\n")
+        f.write(f"lane_stable={float(args.lane_stable)}\n")
+        f.write(f"lane_infty={float(args.lane_infty)}\n")
         f.write(f"depth_infprox_quantile={float(args.depth_infprox_quantile)}\n")
-        f.write(f"depth_infprox_value={depth_infprox:.12g}\n")
+        f.write(f"depth_infprox_value={stats['depth_infprox']:.12g}\n")
         f.write(f"shock_quantile={float(args.shock_quantile)}\n")
-        f.write(f"shock_K_threshold={Kq:.12g}\n\n")
+        f.write(f"shock_K_threshold={stats['Kq']:.12g}\n\n")
         f.write("Definitions (ASCII)\n")
         f.write("------------------\n")
         f.write("`H_s(n) = d_min(n) / sqrt(n)`\n")
@@ -402,13 +2229,173 @@ def main():
         f.write("IDO dominators (FINSET only): count of FINSET objects `o` with `o.lane < lane(n)` and `o.depth <= depth(n)`\n\n")
         f.write("Counts\n")
         f.write("------\n")
-        f.write(f"INFSET_count={inf_count}\n")
-        f.write(f"FINSET_count={fin_count}\n")
-        f.write(f"NearInf_FINSET_count={nearinf_count}\n")
-        f.write(f"prime_proxy_count={prime_proxy_count}\n\n")
-        f.write("SHA-256\n")
-        f.write("-------\n")
-        f.write(f"scan_csv_sha256={sha256_file(csv_path)}\n")
+        f.write(f"INFSET_count={stats['inf_count']}\n")
+        f.write(f"FINSET_count={stats['fin_count']}\n")
+        f.write(f"NearInf_FINSET_count={stats['nearinf_count']}\n")
+        f.write(f"prime_proxy_count={stats['prime_proxy_count']}\n\n")
+        f.write("Engine\n")
+        f.write("------\n")
+        for key, value in stats["engine"]:
+            f.write(f"{key}={value}\n")
+        f.write("\n")
+        if csv_sha is not None:
+            f.write("SHA-256\n")
+            f.write("-------\n")
+            f.write(f"scan_csv_sha256={csv_sha}\n")
+            f.write(f"{merkle.ROOT_KEY}={merkle_root}\n")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n_max", type=int, default=1500000)
+    ap.add_argument("--n_lo", type=int, default=2,
+                    help=">2 = windowed range scan of n in [n_lo, n_hi] (segmented sieve; window-local quantiles, zones and IDO)")
+    ap.add_argument("--n_hi", type=int, default=0, help="upper end of the scan (overrides --n_max)")
+    ap.add_argument("--out_dir", type=str, default="ssit_out_phase2_robust_v2")
+    ap.add_argument("--near_eps", type=float, default=0.02)
+    ap.add_argument("--lane_stable", type=float, default=-0.3)
+    ap.add_argument("--lane_infty", type=float, default=-0.7)
+    ap.add_argument("--depth_infprox_quantile", type=float, default=0.33)
+    ap.add_argument("--shock_quantile", type=float, default=0.95)
+    ap.add_argument("--divisor_engine", type=str, choices=["sieve", "per_n"], default="sieve",
+                    help="sieve = accumulate lane/depth over multiples of d; per_n = factorize and enumerate divisors per n")
+    ap.add_argument("--sieve", type=str, choices=["compact", "list"], default="compact", help="SPF table for --divisor_engine per_n")
+    ap.add_argument("--chunk_size", type=int, default=0, help="0 = in-memory scan; >0 = streaming scan in windows of this many n")
+    ap.add_argument("--spill_dir", type=str, default="", help="streaming spill directory (default: <out_dir>/ssit_spill)")
+    ap.add_argument("--keep_spill", type=int, default=0)
+    ap.add_argument("--resume", type=int, default=0,
+                    help="1 = keep the finished chunks already in the spill directory (streaming checkpoints)")
+    ap.add_argument("--extend_from", type=str, default="",
+                    help="spill directory (or out_dir) of an earlier streaming run kept with --keep_spill 1; only new n are computed")
+    ap.add_argument("--compress", type=str, choices=["none", "gzip", "zstd"], default="none",
+                    help="stream the scan CSV compressed (.gz / .zst); the report digest is of the uncompressed CSV")
+    ap.add_argument("--columnar", type=int, default=0,
+                    help="1 = also write per-column .npy files + manifest.json next to the CSV")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="processes for the streaming passes; >1 without --chunk_size picks a chunk size per worker")
+    for name in SWEEP_PARAMS:
+        ap.add_argument("--sweep_" + name, type=str, default="",
+                        help=f"comma-separated {name} values for a threshold sweep (see --sweep_csv); "
+                             "negative lists work as --sweep_lane_stable -0.3,-0.5 or --sweep_lane_stable=-0.3,-0.5")
+    ap.add_argument("--sweep_csv", type=int, default=0,
+                    help="1 = write the full scan CSV of every sweep config (otherwise report + flags file only)")
+    ap.add_argument("--cache_dir", type=str, default="",
+                    help="observable cache shared across in-memory runs; a run only computes n beyond the cached horizon")
+    ap.add_argument("--quantile_mode", type=str, choices=["exact", "sketch", "refine"], default="exact",
+                    help="depth / K thresholds: exact selection; sketch = mergeable KLL estimate (rank error bound in the report); "
+                         "refine = exact values via the sketch and one bracketing pass")
+    ap.add_argument("--sketch_k", type=int, default=sketch.DEFAULT_K, help="KLL level capacity for --quantile_mode sketch|refine")
+    ap.add_argument("--ido_index", type=int, default=0,
+                    help="1 = also write the FINSET (lane_a, D_inf) points as a dominance-count index (" + ido_index.INDEX_NAME + ")")
+    ap.add_argument("--pipeline", type=int, default=0,
+                    help="1 = hash / compress / write the CSV on a writer thread while the next row block is formatted")
+    ap.add_argument("--pipeline_depth", type=int, default=DEFAULT_PIPELINE_DEPTH,
+                    help="row blocks (65536 rows each) queued ahead of the writer / in flight on the format workers")
+    ap.add_argument("--pipeline_workers", type=int, default=0,
+                    help="in-memory engine: format row blocks on this many forked processes (0 = in the main process)")
+    ap.add_argument("--metrics_json", type=int, default=0,
+                    help="1 = write per-phase time / memory and hot-path counters to " + METRICS_NAME)
+    ap.add_argument("--profile", type=int, default=0,
+                    help="1 = run under cProfile; stats go to " + PROFILE_NAME + ".pstats / .txt")
+    args = ap.parse_args(sweep_argv(sys.argv[1:]))
+
+    if int(args.n_hi):
+        args.n_max = int(args.n_hi)
+    args.n_lo = max(2, int(args.n_lo))
+    if args.n_lo > 2:
+        if args.n_lo > int(args.n_max):
+            raise SystemExit(f"empty range: --n_lo {args.n_lo} > --n_hi {int(args.n_max)}")
+        if int(args.n_max) + 1 >= RANGE_N_LIMIT:
+            raise SystemExit("--n_hi must stay below 2**52 (exact float sqrt / isqrt)")
+        if int(args.chunk_size) > 0 or int(args.resume) or args.extend_from or args.cache_dir:
+            raise SystemExit("--n_lo runs a single in-memory window (no --chunk_size / --resume / --extend_from / --cache_dir)")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    grid = sweep_grid(args)
+    if grid is not None:
+        if int(args.chunk_size) > 0 or int(args.resume) or args.extend_from or int(args.columnar):
+            raise SystemExit("--sweep_* runs on the in-memory engine (no --chunk_size / --resume / --extend_from / --columnar)")
+        if (int(args.workers) > 1 or int(args.pipeline) or int(args.pipeline_workers)
+                or int(args.pipeline_depth) != DEFAULT_PIPELINE_DEPTH):
+            raise SystemExit("--sweep_* writes sequentially in one process (no --workers / --pipeline / --pipeline_workers / --pipeline_depth)")
+        if args.quantile_mode != "exact":
+            raise SystemExit("--sweep_* sorts the depths and Ks once and reads every quantile off exactly (no --quantile_mode)")
+        run_sweep(args, grid)
+        return
+
+    csv_path = os.path.join(args.out_dir, "ssit_phase2_robust_v2_scan.csv")
+    report_path = os.path.join(args.out_dir, "ssit_phase2_robust_v2_report.txt")
+
+    if int(args.chunk_size) <= 0 and (int(args.resume) or args.extend_from):
+        # Checkpoints are streaming chunks; reuse the earlier run's chunk size.
+        src = args.extend_from or args.spill_dir or os.path.join(args.out_dir, "ssit_spill")
+        args.chunk_size = checkpoint_chunk_size(src) or DEFAULT_CHUNK
+    if int(args.workers) > 1 and int(args.chunk_size) <= 0 and args.n_lo <= 2:
+        args.chunk_size = max(4096, -(-(int(args.n_max) - 1) // (4 * int(args.workers))))
+    if args.cache_dir and int(args.chunk_size) > 0:
+        raise SystemExit("--cache_dir serves the in-memory engine; streaming runs reuse chunks with --resume / --extend_from")
+    out = ScanWriter(csv_path, args.compress)
+    if int(args.pipeline):
+        out = PipelinedWriter(out, int(args.pipeline_depth))
+    columns = None
+    if int(args.columnar):
+        # Columnar output is opt-in, so its module is only needed on this path.
+        import ssit_columns_v1 as columnar
+        columns_dir = os.path.join(args.out_dir, columnar.COLUMNS_DIRNAME)
+        columns = columnar.ColumnWriter(columns_dir, max(0, int(args.n_max) + 1 - args.n_lo), scan_header(float(args.near_eps)))
+
+    metrics = RunMetrics()
+    profiler = cProfile.Profile() if int(args.profile) else None
+    if profiler is not None:
+        profiler.enable()
+    if int(args.chunk_size) > 0:
+        stats = run_streaming(args, out, columns, metrics)
+    else:
+        stats = run_in_memory(args, out, columns, metrics)
+
+    with metrics.phase("hash"):
+        csv_sha = out.close()
+        merkle_path = merkle.manifest_path(csv_path)
+        leaves = out.leaves.finish()
+        merkle_root = merkle.write_manifest(merkle_path, leaves, COLUMN_BLOCK, {
+            "scan_csv": os.path.basename(out.path),
+            "scan_csv_sha256": csv_sha,
+            "bytes": out.bytes,
+            "n_max": int(args.n_max),
+        })
+    if profiler is not None:
+        profiler.disable()
+    metrics.count("csv_bytes", out.bytes)
+    metrics.count("merkle_leaves", len(leaves))
+    stats["engine"].append(("merkle_manifest", os.path.basename(merkle_path)))
+    if int(args.pipeline):
+        stats["engine"].append(("pipeline", f"writer_thread depth={int(args.pipeline_depth)}"))
+    if int(args.pipeline_workers) > 1 and int(args.chunk_size) <= 0:
+        stats["engine"].append(("pipeline_workers", int(args.pipeline_workers)))
+    if args.compress != "none":
+        stats["engine"].append(("scan_csv", os.path.basename(out.path)))
+    if columns is not None:
+        columns.close({
+            "n_max": int(args.n_max),
+            "scan_csv": os.path.basename(out.path),
+            "scan_csv_sha256": csv_sha,
+        })
+        stats["engine"].append(("columnar_dir", columnar.COLUMNS_DIRNAME))
+
+    rows = max(0, int(args.n_max) + 1 - args.n_lo)
+    wall = metrics.wall_seconds()
+    stats["engine"].append(("scan_seconds", f"{wall:.3f}"))
+    stats["engine"].append(("rows_per_sec", round(rows / wall) if wall > 0 else 0))
+    if profiler is not None:
+        prof_path = os.path.join(args.out_dir, PROFILE_NAME)
+        profiler.dump_stats(prof_path + ".pstats")
+        with open(prof_path + ".txt", "w", encoding="utf-8") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        stats["engine"].append(("profile", PROFILE_NAME + ".pstats"))
+    if int(args.metrics_json):
+        stats["engine"].append(("metrics_json", METRICS_NAME))
+        write_metrics(os.path.join(args.out_dir, METRICS_NAME), args, metrics, stats, csv_sha)
+
+    write_report(report_path, args, stats, csv_sha, merkle_root)
 
 if __name__ == "__main__":
     main()
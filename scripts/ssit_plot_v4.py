@@ -1,13 +1,23 @@
 import argparse
 import csv
 import datetime as _dt
+import gzip
+import io
 import math
 import os
+import random
 import shutil
+from array import array
 from collections import Counter, defaultdict
 from heapq import heappush, heappushpop
 
 import matplotlib.pyplot as plt
+import numpy as np
+
+# raster extents: lane a(n) is clamped into (-1, 1), D_inf(n) lies in [0, 1]
+LANE_RANGE = (-1.0, 1.0)
+DEPTH_RANGE = (0.0, 1.0)
+ZONE_ORDER = ["INFINITY_PROXIMAL", "TRANSITIONAL", "STABLE_FINITE", "INFSET"]
 
 
 def _to_float(x, default=None):
@@ -74,16 +84,291 @@ def _safe_scatter(xs, ys, *, s=10, label=None):
         plt.scatter(xs, ys, s=s, label=label)
 
 
+class _FirstSampler:
+    """The first `capacity` points (the historical behaviour)."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.points = []
+
+    def add(self, idx, point):
+        if len(self.points) < self.capacity:
+            self.points.append(point)
+
+
+class _StratifiedSampler:
+    """Every `stride`-th point over the whole stream, stride doubling as needed.
+
+    Deterministic and evenly spread across the full n range: whenever more
+    than `capacity` points are held, the stride doubles and every other kept
+    point is dropped, so between capacity/2 and capacity points remain.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.stride = 1
+        self._kept = []
+
+    def add(self, idx, point):
+        if idx % self.stride:
+            return
+        self._kept.append((idx, point))
+        if len(self._kept) > self.capacity:
+            self.stride *= 2
+            self._kept = [(i, p) for i, p in self._kept if i % self.stride == 0]
+
+    @property
+    def points(self):
+        return [p for _i, p in self._kept]
+
+
+class _ReservoirSampler:
+    """Uniform reservoir sample (Algorithm R) with a fixed seed, so reruns match."""
+
+    def __init__(self, capacity, seed):
+        self.capacity = capacity
+        self.points = []
+        self._rng = random.Random(seed)
+
+    def add(self, idx, point):
+        if len(self.points) < self.capacity:
+            self.points.append(point)
+            return
+        j = self._rng.randrange(idx + 1)
+        if j < self.capacity:
+            self.points[j] = point
+
+
+class _Raster:
+    """Streaming 2D histograms of lane vs depth on a fixed grid, one per key.
+
+    Bin ids are buffered per key and folded in with one bincount per batch;
+    the grids are bins x bins whatever the number of rows.
+    """
+
+    def __init__(self, bins, batch=65536):
+        self.bins = bins
+        self.batch = batch
+        self.grids = {}
+        self._pending = {}
+        self._sx = bins / (LANE_RANGE[1] - LANE_RANGE[0])
+        self._sy = bins / (DEPTH_RANGE[1] - DEPTH_RANGE[0])
+
+    def add(self, key, lane, depth):
+        b = self.bins
+        ix = int((lane - LANE_RANGE[0]) * self._sx)
+        iy = int((depth - DEPTH_RANGE[0]) * self._sy)
+        ix = 0 if ix < 0 else (b - 1 if ix >= b else ix)
+        iy = 0 if iy < 0 else (b - 1 if iy >= b else iy)
+        buf = self._pending.get(key)
+        if buf is None:
+            buf = self._pending[key] = array("q")
+        buf.append(iy * b + ix)
+        if len(buf) >= self.batch:
+            self._flush(key)
+
+    def _flush(self, key):
+        buf = self._pending.pop(key, None)
+        if not buf:
+            return
+        counts = np.bincount(np.frombuffer(buf, dtype=np.int64), minlength=self.bins * self.bins)
+        grid = self.grids.get(key)
+        if grid is None:
+            self.grids[key] = counts
+        else:
+            grid += counts
+
+    def finish(self):
+        for key in list(self._pending):
+            self._flush(key)
+
+    def _span(self, lo, hi, min_bins=16):
+        if hi - lo >= min_bins:
+            return lo, hi
+        lo = max(0, min(lo, self.bins - min_bins))
+        return lo, min(self.bins, lo + min_bins)
+
+    def image(self, key):
+        """(counts cropped to the occupied bins, matching imshow extent)."""
+        img = self.grids[key].reshape(self.bins, self.bins)
+        rows = np.flatnonzero(img.any(axis=1))
+        cols = np.flatnonzero(img.any(axis=0))
+        r0, r1 = self._span(rows[0], rows[-1] + 1)
+        c0, c1 = self._span(cols[0], cols[-1] + 1)
+        wx = (LANE_RANGE[1] - LANE_RANGE[0]) / self.bins
+        wy = (DEPTH_RANGE[1] - DEPTH_RANGE[0]) / self.bins
+        extent = (LANE_RANGE[0] + c0 * wx, LANE_RANGE[0] + c1 * wx, DEPTH_RANGE[0] + r0 * wy, DEPTH_RANGE[0] + r1 * wy)
+        return img[r0:r1, c0:c1], extent
+
+
+def _raster_figure(title, raster, keys, lane_cut, out_path):
+    """One log-density panel per key, zoomed to its occupied bins; cost
+    depends on the bin count, not on the number of rows."""
+    keys = [k for k in keys if k in raster.grids]
+    if not keys:
+        plt.figure()
+        plt.title(title)
+        plt.text(0.5, 0.5, "NO DATA (no rows with lane/depth)", ha="center", va="center", transform=plt.gca().transAxes)
+        plt.savefig(out_path, dpi=150)
+        plt.close()
+        return
+    cols = min(len(keys), 2)
+    rows = (len(keys) + cols - 1) // cols
+    fig, axes = plt.subplots(rows, cols, figsize=(5.5 * cols, 4.5 * rows), squeeze=False)
+    for ax, key in zip(axes.flat, keys):
+        img, extent = raster.image(key)
+        im = ax.imshow(np.log10(1.0 + img), origin="lower", extent=extent, aspect="auto", interpolation="nearest")
+        if extent[0] <= lane_cut <= extent[1]:
+            ax.axvline(lane_cut, linewidth=1.0, linestyle="--", color="white")
+        ax.set_title(f"{key} (rows={int(img.sum())})")
+        ax.set_xlabel("lane a(n)")
+        ax.set_ylabel("D_inf(n)")
+        fig.colorbar(im, ax=ax, label="log10(1 + rows per bin)")
+    for ax in list(axes.flat)[len(keys):]:
+        ax.axis("off")
+    fig.suptitle(f"{title} (lane_cut={lane_cut:g})")
+    fig.tight_layout()
+    fig.savefig(out_path, dpi=150)
+    plt.close(fig)
+
+
+def _open_scan_text(path):
+    """Text stream of the scan CSV; `.gz` / `.zst` scans are decompressed on the fly."""
+    if path.endswith(".gz"):
+        raw = gzip.open(path, "rb")
+    elif path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit(f"{path}: reading .zst scans needs the zstandard package")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    else:
+        raw = open(path, "rb")
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+
+def _csv_source(scan_csv, lane_keys, depth_keys, zone_keys, guard_keys, k_keys, ido_keys):
+    """Detected field names + an iterator of (zone, lane, depth, guard, K, ido) per CSV row."""
+    f = _open_scan_text(scan_csv)
+    rows = csv.reader(f)
+    header = next(rows, None)
+    if header is None:
+        f.close()
+        raise SystemExit("scan_csv has no header")
+
+    fieldnames = list(header)
+
+    # auto-detect fields robustly
+    lane_field = _find_best_field(fieldnames, lane_keys, contains_any=["lane"]) or _find_best_field(
+        fieldnames, lane_keys, contains_any=["a"]
+    )
+    depth_field = _find_best_field(fieldnames, depth_keys, contains_any=["d", "inf"]) or _find_best_field(
+        fieldnames, depth_keys, contains_any=["depth"]
+    )
+    zone_field = _find_best_field(fieldnames, zone_keys, contains_any=["zone"])
+    guard_field = _find_best_field(fieldnames, guard_keys, contains_any=["guard"])
+    k_field = _find_best_field(fieldnames, k_keys, contains_any=["k"])  # weak fallback; we also validate values
+    ido_field = _find_best_field(fieldnames, ido_keys, contains_any=["ido"])
+
+    # plain csv.reader + column positions: same values as DictReader.get, without a dict per row
+    pos = {name: i for i, name in enumerate(fieldnames)}
+    width = len(fieldnames)
+    i_zone = pos.get(zone_field if zone_field else "zone")
+    i_lane = pos.get(lane_field) if lane_field else None
+    i_depth = pos.get(depth_field) if depth_field else None
+    i_guard = pos.get(guard_field) if guard_field else None
+    i_k = pos.get(k_field) if k_field else None
+    i_ido = pos.get(ido_field) if ido_field else None
+
+    def records():
+        with f:
+            for row in rows:
+                if not row:
+                    continue
+                if len(row) < width:
+                    row = row + [None] * (width - len(row))
+                zone = row[i_zone] if i_zone is not None else None
+                if zone is None or str(zone).strip() == "":
+                    zone = "UNKNOWN"
+                lane = _to_float(row[i_lane]) if i_lane is not None else None
+                depth = _to_float(row[i_depth]) if i_depth is not None else None
+                guard = _to_int(row[i_guard], default=0) if i_guard is not None else 0
+                k_val = _to_float(row[i_k]) if i_k is not None else None
+                ido_val = _to_int(row[i_ido]) if i_ido is not None else None
+                yield zone, lane, depth, guard, k_val, ido_val
+
+    fields = {
+        "lane": lane_field,
+        "depth": depth_field,
+        "zone": zone_field,
+        "guard": guard_field,
+        "k": k_field,
+        "ido": ido_field,
+    }
+    return fields, records()
+
+
+def _columns_source(columns_dir):
+    """Same records as _csv_source, read from the memory-mapped columnar output."""
+    # ssit_columns_v1 sits next to this script and is only needed for --scan_columns.
+    import ssit_columns_v1 as columnar
+
+    manifest = columnar.read_manifest(columns_dir)
+    col = lambda name: columnar.load_column(columns_dir, manifest, name)
+    zones = columnar.find_column(manifest, "zone")["categories"]
+    zone_codes = col("zone")
+    lanes = col("lane_a")
+    depths = col("D_inf")
+    guards = col("guard_flag")
+    ks = col("K")
+    idos = col("ido_dominators")
+    ido_missing = columnar.find_column(manifest, "ido_dominators")["missing"]
+
+    def records():
+        for i in range(len(zone_codes)):
+            lane = lanes[i]
+            depth = depths[i]
+            k_val = ks[i]
+            ido = idos[i]
+            yield (
+                zones[zone_codes[i]],
+                None if lane != lane else lane,
+                None if depth != depth else depth,
+                guards[i],
+                None if k_val != k_val else k_val,
+                None if ido == ido_missing else ido,
+            )
+
+    fields = {
+        "lane": "lane_a",
+        "depth": "D_inf",
+        "zone": "zone",
+        "guard": "guard_flag",
+        "k": "K",
+        "ido": "ido_dominators",
+    }
+    return fields, records()
+
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--scan_csv", required=True)
+    ap.add_argument("--scan_csv", default="")
+    ap.add_argument("--scan_columns", default="", help="columnar output dir (read instead of --scan_csv)")
     ap.add_argument("--out_dir", required=True)
     ap.add_argument("--stride", type=int, default=1)
     ap.add_argument("--top_k", type=int, default=200)
     ap.add_argument("--max_points", type=int, default=300000)
+    ap.add_argument("--mode", choices=["scatter", "raster"], default="scatter",
+                    help="raster = 2D density images over every row (render cost independent of row count)")
+    ap.add_argument("--bins", type=int, default=1024, help="raster bins per axis over lane [-1, 1] x depth [0, 1]")
+    ap.add_argument("--sample", choices=["first", "stratified", "reservoir"], default="first",
+                    help="which max_points rows the scatter mode plots: the first ones, an even stride over all rows, or a seeded reservoir")
+    ap.add_argument("--seed", type=int, default=0, help="seed for --sample reservoir")
     ap.add_argument("--clean_out_dir", type=int, default=0)
     ap.add_argument("--lane_cut", type=float, default=-0.3)  # <-- the single vertical line
     args = ap.parse_args()
+    if not args.scan_csv and not args.scan_columns:
+        ap.error("one of --scan_csv or --scan_columns is required")
 
     # out_dir hygiene
     os.makedirs(args.out_dir, exist_ok=True)
@@ -118,11 +403,13 @@ def main():
 
     zone_counts = Counter()
 
-    guard_points_lane = []
-    guard_points_depth = []
-    guard_points_guard = []
-
-    zone_points = defaultdict(lambda: ([], []))
+    raster = _Raster(max(1, args.bins)) if args.mode == "raster" else None
+    if args.sample == "stratified":
+        sampler = _StratifiedSampler(args.max_points)
+    elif args.sample == "reservoir":
+        sampler = _ReservoirSampler(args.max_points, args.seed)
+    else:
+        sampler = _FirstSampler(args.max_points)
 
     top_k_by_k = []
     top_k_by_ido = []
@@ -130,130 +417,120 @@ def main():
     rows_seen = 0
     rows_used = 0
 
-    # discovered fields (written to summary for audit)
-    lane_field = None
-    depth_field = None
-    zone_field = None
-    guard_field = None
-    k_field = None
-    ido_field = None
-
-    with open(args.scan_csv, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        if reader.fieldnames is None:
-            raise SystemExit("scan_csv has no header")
-
-        fieldnames = list(reader.fieldnames)
-
-        # auto-detect fields robustly
-        lane_field = _find_best_field(fieldnames, lane_keys, contains_any=["lane"]) or _find_best_field(
-            fieldnames, lane_keys, contains_any=["a"]
-        )
-        depth_field = _find_best_field(fieldnames, depth_keys, contains_any=["d", "inf"]) or _find_best_field(
-            fieldnames, depth_keys, contains_any=["depth"]
-        )
-        zone_field = _find_best_field(fieldnames, zone_keys, contains_any=["zone"])
-        guard_field = _find_best_field(fieldnames, guard_keys, contains_any=["guard"])
-        k_field = _find_best_field(fieldnames, k_keys, contains_any=["k"])  # weak fallback; we also validate values
-        ido_field = _find_best_field(fieldnames, ido_keys, contains_any=["ido"])
-
-        for row in reader:
-            rows_seen += 1
-            if args.stride > 1 and (rows_seen % args.stride != 0):
-                continue
-
-            zone = row.get(zone_field) if zone_field else row.get("zone")
-            if zone is None or str(zone).strip() == "":
-                zone = "UNKNOWN"
-            zone_counts[zone] += 1
-
-            lane = _to_float(row.get(lane_field)) if lane_field else None
-            depth = _to_float(row.get(depth_field)) if depth_field else None
-            guard = _to_int(row.get(guard_field), default=0) if guard_field else 0
-
-            k_val = _to_float(row.get(k_field)) if k_field else None
-            ido_val = _to_int(row.get(ido_field)) if ido_field else None
-
-            # require lane/depth for geometric plots + for top lists (they store lane/depth too)
-            if lane is None or depth is None:
-                continue
-
-            rows_used += 1
+    if args.scan_columns:
+        fields, records = _columns_source(args.scan_columns)
+    else:
+        fields, records = _csv_source(args.scan_csv, lane_keys, depth_keys, zone_keys, guard_keys, k_keys, ido_keys)
+    lane_field = fields["lane"]
+    depth_field = fields["depth"]
+    zone_field = fields["zone"]
+    guard_field = fields["guard"]
+    k_field = fields["k"]
+    ido_field = fields["ido"]
+
+    for zone, lane, depth, guard, k_val, ido_val in records:
+        rows_seen += 1
+        if args.stride > 1 and (rows_seen % args.stride != 0):
+            continue
 
-            if rows_used <= args.max_points:
-                guard_points_lane.append(lane)
-                guard_points_depth.append(depth)
-                guard_points_guard.append(guard if guard is not None else 0)
+        zone_counts[zone] += 1
 
-                xs, ys = zone_points[zone]
-                xs.append(lane)
-                ys.append(depth)
+        # require lane/depth for geometric plots + for top lists (they store lane/depth too)
+        if lane is None or depth is None:
+            continue
 
-            if k_val is not None and not math.isnan(k_val):
-                item = (k_val, lane, depth, zone, guard)
-                if len(top_k_by_k) < args.top_k:
-                    heappush(top_k_by_k, item)
-                else:
-                    heappushpop(top_k_by_k, item)
+        rows_used += 1
+        g = guard if guard is not None else 0
 
-            if ido_val is not None:
-                item = (ido_val, lane, depth, zone, guard)
-                if len(top_k_by_ido) < args.top_k:
-                    heappush(top_k_by_ido, item)
-                else:
-                    heappushpop(top_k_by_ido, item)
+        if raster is not None:
+            raster.add(zone, lane, depth)
+            raster.add(f"guard={1 if g == 1 else 0}", lane, depth)
+        else:
+            sampler.add(rows_used - 1, (lane, depth, g, zone))
+
+        if k_val is not None and not math.isnan(k_val):
+            item = (k_val, lane, depth, zone, guard)
+            if len(top_k_by_k) < args.top_k:
+                heappush(top_k_by_k, item)
+            else:
+                heappushpop(top_k_by_k, item)
+
+        if ido_val is not None:
+            item = (ido_val, lane, depth, zone, guard)
+            if len(top_k_by_ido) < args.top_k:
+                heappush(top_k_by_ido, item)
+            else:
+                heappushpop(top_k_by_ido, item)
 
     # split guard points
     guard0_x, guard0_y, guard1_x, guard1_y = [], [], [], []
-    for x, y, g in zip(guard_points_lane, guard_points_depth, guard_points_guard):
+    zone_points = defaultdict(lambda: ([], []))
+    for x, y, g, zone in (sampler.points if raster is None else []):
         if g == 1:
             guard1_x.append(x)
             guard1_y.append(y)
         else:
             guard0_x.append(x)
             guard0_y.append(y)
+        xs, ys = zone_points[zone]
+        xs.append(x)
+        ys.append(y)
 
     written_files = []
 
-    # 1) guard vs non-guard
-    plt.figure()
-    plt.title("SSIT Phase II: guard vs non-guard (FINSET only)")
-    plt.xlabel("lane a(n)")
-    plt.ylabel("D_inf(n)")
-
-    _safe_scatter(guard0_x, guard0_y, s=10, label="guard=0")
-    _safe_scatter(guard1_x, guard1_y, s=10, label="guard=1")
-
-    # single cut-line
-    plt.axvline(args.lane_cut, linewidth=1.0, linestyle="--", label=f"lane_cut={args.lane_cut:g}")
+    if raster is not None:
+        raster.finish()
+        out_path = os.path.join(run_folder, "ssit_guard_scatter.png")
+        _raster_figure("SSIT Phase II: guard vs non-guard density", raster, ["guard=0", "guard=1"], args.lane_cut, out_path)
+        written_files.append(os.path.basename(out_path))
 
-    handles, labels = plt.gca().get_legend_handles_labels()
-    if labels:
-        plt.legend()
-    plt.tight_layout()
-    out_path = os.path.join(run_folder, "ssit_guard_scatter.png")
-    plt.savefig(out_path, dpi=150)
-    plt.close()
-    written_files.append(os.path.basename(out_path))
-
-    # 2) lane vs depth by zone
-    plt.figure()
-    plt.title("SSIT Phase II: lane a(n) vs depth D_inf(n) by zone")
-    plt.xlabel("lane a(n)")
-    plt.ylabel("D_inf(n)")
-    for z, (xs, ys) in zone_points.items():
-        if not xs:
-            continue
-        plt.scatter(xs, ys, s=10, label=str(z))
-    plt.axvline(args.lane_cut, linewidth=1.0, linestyle="--", label=f"lane_cut={args.lane_cut:g}")
-    handles, labels = plt.gca().get_legend_handles_labels()
-    if labels:
-        plt.legend()
-    plt.tight_layout()
-    out_path = os.path.join(run_folder, "ssit_lane_vs_depth_by_zone.png")
-    plt.savefig(out_path, dpi=150)
-    plt.close()
-    written_files.append(os.path.basename(out_path))
+        zone_keys_seen = sorted(
+            (k for k in raster.grids if not k.startswith("guard=")),
+            key=lambda z: (ZONE_ORDER.index(z) if z in ZONE_ORDER else len(ZONE_ORDER), z),
+        )
+        out_path = os.path.join(run_folder, "ssit_lane_vs_depth_by_zone.png")
+        _raster_figure("SSIT Phase II: lane a(n) vs depth D_inf(n) density by zone", raster, zone_keys_seen, args.lane_cut, out_path)
+        written_files.append(os.path.basename(out_path))
+    else:
+        # 1) guard vs non-guard
+        plt.figure()
+        plt.title("SSIT Phase II: guard vs non-guard (FINSET only)")
+        plt.xlabel("lane a(n)")
+        plt.ylabel("D_inf(n)")
+
+        _safe_scatter(guard0_x, guard0_y, s=10, label="guard=0")
+        _safe_scatter(guard1_x, guard1_y, s=10, label="guard=1")
+
+        # single cut-line
+        plt.axvline(args.lane_cut, linewidth=1.0, linestyle="--", label=f"lane_cut={args.lane_cut:g}")
+
+        handles, labels = plt.gca().get_legend_handles_labels()
+        if labels:
+            plt.legend()
+        plt.tight_layout()
+        out_path = os.path.join(run_folder, "ssit_guard_scatter.png")
+        plt.savefig(out_path, dpi=150)
+        plt.close()
+        written_files.append(os.path.basename(out_path))
+
+        # 2) lane vs depth by zone
+        plt.figure()
+        plt.title("SSIT Phase II: lane a(n) vs depth D_inf(n) by zone")
+        plt.xlabel("lane a(n)")
+        plt.ylabel("D_inf(n)")
+        for z, (xs, ys) in zone_points.items():
+            if not xs:
+                continue
+            plt.scatter(xs, ys, s=10, label=str(z))
+        plt.axvline(args.lane_cut, linewidth=1.0, linestyle="--", label=f"lane_cut={args.lane_cut:g}")
+        handles, labels = plt.gca().get_legend_handles_labels()
+        if labels:
+            plt.legend()
+        plt.tight_layout()
+        out_path = os.path.join(run_folder, "ssit_lane_vs_depth_by_zone.png")
+        plt.savefig(out_path, dpi=150)
+        plt.close()
+        written_files.append(os.path.basename(out_path))
 
     # 3) top IDO rank plot (robust: if empty, still produce a readable plot)
     plt.figure()
@@ -311,10 +588,18 @@ def main():
         w.write(f"run_id={run_id}\n")
         w.write(f"run_dir={run_folder}\n")
         w.write(f"scan_csv={args.scan_csv}\n")
+        if args.scan_columns:
+            w.write(f"scan_columns={args.scan_columns}\n")
         w.write(f"rows_seen={rows_seen}\n")
         w.write(f"rows_used_after_stride={rows_used}\n")
         w.write(f"stride={args.stride}\n")
         w.write(f"max_points_plotted={args.max_points}\n")
+        w.write(f"mode={args.mode}\n")
+        if raster is not None:
+            w.write(f"raster_bins={raster.bins}\n")
+        else:
+            w.write(f"sample={args.sample}\n")
+            w.write(f"points_plotted={len(sampler.points)}\n")
         w.write(f"lane_cut={args.lane_cut}\n")
         w.write("detected_fields:\n")
         w.write(f"  lane_field={lane_field}\n")
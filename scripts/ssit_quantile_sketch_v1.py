@@ -0,0 +1,219 @@
+# File name: ssit_quantile_sketch_v1.py
+#
+# Mergeable quantile sketch with a guaranteed rank-error bound, for the
+# depth / K thresholds of Phase II runs too large to sort.
+#
+# KLLSketch keeps levels of values; a value on level h stands for 2**h
+# inputs. A level holding more than k values is sorted and compacted: one
+# value is kept back when the count is odd, and every other value of the
+# rest (offset alternating per level) moves up one level. For any x, the
+# weighted count of values <= x then moves by at most 2**h, so the sketch
+# carries the exact sum of those worst cases as `error`: every rank it
+# reports is within `error` of the true rank. No randomness is involved, so
+# a sketch is a deterministic function of its inputs and merge order.
+#
+# Sketches merge by concatenating levels (errors add) and compacting after
+# each one, so per-chunk sketches of a streaming run combine into one summary
+# of size O(k log(n / k)) however many chunks there are.
+#
+# refine_kth turns a sketch into exact order statistics: the sketch brackets
+# each requested rank between two values, and one pass over the data counts
+# what lies below the bracket and collects what lies inside it.
+
+import json
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional: pure-Python fallback
+    np = None
+
+FORMAT = "ssit-kll-v1"
+DEFAULT_K = 4096
+COLLECT_LIMIT = 1 << 20
+
+def _as_array(values):
+    if isinstance(values, array) and values.typecode == "d":
+        return values
+    out = array("d")
+    if np is not None:
+        out.frombytes(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    else:
+        out.extend(values)
+    return out
+
+def _sorted(vals):
+    if np is not None:
+        out = array("d")
+        out.frombytes(np.sort(np.frombuffer(vals, dtype=np.float64)).tobytes())
+        return out
+    return array("d", sorted(vals))
+
+class KLLSketch:
+    """Deterministic mergeable quantile summary of float values."""
+
+    def __init__(self, k: int = DEFAULT_K):
+        self.k = max(2, int(k))
+        self.levels = [array("d")]
+        self.parity = [0]
+        self.n = 0
+        self.error = 0
+
+    def update(self, values) -> None:
+        """Add a block of values (``array('d')``, a float64 ndarray or any iterable)."""
+        values = _as_array(values)
+        self.levels[0].extend(values)
+        self.n += len(values)
+        self._compress()
+
+    def _compress(self) -> None:
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.k:
+                if h + 1 == len(self.levels):
+                    self.levels.append(array("d"))
+                    self.parity.append(0)
+                level = _sorted(level)
+                keep = array("d")
+                if len(level) % 2:
+                    keep.append(level[-1])
+                    del level[-1]
+                self.levels[h + 1].extend(level[self.parity[h]::2])
+                self.parity[h] ^= 1
+                self.levels[h] = keep
+                self.error += 1 << h
+            h += 1
+
+    @classmethod
+    def merged(cls, sketches, k: int = 0):
+        """One sketch summarizing all inputs of ``sketches`` (k defaults to
+        theirs). Sketches are read lazily and folded in one at a time, so a
+        generator of per-chunk sketches costs one accumulator plus one chunk
+        sketch, however many chunks there are."""
+        out = None
+        for s in sketches:
+            if out is None:
+                out = cls(k or s.k)
+            while len(out.levels) < len(s.levels):
+                out.levels.append(array("d"))
+                out.parity.append(0)
+            for h, level in enumerate(s.levels):
+                out.levels[h].extend(level)
+            out.n += s.n
+            out.error += s.error
+            out._compress()
+        return out if out is not None else cls(k or DEFAULT_K)
+
+    @property
+    def epsilon(self) -> float:
+        """Guaranteed rank error as a fraction of n."""
+        return self.error / self.n if self.n else 0.0
+
+    def size(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+    def _weighted(self):
+        items = []
+        for h, level in enumerate(self.levels):
+            w = 1 << h
+            items.extend((v, w) for v in level)
+        items.sort()
+        return items
+
+    def kth(self, k: int) -> float:
+        """Estimate of the k-th smallest (0-based) input; its true rank is
+        within ``error`` of k."""
+        cum = 0
+        last = 0.0
+        for v, w in self._weighted():
+            cum += w
+            last = v
+            if cum > k:
+                return v
+        return last
+
+    def bracket(self, k: int):
+        """(lo, hi) with lo <= k-th smallest <= hi, guaranteed by ``error``
+        (``-inf`` / ``inf`` when the sketch cannot bound a side)."""
+        lo = -math.inf
+        hi = math.inf
+        below = 0
+        for v, w in self._weighted():
+            # ``below`` is the estimated count strictly below v.
+            if below < k + 1 - self.error:
+                lo = v
+            below += w
+            if below >= k + 1 + self.error:
+                hi = v
+                break
+        return lo, hi
+
+    def to_bytes(self) -> bytes:
+        meta = {
+            "format": FORMAT,
+            "k": self.k,
+            "n": self.n,
+            "error": self.error,
+            "parity": self.parity,
+            "lengths": [len(level) for level in self.levels],
+        }
+        return json.dumps(meta, sort_keys=True).encode("utf-8") + b"\n" + b"".join(level.tobytes() for level in self.levels)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        head, _, body = data.partition(b"\n")
+        meta = json.loads(head.decode("utf-8"))
+        if meta.get("format") != FORMAT:
+            raise ValueError(f"not an {FORMAT} sketch")
+        s = cls(meta["k"])
+        s.n = meta["n"]
+        s.error = meta["error"]
+        s.parity = list(meta["parity"])
+        s.levels = []
+        pos = 0
+        for length in meta["lengths"]:
+            level = array("d")
+            level.frombytes(body[pos:pos + 8 * length])
+            s.levels.append(level)
+            pos += 8 * length
+        return s
+
+def refine_kth(blocks, ks, sketch: KLLSketch, collect_limit: int = COLLECT_LIMIT):
+    """Exact k-th smallest for each k in ``ks`` with one pass over ``blocks``
+    (an iterable of ``array('d')`` blocks). Uses ``sketch.bracket``; a k
+    whose bracket holds more than ``collect_limit`` values comes back as None.
+    Also returns the number of values collected."""
+    brackets = [sketch.bracket(k) for k in ks]
+    below = [0] * len(ks)
+    cand = [[] for _ in ks]
+    for vals in blocks:
+        if np is not None:
+            v = np.frombuffer(vals, dtype=np.float64)
+            for i, (lo, hi) in enumerate(brackets):
+                below[i] += int(np.count_nonzero(v < lo))
+                if cand[i] is not None:
+                    cand[i].extend(v[(v >= lo) & (v <= hi)].tolist())
+                    if len(cand[i]) > collect_limit:
+                        cand[i] = None
+            continue
+        for i, (lo, hi) in enumerate(brackets):
+            c = cand[i]
+            for x in vals:
+                if x < lo:
+                    below[i] += 1
+                elif c is not None and x <= hi:
+                    c.append(x)
+            if c is not None and len(c) > collect_limit:
+                cand[i] = None
+    out = []
+    collected = 0
+    for k, b, c in zip(ks, below, cand):
+        if c is None or not (b <= k < b + len(c)):
+            out.append(None)
+            continue
+        c.sort()
+        collected += len(c)
+        out.append(c[k - b])
+    return out, collected
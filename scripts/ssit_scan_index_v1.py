@@ -0,0 +1,247 @@
+# File name: ssit_scan_index_v1.py
+#
+# Random-access row index for the Phase II scan CSV.
+#
+# The index records the uncompressed byte offset of every STRIDE-th row
+# (with its n) and, for compressed scans, where each gzip member / zstd frame
+# starts in the file. A lookup seeks to the nearest indexed row at or before
+# the requested n (for .gz / .zst: to the start of its member / frame) and
+# reads forward, so it touches at most one frame plus STRIDE rows.
+#
+# Scans written by ssit_phase2_robust_v2.py --compress start a new member /
+# frame every Merkle leaf (65536 rows). A compressed scan in a single frame
+# still works, but every lookup then decompresses from the start of the file.
+#
+#   python scripts/ssit_scan_index_v1.py --scan_csv <out_dir>/ssit_phase2_robust_v2_scan.csv --build
+#   python scripts/ssit_scan_index_v1.py --scan_csv <out_dir>/ssit_phase2_robust_v2_scan.csv --n 720720
+#   python scripts/ssit_scan_index_v1.py --scan_csv <out_dir>/ssit_phase2_robust_v2_scan.csv \
+#       --n_range 720700:720720 --columns lane_a,D_inf,zone,guard_flag
+#
+# A lookup builds the index first when it is missing.
+
+import argparse
+import bisect
+import json
+import os
+import sys
+import zlib
+
+FORMAT = "ssit-scan-index-v1"
+DEFAULT_STRIDE = 1024
+READ_SIZE = 1 << 16
+
+def index_path(scan_csv: str) -> str:
+    base = scan_csv
+    for suffix in (".gz", ".zst"):
+        if base.endswith(suffix):
+            base = base[: -len(suffix)]
+    if base.endswith(".csv"):
+        base = base[:-4]
+    return base + ".index.json"
+
+def _decoder_factory(path: str):
+    """New single-member decoder for a compressed scan, or None for a plain CSV."""
+    if path.endswith(".gz"):
+        return lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit(f"{path}: reading .zst scans needs the zstandard package")
+        dctx = zstandard.ZstdDecompressor()
+        return dctx.decompressobj
+    return None
+
+def _chunks(path: str, start=(0, 0), frames=None):
+    """Uncompressed bytes of the scan from a frame start (compressed offset,
+    uncompressed offset). Frame starts met on the way go into `frames`."""
+    new_decoder = _decoder_factory(path)
+    comp, uncomp = start
+    with open(path, "rb") as f:
+        f.seek(comp)
+        if new_decoder is None:
+            if frames is not None:
+                frames.append([comp, uncomp])
+            for data in iter(lambda: f.read(READ_SIZE), b""):
+                yield data
+            return
+        d = None
+        buf = b""
+        while True:
+            if not buf:
+                buf = f.read(READ_SIZE)
+                if not buf:
+                    break
+            if d is None:
+                if frames is not None:
+                    frames.append([comp, uncomp])
+                d = new_decoder()
+            out = d.decompress(buf)
+            if d.eof:
+                rest = d.unused_data
+                comp += len(buf) - len(rest)
+                buf = rest
+                d = None
+            else:
+                comp += len(buf)
+                buf = b""
+            if out:
+                uncomp += len(out)
+                yield out
+        if d is not None:
+            raise SystemExit(f"{path}: truncated compressed stream")
+
+def _lines(chunks):
+    carry = b""
+    for data in chunks:
+        parts = (carry + data).split(b"\n")
+        carry = parts.pop()
+        for line in parts:
+            yield line + b"\n"
+    if carry:
+        yield carry
+
+def build_index(scan_csv: str, stride: int = DEFAULT_STRIDE) -> dict:
+    """One pass over the scan; returns the index dict (see write_index)."""
+    frames = []
+    points = []
+    offset = 0
+    rows = 0
+    header = None
+    last = None
+    for line in _lines(_chunks(scan_csv, frames=frames)):
+        if header is None:
+            header = line.decode("utf-8").rstrip("\r\n")
+        elif line.strip():
+            if rows % stride == 0:
+                points.append([int(line[: line.index(b",")]), offset])
+            rows += 1
+            last = line
+        offset += len(line)
+    if header is None:
+        raise SystemExit(f"{scan_csv}: empty scan CSV")
+    return {
+        "format": FORMAT,
+        "scan_csv": os.path.basename(scan_csv),
+        "scan_file_bytes": os.path.getsize(scan_csv),
+        "csv_bytes": offset,
+        "header": header,
+        "rows": rows,
+        "n_first": points[0][0] if points else None,
+        "n_last": int(last[: last.index(b",")]) if last is not None else None,
+        "stride": stride,
+        "frames": frames,
+        "points": points,
+    }
+
+def write_index(path: str, index: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"), sort_keys=True)
+        f.write("\n")
+
+def load_index(scan_csv: str, path: str = "") -> dict:
+    path = path or index_path(scan_csv)
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("format") != FORMAT:
+        raise SystemExit(f"{path}: not an {FORMAT} index")
+    if index["scan_file_bytes"] != os.path.getsize(scan_csv):
+        raise SystemExit(f"{path}: stale index (scan size changed); rebuild with --build")
+    return index
+
+def lookup(scan_csv: str, index: dict, n_lo: int, n_hi: int):
+    """Raw CSV rows (str, no line ending) with n_lo <= n <= n_hi, in n order."""
+    points = index["points"]
+    if not points or n_hi < n_lo or n_hi < points[0][0]:
+        return []
+    i = max(0, bisect.bisect_right([p[0] for p in points], n_lo) - 1)
+    n_start, offset = points[i]
+    frames = index["frames"]
+    j = bisect.bisect_right([fr[1] for fr in frames], offset) - 1
+    comp, uncomp = frames[j]
+    skip = offset - uncomp
+
+    out = []
+    first = True
+    for line in _lines(_skip(_chunks(scan_csv, (comp, uncomp)), skip)):
+        if not line.strip():
+            continue
+        n = int(line[: line.index(b",")])
+        if first:
+            if n != n_start:
+                raise SystemExit(f"{scan_csv}: index expects n={n_start} at byte {offset}, found n={n}; rebuild with --build")
+            first = False
+        if n > n_hi:
+            break
+        if n >= n_lo:
+            out.append(line.decode("utf-8").rstrip("\r\n"))
+    return out
+
+def _skip(chunks, count: int):
+    for data in chunks:
+        if count >= len(data):
+            count -= len(data)
+            continue
+        yield data[count:]
+        count = 0
+
+def _select(header, names):
+    """Column positions for the requested header names ("in_NearInf" matches any eps)."""
+    pos = []
+    for name in names:
+        hits = [i for i, h in enumerate(header) if h == name or (name == "in_NearInf" and h.startswith("in_NearInf"))]
+        if not hits:
+            raise SystemExit(f"column {name!r} not in scan header")
+        pos.append(hits[0])
+    return pos
+
+def _parse_range(text: str):
+    lo, sep, hi = text.partition(":")
+    if not sep:
+        raise SystemExit("--n_range must look like LO:HI")
+    return int(lo), int(hi)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scan_csv", type=str, required=True)
+    ap.add_argument("--index", type=str, default="", help="default: <scan>.index.json next to the CSV")
+    ap.add_argument("--build", action="store_true", help="(re)build the index")
+    ap.add_argument("--stride", type=int, default=DEFAULT_STRIDE, help="rows between indexed offsets")
+    ap.add_argument("--n", type=int, default=None)
+    ap.add_argument("--n_range", type=str, default="", help="LO:HI (inclusive)")
+    ap.add_argument("--columns", type=str, default="", help="comma-separated header names (default: all)")
+    args = ap.parse_args()
+
+    path = args.index or index_path(args.scan_csv)
+    if args.build or not os.path.isfile(path):
+        index = build_index(args.scan_csv, max(1, int(args.stride)))
+        write_index(path, index)
+        print(f"index={path} rows={index['rows']} points={len(index['points'])} frames={len(index['frames'])}", file=sys.stderr)
+    else:
+        index = load_index(args.scan_csv, path)
+
+    if args.n is not None:
+        n_lo = n_hi = int(args.n)
+    elif args.n_range:
+        n_lo, n_hi = _parse_range(args.n_range)
+    else:
+        return
+
+    header = index["header"].split(",")
+    rows = lookup(args.scan_csv, index, n_lo, n_hi)
+    pos = _select(header, [c.strip() for c in args.columns.split(",") if c.strip()]) if args.columns else None
+    if pos is None:
+        print(index["header"])
+        for row in rows:
+            print(row)
+    else:
+        print(",".join(header[i] for i in pos))
+        for row in rows:
+            cells = row.split(",")
+            print(",".join(cells[i] for i in pos))
+    if not rows:
+        print(f"no rows for n={n_lo}..{n_hi} (scan covers n={index['n_first']}..{index['n_last']})", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()